@@ -5,8 +5,16 @@ from datetime import datetime
 from datetime import timedelta
 import threading
 from AlIonTestSoftwareDeviceDrivers import PowerSupplyController, ElectronicLoadController, MultimeterController
+from AlIonTestSoftwareDeviceDrivers import AsyncController
 from AlIonTestSoftwareDeviceDriversMock import PowerSupplyControllerMock, ElectronicLoadControllerMock, MultimeterControllerMock
-from AlIonTestSoftwareDataManagement import DataStorage
+from AlIonTestSoftwareDataManagement import DataStorage, PersistenceWorker, data_directory
+from AlIonTestSoftwareScheduler import SampleScheduler, TestAborted, wait_or_abort
+from AlIonTestSoftwareJournal import TestJournal
+from AlIonTestSoftwareIntegration import Integrator, efficiency_report, format_report
+from AlIonTestSoftwareCycles import CycleSummary
+from AlIonTestSoftwareRelaxation import RelaxationMonitor
+from AlIonTestSoftwarePulse import capture_burst, format_pulse, pulse_resistance
+from AlIonTestSoftwareECM import fit_pulses, format_ecm, pulse_data
 
 
 # Class used to control test procedures
@@ -14,15 +22,29 @@ class TestController:
     """Coordinate power supply, load and measurement devices for tests."""
     # Indicates the number of seconds between each measurement
     timeInterval = 0.2
+    # File formats written by DataStorage, see AlIonTestSoftwareDataManagement
+    dataFormats = ("csv", "run")
+    # Tests that journal their progress and can be continued with resume()
+    resumableTests = ("actual_capacity_test", "efficiency_test", "rate_characteristic_test")
     # Variable for keeping track of the open circuit voltage of a full battery
     # Variable for keeping track of the open circuit voltage of an empty battery
     # Variable for keeping track of the C-rate of the battery
 
     # Initiating function
-    def __init__(self, multimeter_mode: str | None = None, debug: bool = False) -> None:
+    def __init__(
+        self,
+        multimeter_mode: str | None = None,
+        debug: bool = False,
+        use_mock: bool = False,
+    ) -> None:
         self.multimeter_mode = multimeter_mode
         self.debug = debug
+        # Writes finished cycles to disk while the next one runs
+        self.persistence = PersistenceWorker()
         try:
+            if use_mock:
+                # Skip probing the hardware and go straight to the mocks
+                raise ConnectionError("mock drivers requested")
             # Trying to connect to the real device controllers
             self.powerSupplyController = PowerSupplyController()
             print("Testcontroller succesfully connected to Power Supply")
@@ -40,23 +62,133 @@ class TestController:
             # are not available.  The previous implementation exited before the
             # mock controllers were created which made running the software
             # without hardware impossible.
-            print("Connection not successful.")
-            answer = input(
-                "Devices not detected. Continue with mock drivers? [y/N]: "
-            ).strip().lower()
-            if answer not in ("y", "yes"):
-                raise SystemExit(
-                    "Aborting: no connection to hardware and user declined mock drivers"
-                )
+            # Hand back any pooled sessions that were opened before the failure
+            self.close()
+            if not use_mock:
+                print("Connection not successful.")
+                answer = input(
+                    "Devices not detected. Continue with mock drivers? [y/N]: "
+                ).strip().lower()
+                if answer not in ("y", "yes"):
+                    raise SystemExit(
+                        "Aborting: no connection to hardware and user declined mock drivers"
+                    )
             print("Using mock objects")
             self.powerSupplyController = PowerSupplyControllerMock()
             self.electronicLoadController = ElectronicLoadControllerMock()
             self.multimeterController = MultimeterControllerMock()
 
+        # Asyncio wrappers used to query all instruments of a tick concurrently
+        self.asyncPS = AsyncController(self.powerSupplyController)
+        self.asyncEL = AsyncController(self.electronicLoadController)
+        self.asyncMM = AsyncController(self.multimeterController)
+        # Event loop for read_instruments, created on first use
+        self._loop = None
+
         # Create an event to indicate if test is running
         self.event = threading.Event()
         # Event used to gracefully abort a running test
         self.stop_event = threading.Event()
+        # DataStorage of the running test, its statistics are shown by stats
+        self.dataStorage = None
+        # Time of the last abort() and the seconds until the test had
+        # switched the outputs off, see _aborted
+        self._abortTime = None
+        self.abortLatency = None
+
+    @staticmethod
+    def _mm_columns(multimeter_mode: str | None) -> tuple:
+        """Return the DataStorage columns recorded for a multimeter mode."""
+        return {"voltage": ("mm_volts",), "tcouple": ("mm_temp",)}.get(multimeter_mode, ())
+
+    def _storage(self, **settings) -> DataStorage:
+        """Return a DataStorage that records the test settings in its run header."""
+        dataStorage = DataStorage(formats=self.dataFormats)
+        dataStorage.updateMetadata(
+            **{
+                "time_interval": self.timeInterval,
+                "multimeter_mode": self.multimeter_mode,
+                **settings,
+            }
+        )
+        self.dataStorage = dataStorage
+        return dataStorage
+
+    @property
+    def stats(self) -> dict:
+        """Running statistics of every channel of the running test.
+
+        Maps the channel name (``"volts"``, ``"current"``, ...) to a
+        :class:`RunningStats`; the statistics of the current phase are in
+        ``self.dataStorage.phases[-1]``.
+        """
+        if self.dataStorage is None:
+            return {}
+        return self.dataStorage.stats
+
+    def _journal(self, test: str, resume, phases, **params) -> TestJournal:
+        """Start a journal for ``test`` or continue the one being resumed."""
+        journal = resume or TestJournal.start(
+            test,
+            params,
+            {"multimeter_mode": self.multimeter_mode, "time_interval": self.timeInterval},
+        )
+        journal.phases = phases
+        return journal
+
+    @staticmethod
+    def _openStream(dataStorage, journal, testName, c_rate, cycleNr, columns=()) -> None:
+        """Open the sample stream, continuing it when ``cycleNr`` is resumed."""
+        if "storage" in journal.state and journal.state.get("cycle", 0) == cycleNr:
+            dataStorage.resumeStream(journal.state["storage"])
+        else:
+            dataStorage.openStream(testName, c_rate, cycleNr, columns)
+
+    @staticmethod
+    def _report(dataStorage, charge: Integrator, discharge: Integrator) -> dict:
+        """Print the Ah, Wh and efficiencies and record them in the run header."""
+        report = efficiency_report(charge, discharge)
+        print(format_report(report))
+        dataStorage.updateMetadata(**report)
+        return report
+
+    def resume(self, path: str | None = None):
+        """Continue an interrupted test from its last journal checkpoint.
+
+        ``path`` defaults to the most recent journal in ``Data/journal``.
+        Completed phases are skipped, the running phase is restarted with
+        the elapsed time and accumulated Ah/Wh of the checkpoint and the
+        samples are appended to the partial result files. The multimeter is
+        set up for the mode recorded in the journal.
+        """
+        path = path or TestJournal.latest()
+        if path is None:
+            raise FileNotFoundError("No test journal found to resume")
+        journal = TestJournal.open(path)
+        if journal.test not in self.resumableTests:
+            raise ValueError(f"{journal.test} cannot be resumed")
+        mode = journal.settings.get("multimeter_mode", self.multimeter_mode)
+        if mode != self.multimeter_mode:
+            self._useMultimeter(mode)
+        print(f"Resuming {journal.test} in phase {journal.state.get('phase', 'start')}")
+        return getattr(self, journal.test)(**journal.params, resume=journal)
+
+    def _useMultimeter(self, multimeter_mode: str | None) -> None:
+        """Switch to the multimeter mode of a resumed test.
+
+        With real instruments the multimeter is connected and configured
+        the way ``__init__`` does it for that mode; mock drivers keep the
+        mock multimeter.
+        """
+        if multimeter_mode and not isinstance(self.powerSupplyController, PowerSupplyControllerMock):
+            if isinstance(self.multimeterController, MultimeterControllerMock):
+                self.asyncMM.shutdown()
+                self.multimeterController = MultimeterController()
+                self.asyncMM = AsyncController(self.multimeterController)
+                print("Testcontroller succesfully connected to Multimeter")
+            if multimeter_mode == "tcouple":
+                self.multimeterController.configure_thermocouple()
+        self.multimeter_mode = multimeter_mode
 
     def _debug(self, message: str, mm_value: float | None = None) -> None:
         """Print debug message when debug mode is enabled.
@@ -69,9 +201,66 @@ class TestController:
             else:
                 print(message)
 
+    def close(self) -> None:
+        """Return the instrument sessions to the shared pool.
+
+        Pending result files are written first. The sessions stay open so a
+        following test in the same process can reuse them; they are closed
+        when the program exits.
+        """
+        self.persistence.close()
+        for name in ("asyncPS", "asyncEL", "asyncMM"):
+            wrapper = self.__dict__.pop(name, None)
+            if wrapper is not None:
+                wrapper.shutdown()
+        loop = self.__dict__.pop("_loop", None)
+        if loop is not None:
+            loop.close()
+        for name in ("powerSupplyController", "electronicLoadController", "multimeterController"):
+            controller = getattr(self, name, None)
+            if controller is not None:
+                controller.close()
+                delattr(self, name)
+
+    def _start(self) -> None:
+        # Reset the events at the start of a test
+        self.event.clear()
+        self.stop_event.clear()
+
+    def _scheduler(self, interval: float) -> SampleScheduler:
+        """Return a sample clock that raises TestAborted when aborted."""
+        return SampleScheduler(interval, stop_event=self.stop_event)
+
+    def _wait(self, seconds: float) -> None:
+        """Sleep ``seconds``, raising TestAborted as soon as :meth:`abort` is called."""
+        wait_or_abort(self.stop_event, seconds)
+
+    def _aborted(self) -> None:
+        """Switch the outputs off after an abort and report how long it took."""
+        self.stopPSOutput()
+        self.stopDischarge()
+        if self._abortTime is not None:
+            self.abortLatency = time.monotonic() - self._abortTime
+            print(f"Test aborted, outputs off {self.abortLatency * 1000:.0f} ms after abort")
+        else:
+            print("Test aborted")
+
     def abort(self) -> None:
-        """Stop all outputs and signal running loops to exit."""
+        """Stop all outputs and signal running loops to exit.
+
+        Every wait and sample loop of the tests wakes up on the stop event
+        and raises TestAborted, so the test stops within one instrument
+        query. The test thread then switches the outputs off again and
+        stores the delay since this call in :attr:`abortLatency`.
+        """
+        self._abortTime = time.monotonic()
         self.stop_event.set()
+        # The instrument state is unknown now, make sure the stops are sent
+        for name in ("powerSupplyController", "electronicLoadController"):
+            try:
+                getattr(self, name).invalidate_shadow()
+            except Exception:
+                pass
         try:
             self.stopPSOutput()
         except Exception:
@@ -99,6 +288,9 @@ class TestController:
     #     self.powerSupplyController.st
     # Functions to START/STOP the powersupply from charging
     def startPSOutput(self):
+        # Never switch an output on again once the test was aborted
+        if self.stop_event.is_set():
+            raise TestAborted()
         self.powerSupplyController.startOutput()
 
     def stopPSOutput(self):
@@ -153,6 +345,8 @@ class TestController:
     # DISCHARGE functions ###### DC LOAD 63600-5
 
     def startDischarge(self):
+        if self.stop_event.is_set():
+            raise TestAborted()
         self.electronicLoadController.startDischarge()  # Activates the electronic load
 
     def stopDischarge(self):
@@ -209,12 +403,69 @@ class TestController:
         x = self.powerSupplyController.getCurrent()
         return float(x)
 
+    def fetchAllPSC(self) -> tuple[float, float, float]:
+        # Voltage, current and power from the power supply in one query
+        v, c, p = self.powerSupplyController.fetch_all()
+        return float(v), float(c), float(p)
+
+    def fetchAllELC(self) -> tuple[float, float, float]:
+        # Voltage, current and power from the electronic load in one query
+        v, c, p = self.electronicLoadController.fetch_all()
+        return float(v), float(c), float(p)
+
     def getVoltageMM(self):
         return float(self.multimeterController.getVolts())
 
     def getTemperatureMM(self):
         return float(self.multimeterController.getThermocoupleTemp())
 
+    async def _read_instruments_async(self, power_supply, load, multimeter_mode):
+        import asyncio
+
+        async def nothing():
+            return None
+
+        if multimeter_mode == "voltage":
+            mm_read = self.asyncMM.getVolts()
+        elif multimeter_mode == "tcouple":
+            mm_read = self.asyncMM.getThermocoupleTemp()
+        else:
+            mm_read = nothing()
+        return await asyncio.gather(
+            self.asyncPS.fetch_all() if power_supply else nothing(),
+            self.asyncEL.fetch_all() if load else nothing(),
+            mm_read,
+        )
+
+    def read_instruments(
+        self,
+        power_supply: bool = False,
+        load: bool = False,
+        multimeter_mode: str | None = None,
+    ):
+        """Query the requested instruments concurrently for one sample.
+
+        Returns ``(ps, load, mm)``. ``ps`` and ``load`` are ``(volts, amps,
+        watts)`` tuples and ``mm`` is the multimeter voltage or temperature
+        depending on ``multimeter_mode``. Entries that were not requested are
+        ``None``. The call takes as long as the slowest instrument instead of
+        the sum of all queries.
+        """
+        if self._loop is None:
+            import asyncio
+
+            self._loop = asyncio.new_event_loop()
+        ps, el, mm = self._loop.run_until_complete(
+            self._read_instruments_async(power_supply, load, multimeter_mode)
+        )
+        if ps is not None:
+            ps = tuple(float(x) for x in ps)
+        if el is not None:
+            el = tuple(float(x) for x in el)
+        if mm is not None:
+            mm = float(mm)
+        return ps, el, mm
+
     # def stopDischarge(self):
     #     self.electronicLoadController.stopDischarge()
 
@@ -263,15 +514,20 @@ class TestController:
         slew_volt = SLEW_VOLT if slew_volt is None else slew_volt
         slew_current = SLEW_CURRENT if slew_current is None else slew_current
 
-        self.stopPSOutput()
         self.stopDischarge()
-        self.setVoltageLimMax(charge_volt_end - 0.01)
-        self.setVoltageProt(charge_volt_prot)
-        self.setCurrentLimMax(charge_current_max - 0.01)
-        self.setCurrentProt(charge_current_prot)
-        self.setVoltageSlew(slew_volt)
-        self.setCurrentSlew(slew_current)
-        self.setPowerProt(charge_power_prot)
+        # Send all power supply limits as one write and wait until applied
+        (
+            self.powerSupplyController.batch()
+            .add("stopOutput")
+            .add("setVoltageLimMax", volts=charge_volt_end - 0.01)
+            .add("setVoltageProt", volts=charge_volt_prot)
+            .add("setCurrentLimMax", amps=charge_current_max - 0.01)
+            .add("setCurrentProt", amps=charge_current_prot)
+            .add("setVoltageSlew", volts=slew_volt)
+            .add("setCurrentSlew", amps=slew_current)
+            .add("setPowerProt", watts=charge_power_prot)
+            .send(sync=True)
+        )
 
     # Test protocal for testing the capacity of a battery
 
@@ -296,8 +552,16 @@ class TestController:
         num_cycles: int,
         multimeter_mode: str | None = None,
     ):
+        """Cycle the cell ``num_cycles`` times between timed charges and
+        discharges, saving the raw data of every cycle.
+
+        Ah, Wh, efficiencies, end voltages, mean thermocouple temperature
+        and durations of every cycle are appended to a new
+        ``<test_name>_..._<start>.cycles.csv`` table in ``Data`` (see
+        :class:`CycleSummary`) as the cycles finish.
+        """
         TotstartTime = datetime.now()
-        self.stop_event.clear()
+        self._start()
         # Configure safety limits before running
         if multimeter_mode:
             self.multimeterController.checkDeviceConnection()
@@ -329,43 +593,69 @@ class TestController:
         Lduration = timedelta(seconds=leadin_time)     # Leadin time in seconds
         # the amount to increase the start Volt to get to end Volt
         DeltaV = charge_volt_end-charge_volt_start
+        # Fixed rate sample clock shared by the charge and discharge loops
+        scheduler = self._scheduler(self.timeInterval)
+        summary = CycleSummary(
+            f"{data_directory()}/{test_name}_{dcharge_current_max}C_@{temperature}°C_"
+            f"{TotstartTime.strftime('%d.%m.%y_%H;%M')}.cycles.csv"
+        )
 
         # Charging/Discharging loop starts
         try:
             for cycleNumber in range(int(num_cycles)):
-                dataStorage = DataStorage()
-                Cend_time = datetime.now() + Cduration
+                dataStorage = self._storage(
+                    charge_volt_start=charge_volt_start,
+                    charge_volt_end=charge_volt_end,
+                    charge_current_max=charge_current_max,
+                    dcharge_volt_min=dcharge_volt_min,
+                    dcharge_current_max=dcharge_current_max,
+                    leadin_time=leadin_time,
+                    charge_time=charge_time,
+                    dcharge_time=dcharge_time,
+                    num_cycles=num_cycles,
+                    multimeter_mode=multimeter_mode,
+                    cycle_summary=summary.path,
+                )
+                dataStorage.openStream(
+                    test_name, dcharge_current_max, cycleNumber,
+                    self._mm_columns(multimeter_mode),
+                )
                 ChargestartTime = datetime.now()
+                cycle_start = time.monotonic()
+                charge = Integrator()
+                discharge = Integrator()
+                charge_end = discharge_end = None
+                charge_s = discharge_s = None
+                complete = False
                 try:
                     # Charging loop
                     self.startPSOutput()
                     self.chargeCC(charge_current_max)
                     self.setVoltage(charge_volt_start)
                     print('Charging')
-                    while datetime.now() < Cend_time and not self.stop_event.is_set():
-                        time.sleep(self.timeInterval)
-                        tmp = datetime.now() - ChargestartTime
+                    dataStorage.startPhase("charge")
+                    scheduler.start()
+                    while scheduler.elapsed < charge_time and not self.stop_event.is_set():
+                        scheduler.wait()
+                        elapsed = scheduler.elapsed
                         if leadin_time > 0:
-                            ratio = min(tmp.total_seconds() / float(leadin_time), 1.0)
+                            ratio = min(elapsed / float(leadin_time), 1.0)
                         else:
                             ratio = 1.0
                         currentVolt = charge_volt_start + DeltaV * ratio
                         if currentVolt > charge_volt_end:
                             currentVolt = charge_volt_end
                         self.setVoltage(currentVolt)
-                        v_ps = self.getVoltagePSC()
-                        v = self.getVoltageELC()
-                        c = self.getCurrentPSC()
-                        mm = None
-                        if multimeter_mode == "voltage":
-                            mm = self.getVoltageMM()
-                        elif multimeter_mode == "tcouple":
-                            mm = self.getTemperatureMM()
+                        ps, el, mm = self.read_instruments(True, True, multimeter_mode)
+                        v_ps, c, _ = ps
+                        v = el[0]
                         self._debug(
-                            f"{cycleNumber} of {num_cycles} -CHARGING- {tmp.total_seconds():03.2f} s of {Cduration.total_seconds():.1f} s - V_PS:{v_ps:.4f} V:{v:.4f} C:{c:.4f}",
+                            f"{cycleNumber} of {num_cycles} -CHARGING- {elapsed:03.2f} s of {Cduration.total_seconds():.1f} s - V_PS:{v_ps:.4f} V:{v:.4f} C:{c:.4f}",
                             mm,
                         )
-                        dataStorage.addTime(float(tmp.total_seconds()))
+                        charge.add(elapsed, c, v)
+                        charge_end = v
+                        dataStorage.addTime(elapsed)
                         dataStorage.addVoltage(v)
                         dataStorage.addCurrent(c)
                         if multimeter_mode == "voltage":
@@ -375,30 +665,28 @@ class TestController:
                             assert mm is not None
                             dataStorage.addMMTemperature(mm)
                     self.stopPSOutput()
+                    charge_s = scheduler.elapsed
 
-                    Dend_time = datetime.now() + Dduration
                     self.stopDischarge()
                     self.setCCMmode()
                     self.setCCcurrentL1(dcharge_current_max)
                     self.startDischarge()
 
-                    DischargestartTime = datetime.now()
                     print('Discharging')
-                    while datetime.now() < Dend_time and not self.stop_event.is_set():
-                        time.sleep(self.timeInterval)
-                        tmp = datetime.now()-DischargestartTime
-                        v = self.getVoltageELC()
-                        c = self.getCurrentELC()
-                        mm = None
-                        if multimeter_mode == "voltage":
-                            mm = self.getVoltageMM()
-                        elif multimeter_mode == "tcouple":
-                            mm = self.getTemperatureMM()
+                    dataStorage.startPhase("discharge")
+                    scheduler.start()
+                    while scheduler.elapsed < dcharge_time and not self.stop_event.is_set():
+                        scheduler.wait()
+                        elapsed = scheduler.elapsed
+                        _, el, mm = self.read_instruments(False, True, multimeter_mode)
+                        v, c, _ = el
                         self._debug(
-                            f"{cycleNumber} of {num_cycles} -DISCHARGING- {tmp.total_seconds():03.2f} s of {Dduration.total_seconds():.1f} s - V:{v:.4f} C:{c:.4f}",
+                            f"{cycleNumber} of {num_cycles} -DISCHARGING- {elapsed:03.2f} s of {Dduration.total_seconds():.1f} s - V:{v:.4f} C:{c:.4f}",
                             mm,
                         )
-                        dataStorage.addTime(float(tmp.total_seconds()))
+                        discharge.add(elapsed, c, v)
+                        discharge_end = v
+                        dataStorage.addTime(elapsed)
                         dataStorage.addVoltage(v)
                         dataStorage.addCurrent(c)
                         if multimeter_mode == "voltage":
@@ -411,12 +699,30 @@ class TestController:
                             print(f"below {dcharge_volt_min} volts")
                             break
                     self.stopDischarge()
+                    discharge_s = scheduler.elapsed
+                    complete = not self.stop_event.is_set()
                 except KeyboardInterrupt:
                     print("Keyboard interrupt - aborting test")
                     self.abort()
                     raise
                 finally:
-                    dataStorage.createTable(
+                    temp = dataStorage.stats["mm_temp"]
+                    summary.append(
+                        cycle=cycleNumber + 1,
+                        start=ChargestartTime.isoformat(timespec="seconds"),
+                        **self._report(dataStorage, charge, discharge),
+                        charge_end_voltage=charge_end,
+                        discharge_end_voltage=discharge_end,
+                        mean_temperature=temp.mean if temp.count else None,
+                        charge_s=charge_s,
+                        discharge_s=discharge_s,
+                        duration_s=time.monotonic() - cycle_start,
+                        complete=complete,
+                    )
+                    # Written in the background so the next cycle starts
+                    # right away
+                    self.persistence.submit(
+                        dataStorage.createTable,
                         test_name,
                         dcharge_current_max,
                         cycleNumber,
@@ -430,9 +736,13 @@ class TestController:
                     break
         except KeyboardInterrupt:
             pass
+        except TestAborted:
+            self._aborted()
         finally:
             self.stopPSOutput()
             self.stopDischarge()
+            self.persistence.join()
+            summary.close()
 
         # Set the event to indicate that testing is finished
         self.event.set()
@@ -444,95 +754,268 @@ class TestController:
         charge_voltage: float = 4.1,
         discharge_voltage: float = 2.75,
         temperature: float = 20.0,
+        resume: TestJournal | None = None,
     ) -> None:
         """Perform a round trip efficiency test using a CC–CV charge and CC
-        discharge as described in IEC standards."""
+        discharge as described in IEC standards.
 
-        dataStorage = DataStorage()
-        self.event.clear()
+        Pass the journal of an interrupted run as ``resume`` to continue it,
+        see :meth:`resume`.
+        """
+
+        journal = self._journal(
+            "efficiency_test", resume, ("charge_cc", "charge_cv", "rest", "discharge"),
+            charge_current=charge_current,
+            discharge_current=discharge_current,
+            charge_voltage=charge_voltage,
+            discharge_voltage=discharge_voltage,
+            temperature=temperature,
+        )
+        dataStorage = self._storage(
+            charge_current=charge_current,
+            discharge_current=discharge_current,
+            charge_voltage=charge_voltage,
+            discharge_voltage=discharge_voltage,
+        )
+        self._openStream(dataStorage, journal, "efficiency_test", discharge_current, 0)
+        self._start()
         self.apply_safety_limits(
             charge_volt_end=charge_voltage,
             charge_current_max=charge_current,
         )
 
-        energy_in = 0.0
-        energy_out = 0.0
-        elapsed = 0.0
+        charge = Integrator(**journal.value("charge", {}))
+        discharge = Integrator(**journal.value("discharge", {}))
+        elapsed = journal.value("elapsed", 0.0)
+        scheduler = self._scheduler(self.timeInterval)
 
-        # ----- CC step -----
-        print("Charging (CC stage)")
-        self.startPSOutput()
-        self.chargeCC(charge_current)
-        self.setVoltage(charge_voltage)
-        while True:
-            time.sleep(self.timeInterval)
-            elapsed += self.timeInterval
-            v = self.getVoltagePSC()
-            c = self.getCurrentPSC()
-            self._debug(
-                f"CC Charging: {elapsed:.2f} s - V:{v:.4f} C:{c:.4f}"
-            )
-            energy_in += v * c * self.timeInterval / 3600.0
-            dataStorage.addTime(elapsed)
-            dataStorage.addVoltage(v)
-            dataStorage.addCurrent(c)
-            if v >= charge_voltage:
-                break
+        completed = False
+        try:
+            # ----- CC step -----
+            if journal.pending("charge_cc"):
+                print("Charging (CC stage)")
+                dataStorage.startPhase("charge_cc")
+                journal.checkpoint("charge_cc", dataStorage, True, elapsed=elapsed)
+                self.startPSOutput()
+                self.chargeCC(charge_current)
+                self.setVoltage(charge_voltage)
+                scheduler.start()
+                while True:
+                    scheduler.wait()
+                    elapsed += scheduler.dt
+                    v, c, _ = self.fetchAllPSC()
+                    self._debug(
+                        f"CC Charging: {elapsed:.2f} s - V:{v:.4f} C:{c:.4f}"
+                    )
+                    charge.add(elapsed, c, v)
+                    dataStorage.addTime(elapsed)
+                    dataStorage.addVoltage(v)
+                    dataStorage.addCurrent(c)
+                    journal.checkpoint(
+                        "charge_cc", dataStorage, elapsed=elapsed, charge=charge.state()
+                    )
+                    if v >= charge_voltage:
+                        break
 
-        # ----- CV step -----
-        print("Charging (CV stage)")
-        self.chargeCV(charge_voltage)
-        while True:
-            time.sleep(self.timeInterval)
-            elapsed += self.timeInterval
-            v = self.getVoltagePSC()
-            c = self.getCurrentPSC()
-            self._debug(
-                f"CV Charging: {elapsed:.2f} s - V:{v:.4f} C:{c:.4f}"
+            # ----- CV step -----
+            if journal.pending("charge_cv"):
+                print("Charging (CV stage)")
+                dataStorage.startPhase("charge_cv")
+                journal.checkpoint(
+                    "charge_cv", dataStorage, True, elapsed=elapsed, charge=charge.state()
+                )
+                self.chargeCV(charge_voltage)
+                # Already on unless the test is resumed in this step
+                self.startPSOutput()
+                scheduler.start()
+                while True:
+                    scheduler.wait()
+                    elapsed += scheduler.dt
+                    v, c, _ = self.fetchAllPSC()
+                    self._debug(
+                        f"CV Charging: {elapsed:.2f} s - V:{v:.4f} C:{c:.4f}"
+                    )
+                    charge.add(elapsed, c, v)
+                    dataStorage.addTime(elapsed)
+                    dataStorage.addVoltage(v)
+                    dataStorage.addCurrent(c)
+                    journal.checkpoint(
+                        "charge_cv", dataStorage, elapsed=elapsed, charge=charge.state()
+                    )
+                    if c <= 0.05 * charge_current:
+                        break
+
+                self.stopPSOutput()
+
+            if journal.pending("rest"):
+                print("Resting for 10 minutes")
+                rest_until = journal.value("rest_until", None) or time.time() + 600
+                journal.checkpoint(
+                    "rest", dataStorage, True,
+                    elapsed=elapsed, charge=charge.state(), rest_until=rest_until,
+                )
+                self._wait(rest_until - time.time())
+
+            # ----- Discharge step -----
+            print("Discharging")
+            dataStorage.startPhase("discharge")
+            journal.checkpoint(
+                "discharge", dataStorage, True,
+                elapsed=elapsed, charge=charge.state(), discharge=discharge.state(),
             )
-            energy_in += v * c * self.timeInterval / 3600.0
-            dataStorage.addTime(elapsed)
-            dataStorage.addVoltage(v)
-            dataStorage.addCurrent(c)
-            if c <= 0.05 * charge_current:
-                break
+            self.stopDischarge()
+            self.setCCLmode()
+            self.setCCcurrentL1(discharge_current)
+            self.startDischarge()
+            scheduler.start()
+            while True:
+                scheduler.wait()
+                elapsed += scheduler.dt
+                v, c, _ = self.fetchAllELC()
+                self._debug(
+                    f"Discharging: {elapsed:.2f} s - V:{v:.4f} C:{c:.4f}"
+                )
+                discharge.add(elapsed, c, v)
+                dataStorage.addTime(elapsed)
+                dataStorage.addVoltage(v)
+                dataStorage.addCurrent(c)
+                journal.checkpoint(
+                    "discharge", dataStorage,
+                    elapsed=elapsed, charge=charge.state(), discharge=discharge.state(),
+                )
+                if v <= discharge_voltage:
+                    break
 
-        self.stopPSOutput()
+            self.stopDischarge()
+            completed = True
+        except TestAborted:
+            self._aborted()
 
-        print("Resting for 10 minutes")
-        time.sleep(600)
+        if completed:
+            self._report(dataStorage, charge, discharge)
+        dataStorage.createTable(
+            "efficiency_test", discharge_current, 0, temperature, self.timeInterval
+        )
+        # The samples of an aborted test are saved, so only a crash, which
+        # does not get here, leaves the journal for resume()
+        journal.finish()
+
+        self.event.set()
+
+    def _rateCharge(
+        self, dataStorage, journal, scheduler, cycle, elapsed, current, voltage, charge, **values
+    ) -> float:
+        """CC-CV charge of the rate test, returns the elapsed time.
 
-        # ----- Discharge step -----
-        print("Discharging")
+        ``values`` are added to every journal checkpoint.
+        """
+        if journal.pending("charge_cc", cycle):
+            dataStorage.startPhase("charge_cc")
+            journal.checkpoint(
+                "charge_cc", dataStorage, True, cycle,
+                elapsed=elapsed, charge=charge.state(), **values,
+            )
+            self.startPSOutput()
+            self.chargeCC(current)
+            self.setVoltage(voltage)
+            scheduler.start()
+            while True:
+                scheduler.wait()
+                elapsed += scheduler.dt
+                v, c, _ = self.fetchAllPSC()
+                self._debug(
+                    f"CC Charging: {elapsed:.2f} s - V:{v:.4f} C:{c:.4f}"
+                )
+                charge.add(elapsed, c, v)
+                dataStorage.addTime(elapsed)
+                dataStorage.addVoltage(v)
+                dataStorage.addCurrent(c)
+                dataStorage.addCapacity(0.0)
+                journal.checkpoint(
+                    "charge_cc", dataStorage, cycle=cycle,
+                    elapsed=elapsed, charge=charge.state(), **values,
+                )
+                if v >= voltage:
+                    break
+        if journal.pending("charge_cv", cycle):
+            dataStorage.startPhase("charge_cv")
+            journal.checkpoint(
+                "charge_cv", dataStorage, True, cycle,
+                elapsed=elapsed, charge=charge.state(), **values,
+            )
+            self.chargeCV(voltage)
+            # Already on unless the test is resumed in this step
+            self.startPSOutput()
+            scheduler.start()
+            while True:
+                scheduler.wait()
+                elapsed += scheduler.dt
+                v, c, _ = self.fetchAllPSC()
+                self._debug(
+                    f"CV Charging: {elapsed:.2f} s - V:{v:.4f} C:{c:.4f}"
+                )
+                charge.add(elapsed, c, v)
+                dataStorage.addTime(elapsed)
+                dataStorage.addVoltage(v)
+                dataStorage.addCurrent(c)
+                dataStorage.addCapacity(0.0)
+                journal.checkpoint(
+                    "charge_cv", dataStorage, cycle=cycle,
+                    elapsed=elapsed, charge=charge.state(), **values,
+                )
+                if c <= 0.05 * current:
+                    break
+            self.stopPSOutput()
+        return elapsed
+
+    def _rateRest(self, dataStorage, journal, cycle, seconds, **values) -> None:
+        """Rest of the rate test, continued at its end time after a resume."""
+        if journal.pending("rest", cycle):
+            rest_until = journal.value("rest_until", None, cycle) or time.time() + seconds
+            journal.checkpoint(
+                "rest", dataStorage, True, cycle, rest_until=rest_until, **values,
+            )
+            self._wait(rest_until - time.time())
+
+    def _rateDischarge(
+        self, dataStorage, journal, scheduler, cycle, elapsed, current, cutoff,
+        charge, discharge, phase="discharge", capacity_offset=0.0, **values
+    ) -> float:
+        """Discharge of the rate test down to ``cutoff``, returns the elapsed time.
+
+        The capacity column is ``capacity_offset`` plus the Ah of
+        ``discharge``.
+        """
+        dataStorage.startPhase(phase)
+        journal.checkpoint(
+            "discharge", dataStorage, True, cycle,
+            elapsed=elapsed, charge=charge.state(), discharge=discharge.state(), **values,
+        )
         self.stopDischarge()
         self.setCCLmode()
-        self.setCCcurrentL1(discharge_current)
+        self.setCCcurrentL1(current)
         self.startDischarge()
+        scheduler.start()
         while True:
-            time.sleep(self.timeInterval)
-            elapsed += self.timeInterval
-            v = self.getVoltageELC()
-            c = self.getCurrentELC()
+            scheduler.wait()
+            elapsed += scheduler.dt
+            v, c, _ = self.fetchAllELC()
+            discharge.add(elapsed, c, v)
             self._debug(
-                f"Discharging: {elapsed:.2f} s - V:{v:.4f} C:{c:.4f}"
+                f"Discharging: {elapsed:.2f} s - V:{v:.4f} C:{c:.4f} Ah:{discharge.ah:.3f}"
             )
-            energy_out += v * c * self.timeInterval / 3600.0
             dataStorage.addTime(elapsed)
             dataStorage.addVoltage(v)
             dataStorage.addCurrent(c)
-            if v <= discharge_voltage:
+            dataStorage.addCapacity(capacity_offset + discharge.ah)
+            journal.checkpoint(
+                "discharge", dataStorage, cycle=cycle,
+                elapsed=elapsed, charge=charge.state(), discharge=discharge.state(), **values,
+            )
+            if v <= cutoff:
                 break
-
         self.stopDischarge()
-        efficiency = 0.0
-        if energy_in > 0:
-            efficiency = (energy_out / energy_in) * 100.0
-        print(f"Efficiency: {efficiency:.2f}%")
-        dataStorage.createTable(
-            "efficiency_test", discharge_current, 0, temperature, self.timeInterval
-        )
-
-        self.event.set()
+        return elapsed
 
     def rate_characteristic_test(
         self,
@@ -541,80 +1024,191 @@ class TestController:
         charge_voltage: float = 4.1,
         discharge_voltage: float = 2.75,
         temperature: float = 20.0,
+        resume: TestJournal | None = None,
+        stepped: bool = False,
+        step_rest: float = 60.0,
     ) -> None:
-        """Measure capacity at multiple discharge rates."""
+        """Measure capacity at multiple discharge rates.
+
+        By default the cell is charged by CC-CV and rested for 600 s before
+        every rate. With ``stepped`` it is charged once and discharged to
+        ``discharge_voltage`` at the highest current, then after a rest of
+        ``step_rest`` seconds at the next lower current and so on, see
+        :meth:`_steppedRates`. Pass the journal of an interrupted run as
+        ``resume`` to continue it, see :meth:`resume`.
+        """
 
-        self.event.clear()
+        journal = self._journal(
+            "rate_characteristic_test", resume, ("charge_cc", "charge_cv", "rest", "discharge"),
+            discharge_currents=list(discharge_currents),
+            charge_current=charge_current,
+            charge_voltage=charge_voltage,
+            discharge_voltage=discharge_voltage,
+            temperature=temperature,
+            stepped=stepped,
+            step_rest=step_rest,
+        )
+        self._start()
         self.apply_safety_limits(
             charge_volt_end=charge_voltage,
             charge_current_max=charge_current,
         )
-        for i, d_current in enumerate(discharge_currents):
-            dataStorage = DataStorage()
-            elapsed = 0.0
+        if stepped:
+            self._steppedRates(
+                journal, discharge_currents, charge_current, charge_voltage,
+                discharge_voltage, temperature, step_rest,
+            )
+        else:
+            self._separateRates(
+                journal, discharge_currents, charge_current, charge_voltage,
+                discharge_voltage, temperature,
+            )
 
-            # -- charge cell using CC–CV --
-            self.startPSOutput()
-            self.chargeCC(charge_current)
-            self.setVoltage(charge_voltage)
-            while True:
-                time.sleep(self.timeInterval)
-                elapsed += self.timeInterval
-                v = self.getVoltagePSC()
-                c = self.getCurrentPSC()
-                self._debug(
-                    f"CC Charging: {elapsed:.2f} s - V:{v:.4f} C:{c:.4f}"
+        self.persistence.join()
+        # An aborted run has saved the rate it was measuring, so only a
+        # crash, which does not get here, leaves the journal for resume()
+        journal.finish()
+        self.event.set()
+
+    def _separateRates(
+        self, journal, discharge_currents, charge_current, charge_voltage,
+        discharge_voltage, temperature,
+    ) -> None:
+        """Charge, rest and discharge for every rate, one result per rate."""
+        scheduler = self._scheduler(self.timeInterval)
+        # Storage of the rate being measured, saved when the test is aborted
+        dataStorage = None
+        try:
+            for i, d_current in enumerate(discharge_currents):
+                # Rates finished before the test was interrupted
+                if not journal.pending("discharge", i):
+                    continue
+                dataStorage = self._storage(
+                    discharge_current=d_current,
+                    charge_current=charge_current,
+                    charge_voltage=charge_voltage,
+                    discharge_voltage=discharge_voltage,
                 )
-                dataStorage.addTime(elapsed)
-                dataStorage.addVoltage(v)
-                dataStorage.addCurrent(c)
-                if v >= charge_voltage:
-                    break
-            self.chargeCV(charge_voltage)
-            while True:
-                time.sleep(self.timeInterval)
-                elapsed += self.timeInterval
-                v = self.getVoltagePSC()
-                c = self.getCurrentPSC()
-                self._debug(
-                    f"CV Charging: {elapsed:.2f} s - V:{v:.4f} C:{c:.4f}"
+                self._openStream(
+                    dataStorage, journal, f"rate_characteristic_{i}", d_current, i,
+                    ("capacity",),
+                )
+                elapsed = journal.value("elapsed", 0.0, i)
+                charge = Integrator(**journal.value("charge", {}, i))
+                discharge = Integrator(**journal.value("discharge", {}, i))
+
+                # -- charge cell using CC–CV --
+                elapsed = self._rateCharge(
+                    dataStorage, journal, scheduler, i, elapsed,
+                    charge_current, charge_voltage, charge,
+                )
+                self._rateRest(
+                    dataStorage, journal, i, 600, elapsed=elapsed, charge=charge.state()
                 )
-                dataStorage.addTime(elapsed)
-                dataStorage.addVoltage(v)
-                dataStorage.addCurrent(c)
-                if c <= 0.05 * charge_current:
-                    break
-            self.stopPSOutput()
 
-            time.sleep(600)  # rest
+                # -- discharge step --
+                elapsed = self._rateDischarge(
+                    dataStorage, journal, scheduler, i, elapsed,
+                    d_current, discharge_voltage, charge, discharge,
+                )
+                print(f"Rate {i}: {d_current} A")
+                self._report(dataStorage, charge, discharge)
+                self.persistence.submit(
+                    dataStorage.createTable,
+                    f"rate_characteristic_{i}", d_current, i, temperature, self.timeInterval,
+                )
+                dataStorage = None
+        except TestAborted:
+            self._aborted()
+            if dataStorage is not None:
+                # Keep the samples of the interrupted rate
+                self.persistence.submit(
+                    dataStorage.createTable,
+                    f"rate_characteristic_{i}", d_current, i, temperature, self.timeInterval,
+                )
 
-            # -- discharge step --
-            self.stopDischarge()
-            self.setCCLmode()
-            self.setCCcurrentL1(d_current)
-            self.startDischarge()
-            capacity = 0.0
-            while True:
-                time.sleep(self.timeInterval)
-                elapsed += self.timeInterval
-                v = self.getVoltageELC()
-                c = self.getCurrentELC()
-                capacity += c * self.timeInterval / 3600.0
-                self._debug(
-                    f"Discharging: {elapsed:.2f} s - V:{v:.4f} C:{c:.4f} Ah:{capacity:.3f}"
+    def _steppedRates(
+        self, journal, discharge_currents, charge_current, charge_voltage,
+        discharge_voltage, temperature, step_rest,
+    ) -> None:
+        """One charge, then discharges from the highest to the lowest rate.
+
+        Every rate continues from where the previous one reached
+        ``discharge_voltage``, so the charge delivered up to and including a
+        rate approximates the capacity at that rate. All rates are stored in
+        one ``rate_characteristic_stepped`` result with one phase per rate
+        (``discharge_0``, ...), a capacity column counting all rates, and
+        the Ah, Wh, cumulative Ah and Wh and end voltage of every rate under
+        ``rate_steps`` in the run header.
+        """
+        currents = sorted(discharge_currents, reverse=True)
+        dataStorage = self._storage(
+            discharge_currents=currents,
+            charge_current=charge_current,
+            charge_voltage=charge_voltage,
+            discharge_voltage=discharge_voltage,
+            step_rest=step_rest,
+        )
+        # The state of the checkpoint carries over to the following rates
+        state = journal.state if journal.resumed else {}
+        if "storage" in state:
+            dataStorage.resumeStream(state["storage"])
+        else:
+            dataStorage.openStream("rate_characteristic_stepped", currents[0], 0, ("capacity",))
+        elapsed = state.get("elapsed", 0.0)
+        charge = Integrator(**state.get("charge", {}))
+        steps = list(state.get("steps", []))
+        scheduler = self._scheduler(self.timeInterval)
+        completed = False
+        try:
+            for i, d_current in enumerate(currents):
+                if not journal.pending("discharge", i):
+                    continue
+                delivered = Integrator(
+                    ah=sum(step["ah"] for step in steps), wh=sum(step["wh"] for step in steps)
                 )
-                dataStorage.addTime(elapsed)
-                dataStorage.addVoltage(v)
-                dataStorage.addCurrent(c)
-                dataStorage.addCapacity(capacity)
-                if v <= discharge_voltage:
-                    break
-            self.stopDischarge()
-            dataStorage.createTable(
-                f"rate_characteristic_{i}", d_current, i, temperature, self.timeInterval
-            )
+                discharge = Integrator(**journal.value("discharge", {}, i))
+                if i == 0:
+                    elapsed = self._rateCharge(
+                        dataStorage, journal, scheduler, i, elapsed,
+                        charge_current, charge_voltage, charge, steps=steps,
+                    )
+                self._rateRest(
+                    dataStorage, journal, i, 600 if i == 0 else step_rest,
+                    elapsed=elapsed, charge=charge.state(), steps=steps,
+                )
+                elapsed = self._rateDischarge(
+                    dataStorage, journal, scheduler, i, elapsed, d_current,
+                    discharge_voltage, charge, discharge, f"discharge_{i}",
+                    delivered.ah, steps=steps,
+                )
+                steps.append({
+                    "current": d_current,
+                    "ah": discharge.ah,
+                    "wh": discharge.wh,
+                    "cumulative_ah": delivered.ah + discharge.ah,
+                    "cumulative_wh": delivered.wh + discharge.wh,
+                    "end_voltage": dataStorage.stats["volts"].last,
+                })
+                print(
+                    f"Rate {i}: {d_current} A delivered {discharge.ah:.3f} Ah, "
+                    f"{delivered.ah + discharge.ah:.3f} Ah in total"
+                )
+            completed = True
+        except TestAborted:
+            self._aborted()
 
-        self.event.set()
+        total = Integrator(
+            ah=sum(step["ah"] for step in steps), wh=sum(step["wh"] for step in steps)
+        )
+        dataStorage.updateMetadata(rate_steps=steps)
+        if completed:
+            self._report(dataStorage, charge, total)
+        # Like the separate rates, an aborted run keeps its samples
+        self.persistence.submit(
+            dataStorage.createTable,
+            "rate_characteristic_stepped", currents[0], 0, temperature, self.timeInterval,
+        )
 
     def ocv_curve_test(
         self,
@@ -622,81 +1216,338 @@ class TestController:
         steps: int = 10,
         rest_time: float = 1800.0,
         temperature: float = 20.0,
+        ocv_tolerance: float = 0.001,
+        min_rest: float = 300.0,
+        rest_interval: float = 10.0,
     ) -> None:
         """Generate an OCV curve by stepping the SOC and measuring the open
-        circuit voltage after each rest period."""
+        circuit voltage after each rest period.
+
+        During each rest the voltage is sampled every ``rest_interval``
+        seconds and fitted with a relaxation model (see
+        :class:`RelaxationMonitor`). The rest ends after at least
+        ``min_rest`` seconds once the voltage is within ``ocv_tolerance``
+        volts of the fitted OCV, and after ``rest_time`` seconds at the
+        latest. ``ocv_tolerance=0`` always rests for ``rest_time``. The
+        fitted OCV and its standard error of every step are stored under
+        ``ocv_points`` in the run header.
+        """
 
-        dataStorage = DataStorage()
-        self.event.clear()
+        dataStorage = self._storage(
+            step_current=step_current,
+            steps=steps,
+            rest_time=rest_time,
+            ocv_tolerance=ocv_tolerance,
+            min_rest=min_rest,
+            rest_interval=rest_interval,
+        )
+        self._start()
         self.apply_safety_limits(charge_current_max=step_current)
 
         elapsed = 0.0
-        for i in range(steps + 1):
-            # charge for one step
-            self.startPSOutput()
-            self.chargeCC(step_current)
-            time.sleep(60)
-            self.stopPSOutput()
+        points = []
+        scheduler = self._scheduler(rest_interval)
+        try:
+            for i in range(steps + 1):
+                # charge for one step
+                self.startPSOutput()
+                self.chargeCC(step_current)
+                self._wait(60)
+                self.stopPSOutput()
 
-            print(f"Resting before OCV measurement {i}")
-            time.sleep(rest_time)
-            v = self.getVoltageELC()
-            elapsed += rest_time
-            dataStorage.addTime(elapsed)
-            dataStorage.addVoltage(v)
-            dataStorage.addCurrent(0.0)
-            print(f"Step {i}: OCV {v:.4f} V")
+                print(f"Resting before OCV measurement {i}")
+                monitor = RelaxationMonitor(ocv_tolerance)
+                scheduler.start()
+                while True:
+                    scheduler.wait()
+                    v = self.getVoltageELC()
+                    monitor.add(scheduler.elapsed, v)
+                    self._debug(f"Resting: {scheduler.elapsed:.0f} s - V:{v:.4f}")
+                    if scheduler.elapsed >= rest_time:
+                        break
+                    if scheduler.elapsed >= min_rest and monitor.converged:
+                        break
+                elapsed += scheduler.elapsed
+                dataStorage.addTime(elapsed)
+                dataStorage.addVoltage(v)
+                dataStorage.addCurrent(0.0)
+                fit = monitor.fit or {}
+                points.append({
+                    "step": i,
+                    "voltage": v,
+                    "rest_s": scheduler.elapsed,
+                    "converged": monitor.converged,
+                    **fit,
+                })
+                if fit:
+                    print(
+                        f"Step {i}: OCV {v:.4f} V, fitted {fit['ocv']:.4f} "
+                        f"± {fit['ocv_std']:.4f} V after {scheduler.elapsed:.0f} s"
+                    )
+                else:
+                    print(f"Step {i}: OCV {v:.4f} V")
+        except TestAborted:
+            self._aborted()
 
+        dataStorage.updateMetadata(ocv_points=points)
         dataStorage.createTable(
             "ocv_curve_test", step_current, 0, temperature, self.timeInterval
         )
         self.event.set()
 
+    def _pulse(
+        self,
+        dataStorage,
+        name: str,
+        read,
+        on,
+        off,
+        duration: float,
+        relax: float,
+        offset: float = 0.0,
+        baseline: float = 0.5,
+        interval: float = 0.001,
+        sign: float = 1.0,
+    ) -> tuple[dict, float, dict | None]:
+        """Burst capture one current pulse and store its trace.
+
+        ``read`` returns ``(volts, amps)`` and is polled back to back for
+        ``baseline`` seconds before ``on()``, ``duration`` seconds of pulse
+        and ``relax`` seconds after ``off()``. The samples are added to
+        ``dataStorage`` as phase ``name`` with ``offset`` added to their
+        times. Returns the resistances (see :func:`pulse_resistance`), the
+        time of the last sample and the trace prepared for ECM fitting (see
+        :func:`pulse_data`, ``sign`` is ``-1`` for charge pulses).
+        """
+        start_ns = time.monotonic_ns()
+        wall_ns = time.time_ns()
+
+        def capture(seconds):
+            return capture_burst(read, seconds, start_ns, self.stop_event, interval)
+
+        def switch(action):
+            # The step happens while the command is sent
+            before = time.monotonic_ns()
+            action()
+            return ((before + time.monotonic_ns()) / 2 - start_ns) / 1e9
+
+        trace = capture(baseline)
+        pulse_start = switch(on)
+        trace = [a + b for a, b in zip(trace, capture(duration))]
+        pulse_stop = switch(off)
+        t, v, c = [a + b for a, b in zip(trace, capture(relax))]
+
+        dataStorage.startPhase(name)
+        for x, volts, amps in zip(t, v, c):
+            dataStorage.addTime(offset + x, wall_ns + int(x * 1e9))
+            dataStorage.addVoltage(volts)
+            dataStorage.addCurrent(amps)
+        result = pulse_resistance(t, v, c, pulse_start, pulse_stop)
+        print(format_pulse(name, result))
+        return result, offset + t[-1], pulse_data(t, v, c, sign)
+
+    def _dischargePulse(self, dataStorage, name, current, duration, relax, offset=0.0, interval=0.001):
+        """Burst capture a pulse of the electronic load, see :meth:`_pulse`."""
+        self.setCCcurrentL1(current)
+        return self._pulse(
+            dataStorage, name, lambda: self.fetchAllELC()[:2],
+            self.startDischarge, self.stopDischarge, duration, relax, offset,
+            interval=interval,
+        )
+
+    def _chargePulse(
+        self, dataStorage, name, current, voltage, duration, relax, offset=0.0, interval=0.001
+    ):
+        """Burst capture a pulse of the power supply, see :meth:`_pulse`.
+
+        The current and voltage are set while the output is off, so the
+        pulse starts with the single output switch.
+        """
+        self.setCurrent(current)
+        self.setVoltage(voltage)
+
+        def read():
+            ps, el, _ = self.read_instruments(True, True)
+            return el[0], ps[1]
+
+        return self._pulse(
+            dataStorage, name, read, self.startPSOutput, self.stopPSOutput,
+            duration, relax, offset, interval=interval, sign=-1.0,
+        )
+
     def internal_resistance_test(
         self,
         pulse_current: float,
         pulse_duration: float = 1.0,
         temperature: float = 20.0,
-    ) -> None:
-        """Measure the DC and AC internal resistance using a current pulse and
-        the multimeter reading."""
+        relax_duration: float | None = None,
+        sample_interval: float = 0.001,
+        n_rc: int = 2,
+    ) -> dict | None:
+        """Measure the internal resistance with a burst captured current pulse.
+
+        The load voltage and current are polled as fast as the load answers
+        (at most every ``sample_interval`` seconds) for half a second before
+        the pulse, during the ``pulse_duration`` second pulse and for
+        ``relax_duration`` seconds after it (by default as long as the
+        pulse). The ohmic resistance ``r0`` of the first sample after the
+        step and ``R(t)`` during the pulse are printed, stored under
+        ``pulse`` in the run header and returned; the multimeter adds the
+        AC resistance and ``ecm`` holds the parameters of an ``n_rc``
+        element equivalent circuit fitted to the trace (see
+        :func:`fit_pulses`).
+        """
 
-        dataStorage = DataStorage()
-        self.event.clear()
+        relax_duration = pulse_duration if relax_duration is None else relax_duration
+        dataStorage = self._storage(
+            pulse_current=pulse_current,
+            pulse_duration=pulse_duration,
+            relax_duration=relax_duration,
+            sample_interval=sample_interval,
+        )
+        self._start()
 
-        # Open circuit voltage
         self.apply_safety_limits(charge_current_max=pulse_current)
-        ocv = self.getVoltageELC()
-        print(f"OCV: {ocv:.4f} V")
-
-        # Apply current pulse
         self.stopDischarge()
         self.setCCLmode()
-        self.setCCcurrentL1(pulse_current)
-        self.startDischarge()
-        time.sleep(pulse_duration)
-        v_loaded = self.getVoltageELC()
-        self.stopDischarge()
+        try:
+            result, _, trace = self._dischargePulse(
+                dataStorage, "pulse", pulse_current, pulse_duration, relax_duration,
+                interval=sample_interval,
+            )
+        except TestAborted:
+            self._aborted()
+            self.event.set()
+            return None
+
+        result["r_ac"] = float(self.multimeterController.getResistance())
+        print(f"OCV: {result['ocv']:.4f} V, AC resistance: {result['r_ac']}")
+        result["ecm"] = fit_pulses([trace], n_rc)[0]
+        print(format_ecm(result["ecm"]))
+        dataStorage.updateMetadata(pulse=result)
+        dataStorage.createTable(
+            "internal_resistance_test", pulse_current, 0, temperature, self.timeInterval
+        )
 
-        delta_v = ocv - v_loaded
-        r_dc = 0.0
-        if pulse_current != 0:
-            r_dc = delta_v / pulse_current
-        r_ac = float(self.multimeterController.getResistance())
-        print(f"DC resistance: {r_dc:.4f} ohm, AC resistance: {r_ac}")
+        self.event.set()
+        return result
 
-        dataStorage.addTime(0.0)
-        dataStorage.addVoltage(ocv)
-        dataStorage.addCurrent(0.0)
-        dataStorage.addTime(pulse_duration)
-        dataStorage.addVoltage(v_loaded)
-        dataStorage.addCurrent(pulse_current)
+    def hppc_test(
+        self,
+        pulse_current: float,
+        pulse_duration: float = 10.0,
+        relax_duration: float = 40.0,
+        charge_pulse_current: float = 0.0,
+        soc_points: int = 10,
+        step_current: float = 1.0,
+        step_time: float = 360.0,
+        rest_time: float = 3600.0,
+        charge_voltage: float = 4.1,
+        min_voltage: float = 2.75,
+        temperature: float = 20.0,
+        sample_interval: float = 0.001,
+        n_rc: int = 2,
+    ) -> list:
+        """Hybrid pulse power characterisation at several states of charge.
+
+        Starting from the present (usually full) charge, every SOC point
+        runs a discharge pulse of ``pulse_current`` for ``pulse_duration``
+        seconds followed by ``relax_duration`` seconds of relaxation and,
+        with ``charge_pulse_current`` set, the same for a charge pulse. The
+        cell is then discharged at ``step_current`` for ``step_time``
+        seconds and rests ``rest_time`` seconds before the next point. The
+        test ends after ``soc_points`` points or once the voltage reaches
+        ``min_voltage``.
+
+        The pulses are burst captured like in
+        :meth:`internal_resistance_test` and streamed with one phase per
+        pulse, e.g. ``soc2_discharge``, and the SOC steps as ``soc2_step``.
+        The resistances of every pulse, with the ``n_rc`` element
+        equivalent circuit fitted to all pulses in one batch under ``ecm``,
+        are returned and stored under ``hppc_points`` in the run header.
+        ``AlIonTestSoftwareECM`` builds SOC tables from the saved traces.
+        """
 
-        dataStorage.createTable(
-            "internal_resistance_test", pulse_current, 0, temperature, self.timeInterval
+        dataStorage = self._storage(
+            pulse_current=pulse_current,
+            pulse_duration=pulse_duration,
+            relax_duration=relax_duration,
+            charge_pulse_current=charge_pulse_current,
+            soc_points=soc_points,
+            step_current=step_current,
+            step_time=step_time,
+            rest_time=rest_time,
+            charge_voltage=charge_voltage,
+            min_voltage=min_voltage,
+            sample_interval=sample_interval,
         )
+        dataStorage.openStream("hppc_test", pulse_current, 0)
+        self._start()
+        self.apply_safety_limits(
+            charge_volt_end=charge_voltage,
+            charge_current_max=max(charge_pulse_current, 0.1),
+        )
+        self.stopDischarge()
+        self.stopPSOutput()
+        self.setCCHmode()
+
+        elapsed = 0.0
+        points = []
+        traces = []
+        scheduler = self._scheduler(self.timeInterval)
+        try:
+            for i in range(soc_points):
+                result, elapsed, trace = self._dischargePulse(
+                    dataStorage, f"soc{i}_discharge", pulse_current,
+                    pulse_duration, relax_duration, elapsed, sample_interval,
+                )
+                points.append({"soc_point": i, "pulse": "discharge", **result})
+                traces.append(trace)
+                if charge_pulse_current > 0:
+                    result, elapsed, trace = self._chargePulse(
+                        dataStorage, f"soc{i}_charge", charge_pulse_current,
+                        charge_voltage, pulse_duration, relax_duration, elapsed,
+                        sample_interval,
+                    )
+                    points.append({"soc_point": i, "pulse": "charge", **result})
+                    traces.append(trace)
+                if i == soc_points - 1:
+                    break
 
+                # Discharge to the next SOC point
+                print(f"Discharging {step_time} s at {step_current} A to SOC point {i + 1}")
+                dataStorage.startPhase(f"soc{i}_step")
+                self.setCCcurrentL1(step_current)
+                self.startDischarge()
+                reached = False
+                scheduler.start()
+                while not reached and scheduler.elapsed < step_time:
+                    scheduler.wait()
+                    elapsed += scheduler.dt
+                    v, c, _ = self.fetchAllELC()
+                    self._debug(f"SOC step: {elapsed:.2f} s - V:{v:.4f} C:{c:.4f}")
+                    dataStorage.addTime(elapsed)
+                    dataStorage.addVoltage(v)
+                    dataStorage.addCurrent(c)
+                    reached = v <= min_voltage
+                self.stopDischarge()
+                if reached:
+                    print(f"Minimum voltage {min_voltage} V reached")
+                    break
+                self._wait(rest_time)
+                elapsed += rest_time
+        except TestAborted:
+            self._aborted()
+        finally:
+            self.stopPSOutput()
+            self.stopDischarge()
+
+        for point, fit in zip(points, fit_pulses(traces, n_rc)):
+            point["ecm"] = fit
+        dataStorage.updateMetadata(hppc_points=points)
+        dataStorage.createTable("hppc_test", pulse_current, 0, temperature, self.timeInterval)
         self.event.set()
+        return points
 
     def actual_capacity_test(
         self,
@@ -707,6 +1558,7 @@ class TestController:
         min_voltage: float = 2.75,
         temperature: float = 20.0,
         finish_current: float = 1.5,
+        resume: TestJournal | None = None,
     ) -> float:
         """Perform an actual capacity test.
 
@@ -714,14 +1566,39 @@ class TestController:
         rests for ``rest_time`` seconds and then discharges at ``discharge_current_1c``
         down to ``min_voltage`` while logging the cumulative capacity. The
         charging phase ends once the supply current stays below ``finish_current``
-        for at least 10 seconds.
+        for at least 10 seconds. Pass the journal of an interrupted run as
+        ``resume`` to continue it, see :meth:`resume`.
         """
 
-        dataStorage = DataStorage()
-        self.event.clear()
+        journal = self._journal(
+            "actual_capacity_test", resume, ("charge", "rest", "discharge"),
+            charge_current_1c=charge_current_1c,
+            discharge_current_1c=discharge_current_1c,
+            rest_time=rest_time,
+            charge_voltage=charge_voltage,
+            min_voltage=min_voltage,
+            temperature=temperature,
+            finish_current=finish_current,
+        )
+        dataStorage = self._storage(
+            charge_current_1c=charge_current_1c,
+            discharge_current_1c=discharge_current_1c,
+            rest_time=rest_time,
+            charge_voltage=charge_voltage,
+            min_voltage=min_voltage,
+            finish_current=finish_current,
+        )
+        self._openStream(
+            dataStorage, journal, "actual_capacity_test", discharge_current_1c, 0,
+            ("capacity",) + self._mm_columns(self.multimeter_mode),
+        )
+        self._start()
 
-        elapsed = 0.0
-        capacity = 0.0
+        elapsed = journal.value("elapsed", 0.0)
+        charge = Integrator(**journal.value("charge", {}))
+        discharge = Integrator(**journal.value("discharge", {}))
+        completed = False
+        scheduler = self._scheduler(self.timeInterval)
         try:
             try:
                 # ----- Charge step -----
@@ -729,71 +1606,84 @@ class TestController:
                     charge_volt_end=charge_voltage,
                     charge_current_max=charge_current_1c,
                 )
-                self.startPSOutput()
-                self.chargeCC(charge_current_1c)
-                self.setVoltage(charge_voltage)
-
-                elapsed = 0.0
-                capacity = 0.0
-                print(f"Charging to {charge_voltage} V at {charge_current_1c} A")
-                low_current_time = 0.0
-                while True:
-                    time.sleep(self.timeInterval)
-                    elapsed += self.timeInterval
-                    v = self.getVoltageELC()
-                    c = self.getCurrentPSC()
-                    mm = None
-                    if self.multimeter_mode == "voltage":
-                        mm = self.getVoltageMM()
-                    elif self.multimeter_mode == "tcouple":
-                        mm = self.getTemperatureMM()
-                    self._debug(
-                        f"Charging: {elapsed:.2f} s - V:{v:.4f} C:{c:.4f} Ah:{capacity:.3f}",
-                        mm,
+                if journal.pending("charge"):
+                    dataStorage.startPhase("charge")
+                    journal.checkpoint(
+                        "charge", dataStorage, True, elapsed=elapsed, charge=charge.state()
                     )
-                    dataStorage.addTime(elapsed)
-                    dataStorage.addVoltage(v)
-                    dataStorage.addCurrent(c)
-                    if self.multimeter_mode == "voltage":
-                        assert mm is not None
-                        dataStorage.addMMVoltage(mm)
-                    elif self.multimeter_mode == "tcouple":
-                        assert mm is not None
-                        dataStorage.addMMTemperature(mm)
-                    dataStorage.addCapacity(capacity)
-                    if c <= finish_current:
-                        low_current_time += self.timeInterval
-                        if low_current_time >= 10.0:
-                            break
-                    else:
-                        low_current_time = 0.0
+                    self.startPSOutput()
+                    self.chargeCC(charge_current_1c)
+                    self.setVoltage(charge_voltage)
+
+                    print(f"Charging to {charge_voltage} V at {charge_current_1c} A")
+                    low_current_time = journal.value("low_current_time", 0.0)
+                    scheduler.start()
+                    while True:
+                        scheduler.wait()
+                        elapsed += scheduler.dt
+                        ps, el, mm = self.read_instruments(True, True, self.multimeter_mode)
+                        v = el[0]
+                        c = ps[1]
+                        charge.add(elapsed, c, v)
+                        self._debug(
+                            f"Charging: {elapsed:.2f} s - V:{v:.4f} C:{c:.4f} Ah:{charge.ah:.3f}",
+                            mm,
+                        )
+                        dataStorage.addTime(elapsed)
+                        dataStorage.addVoltage(v)
+                        dataStorage.addCurrent(c)
+                        if self.multimeter_mode == "voltage":
+                            assert mm is not None
+                            dataStorage.addMMVoltage(mm)
+                        elif self.multimeter_mode == "tcouple":
+                            assert mm is not None
+                            dataStorage.addMMTemperature(mm)
+                        dataStorage.addCapacity(discharge.ah)
+                        if c <= finish_current:
+                            low_current_time += scheduler.dt
+                            if low_current_time >= 10.0:
+                                break
+                        else:
+                            low_current_time = 0.0
+                        journal.checkpoint(
+                            "charge", dataStorage,
+                            elapsed=elapsed, low_current_time=low_current_time,
+                            charge=charge.state(),
+                        )
 
-                self.stopPSOutput()
+                    self.stopPSOutput()
 
                 # ----- Rest step -----
-                print(f"Resting for {rest_time} seconds")
-                time.sleep(rest_time)
+                if journal.pending("rest"):
+                    print(f"Resting for {rest_time} seconds")
+                    rest_until = journal.value("rest_until", None) or time.time() + rest_time
+                    journal.checkpoint(
+                        "rest", dataStorage, True,
+                        elapsed=elapsed, charge=charge.state(), rest_until=rest_until,
+                    )
+                    self._wait(rest_until - time.time())
 
                 # ----- Discharge step -----
+                dataStorage.startPhase("discharge")
+                journal.checkpoint(
+                    "discharge", dataStorage, True,
+                    elapsed=elapsed, charge=charge.state(), discharge=discharge.state(),
+                )
                 self.stopDischarge()
                 self.setCCHmode()
                 self.setCCcurrentL1(discharge_current_1c)
                 self.startDischarge()
 
                 print(f"Discharging to {min_voltage} V at {discharge_current_1c} A")
+                scheduler.start()
                 while True:
-                    time.sleep(self.timeInterval)
-                    elapsed += self.timeInterval
-                    v = self.getVoltageELC()
-                    c = self.getCurrentELC()
-                    capacity += c * self.timeInterval / 3600.0
-                    mm = None
-                    if self.multimeter_mode == "voltage":
-                        mm = self.getVoltageMM()
-                    elif self.multimeter_mode == "tcouple":
-                        mm = self.getTemperatureMM()
+                    scheduler.wait()
+                    elapsed += scheduler.dt
+                    _, el, mm = self.read_instruments(False, True, self.multimeter_mode)
+                    v, c, _ = el
+                    discharge.add(elapsed, c, v)
                     self._debug(
-                        f"Discharging: {elapsed:.2f} s - V:{v:.4f} C:{c:.4f} Ah:{capacity:.3f}",
+                        f"Discharging: {elapsed:.2f} s - V:{v:.4f} C:{c:.4f} Ah:{discharge.ah:.3f}",
                         mm,
                     )
                     dataStorage.addTime(elapsed)
@@ -805,33 +1695,49 @@ class TestController:
                     elif self.multimeter_mode == "tcouple":
                         assert mm is not None
                         dataStorage.addMMTemperature(mm)
-                    dataStorage.addCapacity(capacity)
+                    dataStorage.addCapacity(discharge.ah)
                     if v <= min_voltage:
                         break
+                    journal.checkpoint(
+                        "discharge", dataStorage,
+                        elapsed=elapsed, charge=charge.state(), discharge=discharge.state(),
+                    )
 
                 self.stopDischarge()
+                completed = True
             except KeyboardInterrupt:
                 print("Keyboard interrupt - aborting test")
                 self.abort()
                 raise
             finally:
-                dataStorage.createTable(
-                    "actual_capacity_test",
-                    discharge_current_1c,
-                    0,
-                    temperature,
-                    self.timeInterval,
-                )
+                # After a crash the partial files are kept for resume()
+                if completed or self.stop_event.is_set():
+                    self._report(dataStorage, charge, discharge)
+                    dataStorage.createTable(
+                        "actual_capacity_test",
+                        discharge_current_1c,
+                        0,
+                        temperature,
+                        self.timeInterval,
+                    )
                 self.stopPSOutput()
                 self.stopDischarge()
         except KeyboardInterrupt:
             pass
+        except TestAborted:
+            self._aborted()
         finally:
             self.stopPSOutput()
             self.stopDischarge()
+            # A crashed test keeps its journal for resume(), an aborted one
+            # has saved its samples above
+            if completed or self.stop_event.is_set():
+                journal.finish()
+            else:
+                journal.close()
 
-        print(f"Accumulated capacity: {capacity:.3f} Ah")
+        print(f"Accumulated capacity: {discharge.ah:.3f} Ah")
         self.event.set()
-        return capacity
+        return discharge.ah
 
 
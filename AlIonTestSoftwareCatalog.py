@@ -0,0 +1,329 @@
+"""SQLite catalog of the test results stored under ``Data``.
+
+Every result saved by :class:`DataStorage` is recorded with its test
+parameters, settings, summary metrics and file locations, so runs can be
+looked up without scanning and parsing file names. Existing archives are
+added with the ``index`` command::
+
+    python AlIonTestSoftwareCatalog.py index [DIRECTORY]
+    python AlIonTestSoftwareCatalog.py query --test ups --temperature 20
+"""
+
+from datetime import datetime
+import argparse
+import json
+import os
+import re
+import sqlite3
+
+from AlIonTestSoftwareDataManagement import NON_RESULT_SUFFIXES, data_directory, load_run
+from AlIonTestSoftwareICA import phase_slices
+from AlIonTestSoftwareIntegration import cumulative
+
+CATALOG_NAME = "catalog.sqlite"
+
+# Result names written by DataStorage._resultPath
+RESULT_NAME = re.compile(
+    r"^(?P<test>.+)_(?P<c_rate>[-\d.]+)C_#(?P<cycle>\d+)_@(?P<temp>[-\d.]+)°C_"
+    r"(?P<date>\d\d\.\d\d\.\d\d_\d\d;\d\d)$"
+)
+
+# Column name and SQL type of the runs table
+RUN_FIELDS = (
+    ("path", "TEXT NOT NULL UNIQUE"),
+    ("test_name", "TEXT"),
+    ("c_rate", "REAL"),
+    ("cycle", "INTEGER"),
+    ("temperature", "REAL"),
+    ("created", "TEXT"),
+    ("rows", "INTEGER"),
+    ("duration_s", "REAL"),
+    ("min_volts", "REAL"),
+    ("max_volts", "REAL"),
+    ("max_current", "REAL"),
+    ("capacity_ah", "REAL"),
+    ("energy_wh", "REAL"),
+    ("mean_temp", "REAL"),
+    ("csv_path", "TEXT"),
+    ("run_path", "TEXT"),
+    ("xlsx_path", "TEXT"),
+    ("settings", "TEXT"),
+)
+
+SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS runs (id INTEGER PRIMARY KEY, "
+    + ", ".join(f"{name} {kind}" for name, kind in RUN_FIELDS)
+    + ")",
+    "CREATE INDEX IF NOT EXISTS runs_test ON runs (test_name, c_rate)",
+    "CREATE INDEX IF NOT EXISTS runs_temperature ON runs (temperature)",
+    "CREATE INDEX IF NOT EXISTS runs_created ON runs (created)",
+)
+
+
+def summarize(columns, phases=None) -> dict:
+    """Return summary metrics for a mapping of run column name to samples.
+
+    ``phases`` is the per-phase summary of the run. Without a capacity
+    column the capacity is integrated over the discharge phases only, or
+    over the whole run when it has none.
+    """
+    import numpy as np
+
+    time_s = np.asarray(columns["time_s"], dtype=np.float64)
+    if len(time_s) == 0:
+        return {"rows": 0}
+    volts = np.asarray(columns["volts"], dtype=np.float64)
+    current = np.asarray(columns["current"], dtype=np.float64)
+    power = np.asarray(columns.get("power", volts * current), dtype=np.float64)
+    summary = {
+        "rows": len(time_s),
+        "duration_s": float(np.clip(np.diff(time_s), 0.0, None).sum()),
+        "min_volts": float(volts.min()),
+        "max_volts": float(volts.max()),
+        "max_current": float(np.abs(current).max()),
+        # Time restarts, as between the phases of the UPS test, are skipped
+        "energy_wh": float(cumulative(time_s, np.abs(power))[-1]),
+    }
+    if "capacity" in columns:
+        summary["capacity_ah"] = float(columns["capacity"][-1])
+    else:
+        slices = phase_slices(time_s, phases)
+        labels = np.zeros(len(time_s), dtype=np.int64)
+        discharge = np.zeros(len(time_s), dtype=bool)
+        for i, (name, part) in enumerate(slices):
+            labels[part] = i
+            discharge[part] = name.startswith("discharge")
+        amps = np.abs(current)
+        if discharge.any():
+            # The UPS and efficiency tests also record the charge
+            amps = np.where(discharge, amps, 0.0)
+        summary["capacity_ah"] = float(cumulative(time_s, amps, labels)[-1])
+    if "mm_temp" in columns:
+        summary["mean_temp"] = float(np.mean(columns["mm_temp"]))
+    return summary
+
+
+def _csv_columns(path: str) -> dict:
+    """Read a result CSV into run column names."""
+    import pandas as pd
+
+    titles = {
+        "Time [s]": "time_s",
+        "Volts": "volts",
+        "Current": "current",
+        "Power": "power",
+        "Capacity": "capacity",
+        "MM_Temp": "mm_temp",
+    }
+    df = pd.read_csv(path, usecols=lambda c: c in titles)
+    return {titles[c]: df[c].to_numpy() for c in df.columns}
+
+
+def describe_result(filePath: str, metadata: dict | None = None) -> dict:
+    """Collect the catalog fields of a result saved at ``filePath``.
+
+    ``filePath`` is the result name without extension. The test parameters
+    come from ``metadata`` or the ``.run`` header when available and from
+    the file name otherwise; the summary is computed from the ``.run``
+    columns, or from the CSV file when there is no run.
+    """
+    files = {ext: filePath + "." + ext for ext in ("csv", "run", "xlsx")}
+    files = {ext: path for ext, path in files.items() if os.path.exists(path)}
+    record = {"path": filePath}
+    match = RESULT_NAME.match(os.path.basename(filePath))
+    if match:
+        record.update(
+            test_name=match["test"],
+            c_rate=float(match["c_rate"]),
+            cycle=int(match["cycle"]),
+            temperature=float(match["temp"]),
+            created=datetime.strptime(match["date"], "%d.%m.%y_%H;%M").isoformat(),
+        )
+    else:
+        record["test_name"] = os.path.basename(filePath)
+    if "run" in files:
+        run = load_run(files["run"])
+        metadata = metadata or run.metadata
+        record.update(summarize(run.columns, (metadata or {}).get("phases")))
+    elif "csv" in files:
+        phases = (metadata or {}).get("phases")
+        if phases is None and os.path.exists(filePath + ".summary.json"):
+            with open(filePath + ".summary.json", encoding="utf-8") as f:
+                phases = json.load(f)
+        record.update(summarize(_csv_columns(files["csv"]), phases))
+    if metadata:
+        for key in ("test_name", "c_rate", "cycle", "created"):
+            if metadata.get(key) is not None:
+                record[key] = metadata[key]
+        temperature = metadata.get("file_temperature", metadata.get("temperature"))
+        if temperature is not None:
+            record["temperature"] = float(temperature)
+        record["settings"] = json.dumps(metadata.get("settings", {}), default=str)
+    for ext, path in files.items():
+        record[f"{ext}_path"] = path
+    return record
+
+
+class RunCatalog:
+    """Indexed table of saved runs in ``Data/catalog.sqlite``."""
+
+    def __init__(self, path: str | None = None) -> None:
+        self.path = path or os.path.join(data_directory(), CATALOG_NAME)
+        self.connection = sqlite3.connect(self.path, timeout=30.0)
+        self.connection.row_factory = sqlite3.Row
+        with self.connection:
+            for statement in SCHEMA:
+                self.connection.execute(statement)
+
+    def close(self) -> None:
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def record(self, **fields) -> None:
+        """Insert or update the run stored at ``fields["path"]``."""
+        names = [name for name, _ in RUN_FIELDS if name in fields]
+        updates = ", ".join(f"{n} = excluded.{n}" for n in names if n != "path")
+        with self.connection:
+            self.connection.execute(
+                f"INSERT INTO runs ({', '.join(names)}) "
+                f"VALUES ({', '.join('?' for _ in names)}) "
+                f"ON CONFLICT(path) DO UPDATE SET {updates}",
+                [fields[n] for n in names],
+            )
+
+    def record_result(self, filePath: str, metadata: dict | None = None) -> None:
+        """Record a result saved by :class:`DataStorage`."""
+        self.record(**describe_result(filePath, metadata))
+
+    def query(
+        self,
+        test_name: str | None = None,
+        c_rate: float | None = None,
+        temperature: float | None = None,
+        min_temperature: float | None = None,
+        max_temperature: float | None = None,
+        since: str | None = None,
+        until: str | None = None,
+        limit: int | None = None,
+    ) -> list:
+        """Return matching runs as dictionaries, newest first.
+
+        ``since`` and ``until`` are ISO dates compared with the creation
+        time of the run.
+        """
+        conditions = []
+        values = []
+        for clause, value in (
+            ("test_name = ?", test_name),
+            ("c_rate = ?", c_rate),
+            ("temperature = ?", temperature),
+            ("temperature >= ?", min_temperature),
+            ("temperature <= ?", max_temperature),
+            ("created >= ?", since),
+            ("created <= ?", until),
+        ):
+            if value is not None:
+                conditions.append(clause)
+                values.append(value)
+        sql = "SELECT * FROM runs"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY created DESC"
+        if limit:
+            sql += " LIMIT ?"
+            values.append(int(limit))
+        return [dict(row) for row in self.connection.execute(sql, values)]
+
+    def prune(self) -> int:
+        """Remove runs whose files no longer exist and return their number."""
+        missing = [
+            row["id"]
+            for row in self.connection.execute("SELECT id, csv_path, run_path FROM runs")
+            if not any(p and os.path.exists(p) for p in (row["csv_path"], row["run_path"]))
+        ]
+        with self.connection:
+            self.connection.executemany("DELETE FROM runs WHERE id = ?", [(i,) for i in missing])
+        return len(missing)
+
+    def index_directory(self, directory: str | None = None, verbose: bool = False) -> int:
+        """Record every result below ``directory``, by default ``Data``.
+
+        Partial stream files, ICA exports and cycle tables are skipped.
+        Returns the number of runs indexed.
+        """
+        directory = directory or data_directory()
+        results = set()
+        for root, dirs, files in os.walk(directory):
+            for name in dirs + files:
+                base, ext = os.path.splitext(name)
+                if ext in (".csv", ".run", ".xlsx") and not base.endswith(NON_RESULT_SUFFIXES):
+                    results.add(os.path.join(root, base).replace("\\", "/"))
+            # Do not descend into the column files of a run
+            dirs[:] = [d for d in dirs if not d.endswith(".run")]
+        count = 0
+        for filePath in sorted(results):
+            try:
+                self.record_result(filePath)
+                count += 1
+            except Exception as exc:
+                print(f"Skipping {filePath}: {exc}")
+            else:
+                if verbose:
+                    print(f"Indexed {filePath}")
+        return count
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Query the catalog of saved test runs")
+    parser.add_argument("--catalog", help="catalog file (default: Data/catalog.sqlite)")
+    commands = parser.add_subparsers(dest="command", required=True)
+    index = commands.add_parser("index", help="add existing results to the catalog")
+    index.add_argument("directory", nargs="?", help="folder to scan (default: Data)")
+    index.add_argument("--prune", action="store_true", help="drop runs whose files are gone")
+    index.add_argument("-v", "--verbose", action="store_true")
+    query = commands.add_parser("query", help="list matching runs")
+    query.add_argument("--test", dest="test_name")
+    query.add_argument("--c-rate", type=float)
+    query.add_argument("--temperature", type=float)
+    query.add_argument("--min-temperature", type=float)
+    query.add_argument("--max-temperature", type=float)
+    query.add_argument("--since", help="ISO date, e.g. 2024-01-31")
+    query.add_argument("--until", help="ISO date")
+    query.add_argument("--limit", type=int)
+    query.add_argument("--json", action="store_true", help="print full records as JSON")
+    args = parser.parse_args(argv)
+
+    with RunCatalog(args.catalog) as catalog:
+        if args.command == "index":
+            if args.prune:
+                print(f"Removed {catalog.prune()} missing runs")
+            count = catalog.index_directory(args.directory, args.verbose)
+            print(f"Indexed {count} runs into {catalog.path}")
+            return
+        runs = catalog.query(
+            args.test_name, args.c_rate, args.temperature,
+            args.min_temperature, args.max_temperature,
+            args.since, args.until, args.limit,
+        )
+    if args.json:
+        print(json.dumps(runs, indent=2))
+        return
+    for run in runs:
+        capacity = run["capacity_ah"]
+        print(
+            f"{run['created'] or '':19}  {run['test_name']:<24} "
+            f"{run['c_rate'] if run['c_rate'] is not None else '':>6}C "
+            f"#{run['cycle'] or '':<3} {run['temperature'] if run['temperature'] is not None else '':>6}°C "
+            f"{'' if capacity is None else f'{capacity:.3f} Ah':>10}  "
+            f"{run['csv_path'] or run['run_path']}"
+        )
+    print(f"{len(runs)} runs")
+
+
+if __name__ == "__main__":
+    main()
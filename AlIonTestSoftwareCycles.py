@@ -0,0 +1,83 @@
+"""Per-cycle summary table of cycle-life campaigns.
+
+``NEWupsTest`` appends one row per cycle to ``<campaign>.cycles.csv`` in the
+``Data`` folder while it runs, next to the raw result of every cycle. The
+name includes the start time, so every run of a campaign gets its own
+table. Trends over thousands of cycles are read from this one small table::
+
+    from AlIonTestSoftwareCycles import load_cycles
+
+    cycles = load_cycles("Data/ups_1.0C_@20.0°C_01.01.25_12;00.cycles.csv")
+    cycles["capacity_fade"] = cycles["discharge_ah"] / cycles["discharge_ah"].iloc[0]
+"""
+
+import csv
+import os
+
+# Columns of the summary table; the Ah, Wh and efficiency columns are the
+# keys of efficiency_report
+CYCLE_COLUMNS = (
+    "cycle",
+    "start",
+    "charge_ah",
+    "charge_wh",
+    "discharge_ah",
+    "discharge_wh",
+    "coulombic_efficiency",
+    "energy_efficiency",
+    "charge_end_voltage",
+    "discharge_end_voltage",
+    "mean_temperature",
+    "charge_s",
+    "discharge_s",
+    "duration_s",
+    "complete",
+)
+
+
+class CycleSummary:
+    """Append-only CSV table with one row per cycle.
+
+    A new table is written; like the raw results, an existing file of the
+    same name is replaced. Every row is flushed and synced to the disk
+    when it is appended.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._file = open(path, "w", newline="", encoding="utf-8")
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(CYCLE_COLUMNS)
+        self._file.flush()
+
+    def append(self, **values) -> None:
+        """Write a row; missing columns stay empty, unknown keys are ignored."""
+        self._writer.writerow(_cell(values.get(column)) for column in CYCLE_COLUMNS)
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self) -> None:
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def _cell(value) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return str(int(value))
+    if isinstance(value, float):
+        return f"{value:.6g}"
+    return str(value)
+
+
+def load_cycles(path: str):
+    """Read a summary table as a ``pandas.DataFrame`` indexed by cycle."""
+    import pandas as pd
+
+    return pd.read_csv(path, index_col="cycle")
@@ -1,13 +1,378 @@
 """Utilities for storing measurement data and exporting results."""
 
-import openpyxl
-from openpyxl.chart import ScatterChart, Reference, Series  # type: ignore
-# from openpyxl.chart.series import Series
+# numpy, pandas and openpyxl are imported inside the export functions so
+# that starting a test does not pay for them until results are written.
+from array import array
 from datetime import datetime
+import atexit
+import csv
+import json
 import os
-import pandas as pd
 import math
-import statistics
+import queue
+import shutil
+import threading
+import time
+import traceback
+
+from AlIonTestSoftwareStatistics import RunningStats
+
+# Optional columns in the order they appear in the output files
+OPTIONAL_COLUMNS = (
+    ("capacity", "Capacity"),
+    ("mm_volts", "MM_Volts"),
+    ("mm_temp", "MM_Temp"),
+)
+
+# Channels with running statistics, see DataStorage.stats
+STAT_CHANNELS = ("time", "volts", "current", "capacity", "mm_volts", "mm_temp")
+
+
+def format_timestamps(epoch_ns) -> list:
+    """Format epoch nanosecond timestamps as local ``HH:MM:SS.mmm`` strings."""
+    import numpy as np
+
+    ns = np.asarray(epoch_ns, dtype=np.int64)
+    if len(ns) == 0:
+        return []
+    # One UTC offset for the whole block, taken from its first sample
+    offset = datetime.fromtimestamp(ns[0] / 1e9).astimezone().utcoffset()
+    local = ns + int(offset.total_seconds()) * 1_000_000_000
+    local = local.astype("datetime64[ns]").astype("datetime64[ms]")
+    return [s[11:] for s in np.datetime_as_string(local, unit="ms")]
+
+
+def data_directory() -> str:
+    """Return the ``Data`` folder below the working directory, creating it."""
+    abs_path = os.path.abspath("").replace("\\", "/")
+    data_dir = f"{abs_path}/Data"
+    os.makedirs(data_dir, exist_ok=True)
+    return data_dir
+
+
+# Endings of the names of files in the Data folder that are not results:
+# streams still being written, ICA exports and per-cycle summary tables
+NON_RESULT_SUFFIXES = (".partial", ".ica", ".cycles")
+
+RUN_FORMAT = "cnr-run"
+RUN_VERSION = 1
+
+# Column name, DataStorage buffer and dtype of the binary run format. Power
+# has no buffer of its own and is computed from voltage and current.
+RUN_COLUMNS = (
+    ("timestamp_ns", "timestamp", "<i8"),
+    ("time_s", "time", "<f8"),
+    ("volts", "volts", "<f8"),
+    ("current", "current", "<f8"),
+    ("power", None, "<f8"),
+    ("capacity", "capacity", "<f8"),
+    ("mm_volts", "mm_volts", "<f8"),
+    ("mm_temp", "mm_temp", "<f8"),
+)
+
+
+class RunWriter:
+    """Write samples to a binary columnar run.
+
+    A run is a directory ending in ``.run`` holding one raw little endian
+    file per column (``<name>.bin``) and a ``header.json`` with the column
+    dtypes, the row count and the test metadata. Columns are appended in
+    blocks, so a run can be written while the test is streaming. The header
+    is written when the run is opened and rewritten by :meth:`close`; an
+    unfinished run can still be loaded, the row count is then taken from
+    the column file sizes.
+    """
+
+    def __init__(
+        self, path: str, columns, metadata: dict | None = None, rows: int = 0
+    ) -> None:
+        import numpy as np
+
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.columns = {name: dtype for name, _, dtype in RUN_COLUMNS if name in columns}
+        self.metadata = dict(metadata or {})
+        # Continue after ``rows`` existing samples, dropping any beyond them
+        self.rows = rows
+        for name, dtype in self.columns.items():
+            file = os.path.join(path, name + ".bin")
+            if os.path.exists(file):
+                os.truncate(file, rows * np.dtype(dtype).itemsize)
+        self._files = {
+            name: open(os.path.join(path, name + ".bin"), "ab") for name in self.columns
+        }
+        self._writeHeader(complete=False)
+
+    @classmethod
+    def reopen(cls, path: str, rows: int) -> "RunWriter":
+        """Continue an unfinished run after its first ``rows`` samples."""
+        with open(os.path.join(path, "header.json"), encoding="utf-8") as f:
+            header = json.load(f)
+        columns = [c["name"] for c in header["columns"]]
+        return cls(path, columns, header.get("metadata"), rows)
+
+    def append(self, data: dict) -> None:
+        """Append equally long arrays for every column of the run."""
+        import numpy as np
+
+        rows = 0
+        for name, dtype in self.columns.items():
+            values = np.ascontiguousarray(data[name], dtype=dtype)
+            self._files[name].write(values.tobytes())
+            rows = len(values)
+        self.rows += rows
+
+    def flush(self, sync: bool = False) -> None:
+        for f in self._files.values():
+            f.flush()
+            if sync:
+                os.fsync(f.fileno())
+
+    def close(self, metadata: dict | None = None) -> None:
+        """Flush the columns and write the final header."""
+        if metadata:
+            self.metadata.update(metadata)
+        self.flush(sync=True)
+        for f in self._files.values():
+            f.close()
+        self._writeHeader(complete=True)
+
+    def _writeHeader(self, complete: bool) -> None:
+        header = {
+            "format": RUN_FORMAT,
+            "version": RUN_VERSION,
+            "complete": complete,
+            "rows": self.rows if complete else None,
+            "columns": [{"name": n, "dtype": d} for n, d in self.columns.items()],
+            "metadata": self.metadata,
+        }
+        tmp = os.path.join(self.path, "header.json.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(header, f, indent=2, default=str)
+        os.replace(tmp, os.path.join(self.path, "header.json"))
+
+
+class RunData:
+    """Columns of a binary run, memory-mapped read-only.
+
+    Columns are available as ``run["volts"]``; the test parameters from the
+    header are in :attr:`metadata`. Only the requested ``columns`` are
+    mapped when given.
+    """
+
+    def __init__(self, path: str, columns=None) -> None:
+        import numpy as np
+
+        with open(os.path.join(path, "header.json"), encoding="utf-8") as f:
+            self.header = json.load(f)
+        if self.header.get("format") != RUN_FORMAT:
+            raise ValueError(f"{path} is not a {RUN_FORMAT} directory")
+        self.path = path
+        self.metadata = self.header.get("metadata", {})
+        specs = [
+            c for c in self.header["columns"] if columns is None or c["name"] in columns
+        ]
+        rows = self.header.get("rows")
+        if rows is None:
+            # Unfinished run, use the rows present in every column file
+            sizes = [
+                os.path.getsize(os.path.join(path, c["name"] + ".bin"))
+                // np.dtype(c["dtype"]).itemsize
+                for c in self.header["columns"]
+            ]
+            rows = min(sizes, default=0)
+        self.rows = rows
+        self.columns = {}
+        for spec in specs:
+            file = os.path.join(path, spec["name"] + ".bin")
+            if rows == 0:
+                self.columns[spec["name"]] = np.empty(0, dtype=spec["dtype"])
+            else:
+                self.columns[spec["name"]] = np.memmap(
+                    file, dtype=spec["dtype"], mode="r", shape=(rows,)
+                )
+
+    def __getitem__(self, name: str):
+        return self.columns[name]
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.columns
+
+    def __len__(self) -> int:
+        return self.rows
+
+    def keys(self):
+        return self.columns.keys()
+
+
+def load_run(path: str, columns=None) -> RunData:
+    """Open a ``.run`` directory written by :class:`DataStorage`."""
+    return RunData(path, columns)
+
+
+def run_table_blocks(run: RunData, block_rows: int = 65536):
+    """Yield the CSV table of a run in blocks of ``block_rows`` rows.
+
+    Each block maps the column titles to rounded values, matching the rows
+    :class:`DataStorage` writes to CSV.
+    """
+    import numpy as np
+
+    for start in range(0, len(run), block_rows):
+        stop = min(start + block_rows, len(run))
+        volts = np.round(run["volts"][start:stop], 4)
+        current = np.round(run["current"][start:stop], 4)
+        block = {
+            "Timestamp": format_timestamps(run["timestamp_ns"][start:stop]),
+            "Time [s]": np.round(run["time_s"][start:stop], 4),
+            "Volts": volts,
+            "Current": current,
+            "Power": volts * current,
+        }
+        for name, title in OPTIONAL_COLUMNS:
+            if name in run:
+                block[title] = np.round(run[name][start:stop], 4)
+        yield block
+
+
+def csv_table_blocks(path: str, block_rows: int = 65536):
+    """Yield a result CSV file in blocks of ``block_rows`` rows."""
+
+    def value(text):
+        try:
+            return float(text)
+        except ValueError:
+            return text
+
+    with open(path, newline="", encoding="utf-8") as f:
+        reader = csv.reader(f)
+        head = next(reader)
+        while True:
+            rows = [[value(v) for v in row] for _, row in zip(range(block_rows), reader)]
+            if not rows:
+                return
+            yield dict(zip(head, map(list, zip(*rows))))
+
+
+def lttb_indices(x, y, points: int):
+    """Pick ``points`` samples with largest-triangle-three-buckets.
+
+    The first and last sample are kept; every bucket in between contributes
+    the sample forming the largest triangle with the previously picked one
+    and the average of the next bucket, which preserves peaks and the shape
+    of the curve. Returns the sorted indices.
+    """
+    import numpy as np
+
+    n = len(y)
+    if points >= n or points < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    edges = np.linspace(1, n - 1, points - 1).astype(np.int64)
+    keep = np.empty(points, dtype=np.int64)
+    keep[0] = 0
+    keep[-1] = n - 1
+    a = 0
+    for i in range(points - 2):
+        lo, hi = edges[i], edges[i + 1]
+        next_hi = edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = x[hi:next_hi].mean()
+        avg_y = y[hi:next_hi].mean()
+        area = np.abs(
+            (x[a] - avg_x) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (avg_y - y[a])
+        )
+        a = lo + int(np.argmax(area))
+        keep[i + 1] = a
+    return keep
+
+
+def minmax_indices(x, y, points: int):
+    """Pick the minimum and maximum sample of ``points // 2`` buckets.
+
+    Cheaper than :func:`lttb_indices` and keeps every extreme value, at the
+    cost of a less even spacing. Returns the sorted indices.
+    """
+    import numpy as np
+
+    n = len(y)
+    if points >= n or points < 2:
+        return np.arange(n)
+    y = np.asarray(y, dtype=np.float64)
+    edges = np.linspace(0, n, points // 2 + 1).astype(np.int64)
+    keep = [0, n - 1]
+    for lo, hi in zip(edges[:-1], edges[1:]):
+        if hi > lo:
+            keep += [lo + int(np.argmin(y[lo:hi])), lo + int(np.argmax(y[lo:hi]))]
+    return np.unique(keep)
+
+
+# Decimation methods for graph series, see decimate
+DECIMATION_METHODS = {"lttb": lttb_indices, "minmax": minmax_indices}
+
+
+def decimate(x, y, points: int, method: str = "lttb"):
+    """Return the indices of at most about ``points`` samples to plot."""
+    if method not in DECIMATION_METHODS:
+        raise ValueError(f"Unknown decimation method: {method}")
+    return DECIMATION_METHODS[method](x, y, points)
+
+
+class PersistenceWorker:
+    """Run result writes such as :meth:`DataStorage.createTable` in the background.
+
+    Jobs are handed to a single writer thread through a bounded queue, so a
+    test can start its next phase while the previous one is written. When
+    ``max_pending`` jobs are waiting :meth:`submit` blocks until one is done,
+    which keeps finished buffers from piling up in memory. :meth:`join`
+    waits for the submitted jobs and :meth:`close` also stops the thread; it
+    is called at exit so no write is lost.
+    """
+
+    def __init__(self, max_pending: int = 2) -> None:
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, fn, *args, **kwargs) -> None:
+        """Queue ``fn(*args, **kwargs)`` for the writer thread."""
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="persistence", daemon=True
+                )
+                self._thread.start()
+                atexit.register(self.close)
+        self._queue.put((fn, args, kwargs))
+
+    def join(self) -> None:
+        """Wait until every submitted job has finished."""
+        self._queue.join()
+
+    def close(self) -> None:
+        """Finish the pending jobs and stop the writer thread."""
+        with self._lock:
+            thread, self._thread = self._thread, None
+            if thread is None:
+                return
+            atexit.unregister(self.close)
+        self._queue.put(None)
+        thread.join()
+
+    def _run(self) -> None:
+        while True:
+            job = self._queue.get()
+            try:
+                if job is None:
+                    return
+                fn, args, kwargs = job
+                fn(*args, **kwargs)
+            except Exception:
+                # Keep the worker alive for the following phases
+                print("Background data storage failed")
+                traceback.print_exc()
+            finally:
+                self._queue.task_done()
 
 
 class DataStorage:
@@ -16,47 +381,381 @@ class DataStorage:
     The class buffers time stamped voltage and current readings and can
     export the accumulated data to ``.csv`` or ``.xlsx`` files.  Excel files
     are optional and disabled by default when calling :meth:`createTable`.
-    """
+
+    Long runs should call :meth:`openStream` first. Completed rows are then
+    appended to a ``.partial.csv`` file in chunks and dropped from memory,
+    so a crash keeps everything up to the last flush and memory use does
+    not grow with the run length.
+
+    Samples are kept as raw floats in typed arrays, with the wall clock time
+    as epoch nanoseconds. Rounding to four decimals, the power column and the
+    timestamp strings are computed once per block when the data is written.
+
+    ``formats`` selects the files written: ``"csv"`` for the text table and
+    ``"run"`` for the binary columnar format read by :func:`load_run`, which
+    keeps the unrounded values and stores the test parameters in its header
+    instead of the file name.
+    """
+
+    # Record every saved result in Data/catalog.sqlite, see AlIonTestSoftwareCatalog
+    catalog = True
+    # Points per graph series in Excel files and the method used to pick
+    # them, see decimate; 0 plots every row
+    chartPoints = 2000
+    chartDecimation = "lttb"
+    # Number of recent samples averaged by RunningStats.windowMean
+    statsWindow = 50
+    # Write dQ/dV and dV/dQ of every result, see AlIonTestSoftwareICA
+    icaExport = False
+
+    def __init__(self, formats=("csv",)) -> None:
+        """Initialize empty buffers for measurement values."""
+        self.formats = tuple(formats)
+        # Test parameters stored in the header of binary runs
+        self.metadata = {}
+        self._reset()
+        # Streaming state, see openStream
+        self._streaming = False
+        self._streamBase = None
+        self._runWriter = None
+        self._stream = None
+        self._streamWriter = None
+        self._streamPath = None
+        self._streamColumns = ()
+        self._streamChunk = 0
+        self._streamFsync = 0.0
+        self._lastFsync = 0.0
+
+    def updateMetadata(self, **values) -> None:
+        """Record test parameters and settings for the run header."""
+        self.metadata.update(values)
+
+    def openStream(
+        self,
+        testName,
+        c_rate: float,
+        cycleNr: int,
+        columns=(),
+        chunk_size: int = 50,
+        fsync_interval: float = 30.0,
+    ) -> str:
+        """Start appending rows to a CSV file while the test is running.
+
+        Parameters
+        ----------
+        testName, c_rate, cycleNr
+            Same meaning as for :meth:`createTable`.
+        columns : iterable of str, optional
+            Optional columns that every row will contain, any of
+            ``"capacity"``, ``"mm_volts"`` and ``"mm_temp"``.
+        chunk_size : int, optional
+            Number of complete rows collected before they are written and
+            flushed to the operating system.
+        fsync_interval : float, optional
+            Minimum number of seconds between ``os.fsync`` calls forcing the
+            written rows onto the disk. ``0`` syncs after every chunk.
+
+        Returns
+        -------
+        str
+            Path of the partial output without extension; the files end in
+            ``.partial.csv`` and ``.partial.run``. :meth:`createTable` renames
+            them to the usual result name when the phase is finished.
+        """
+        self._streamColumns = tuple(
+            name for name, _ in OPTIONAL_COLUMNS if name in tuple(columns)
+        )
+        self._streamName = [testName, c_rate, cycleNr]
+        self._streamBase = (
+            f"{data_directory()}/{testName}_{c_rate}C_#{cycleNr + 1}_"
+            + datetime.now().strftime("%d.%m.%y_%H;%M;%S")
+            + ".partial"
+        )
+        if "csv" in self.formats:
+            self._streamPath = self._streamBase + ".csv"
+            self._stream = open(self._streamPath, "w", newline="", encoding="utf-8")
+            self._streamWriter = csv.writer(self._stream)
+            self._streamWriter.writerow(self._header(self._streamColumns))
+        if "run" in self.formats:
+            self._runWriter = RunWriter(
+                self._streamBase + ".run",
+                self._runColumns(self._streamColumns),
+                self._runMetadata(testName, c_rate, cycleNr),
+            )
+        self._startStream(chunk_size, fsync_interval)
+        return self._streamBase
+
+    def resumeStream(
+        self, position: dict, chunk_size: int = 50, fsync_interval: float = 30.0
+    ) -> str:
+        """Continue a stream from a position returned by :meth:`checkpoint`.
+
+        Rows written after the checkpoint are dropped from the partial files
+        so the stream matches the checkpointed test state. When the partial
+        files are gone, for example because the interrupted test already
+        saved them, a new stream is opened instead.
+        """
+        base = position["base"]
+        rows = position["rows"]
+        present = all(
+            os.path.exists(f"{base}.{fmt}") for fmt in self.formats if fmt in ("csv", "run")
+        )
+        if not present:
+            return self.openStream(
+                *position["name"], position["columns"], chunk_size, fsync_interval
+            )
+        self._streamColumns = tuple(position["columns"])
+        self._streamName = list(position["name"])
+        self._streamBase = base
+        if "csv" in self.formats:
+            self._streamPath = base + ".csv"
+            with open(self._streamPath, "rb+") as f:
+                # Keep the header and the checkpointed rows
+                for _ in range(rows + 1):
+                    f.readline()
+                f.truncate(f.tell())
+            self._stream = open(self._streamPath, "a", newline="", encoding="utf-8")
+            self._streamWriter = csv.writer(self._stream)
+        if "run" in self.formats:
+            self._runWriter = RunWriter.reopen(base + ".run", rows)
+        self._startStream(chunk_size, fsync_interval)
+        self._streamRows = rows
+        if "stats" in position:
+            self._restoreStats(position["stats"], position.get("phases", []))
+        return base
+
+    def _startStream(self, chunk_size, fsync_interval) -> None:
+        self._streaming = True
+        self._streamChunk = max(int(chunk_size), 1)
+        self._streamFsync = fsync_interval
+        self._lastFsync = time.monotonic()
+        self._streamRows = 0
+
+    def checkpoint(self) -> dict:
+        """Write and sync all complete rows and return the stream position.
+
+        The returned dictionary is JSON serialisable and can be passed to
+        :meth:`resumeStream` to continue the stream after a crash.
+        """
+        self._writeStreamRows(force=True)
+        return {
+            "base": self._streamBase,
+            "name": self._streamName,
+            "columns": list(self._streamColumns),
+            "rows": self._streamRows,
+            "stats": {name: s.state() for name, s in self.stats.items()},
+            "phases": [
+                [phase, {name: s.state() for name, s in stats.items()}]
+                for phase, stats in self.phases
+            ],
+        }
+
+    def startPhase(self, name: str) -> None:
+        """Start collecting the statistics of a new test phase.
+
+        Samples added before the first phase count towards the statistics
+        of the whole run only. A resumed phase continues the statistics
+        restored from the checkpoint.
+        """
+        if self.phases and self.phases[-1][0] == name:
+            return
+        self.phases.append((name, {channel: RunningStats() for channel in STAT_CHANNELS}))
+
+    def phaseSummary(self) -> list:
+        """Return the statistics of every phase as dictionaries.
+
+        Each entry holds the phase name, its number of samples and the
+        :meth:`RunningStats.summary` of every recorded channel. Without
+        phases the whole run is reported as phase ``"run"``.
+        """
+        phases = self.phases or [("run", self.stats)]
+        summary = []
+        for phase, stats in phases:
+            channels = {
+                name: s.summary() for name, s in stats.items() if s.count
+            }
+            summary.append({
+                "phase": phase,
+                "samples": stats["time"].count,
+                "channels": channels,
+            })
+        return summary
+
+    def _restoreStats(self, stats: dict, phases: list) -> None:
+        self.stats = {name: RunningStats.fromState(s) for name, s in stats.items()}
+        self.phases = [
+            (phase, {name: RunningStats.fromState(s) for name, s in channels.items()})
+            for phase, channels in phases
+        ]
+
+    def _track(self, channel: str, value: float) -> None:
+        # Update the run and phase statistics of a channel
+        self.stats[channel].add(value)
+        if self.phases:
+            self.phases[-1][1][channel].add(value)
+
+    def _fileTemperature(self, temperature) -> str:
+        # Measured mean temperature when recorded, else the configured one
+        mm_temp = self.stats["mm_temp"]
+        if mm_temp.count:
+            return f"{mm_temp.mean:.1f}"
+        return f"{temperature}"
+
+    @staticmethod
+    def _header(columns) -> list:
+        head = ["Timestamp", "Time [s]", "Volts", "Current", "Power"]
+        for name, title in OPTIONAL_COLUMNS:
+            if name in columns:
+                head.append(title)
+        return head
+
+    @staticmethod
+    def _runColumns(columns) -> list:
+        base = ["timestamp_ns", "time_s", "volts", "current", "power"]
+        return base + [name for name, _ in OPTIONAL_COLUMNS if name in columns]
+
+    def _runMetadata(self, testName, c_rate, cycleNr, **values) -> dict:
+        metadata = {
+            "test_name": testName,
+            "c_rate": c_rate,
+            "cycle": cycleNr + 1,
+            "created": datetime.now().isoformat(timespec="seconds"),
+        }
+        metadata.update(values)
+        metadata["settings"] = dict(self.metadata)
+        return metadata
+
+    def _rawColumns(self, columns, rows: int) -> dict:
+        """Return the first ``rows`` unrounded samples keyed by run column."""
+        import numpy as np
+
+        data = {}
+        for name, buffer, dtype in RUN_COLUMNS:
+            if buffer is None:
+                continue
+            if name in ("capacity", "mm_volts", "mm_temp") and name not in columns:
+                continue
+            data[name] = np.frombuffer(getattr(self, buffer)[:rows], dtype=dtype)
+        data["power"] = data["volts"] * data["current"]
+        return data
+
+    def _checkRows(self) -> None:
+        """Raise ValueError when a stream column missed a sample.
+
+        Rows are written only once every column has a value, so a column
+        that is not recorded for every sample would shift the others and
+        leave the remaining samples out of the file.
+        """
+        names = ("volts", "current") + self._streamColumns
+        missing = [name for name in names if len(getattr(self, name)) != len(self.time)]
+        if missing:
+            raise ValueError(
+                f"{', '.join(missing)} not recorded for every sample of the stream"
+            )
+
+    def _writeStreamRows(self, force: bool = False) -> None:
+        """Append all complete rows to the stream file and drop them."""
+        buffers = [self.timestamp, self.time, self.volts, self.current]
+        buffers += [getattr(self, name) for name in self._streamColumns]
+        rows = min(len(b) for b in buffers)
+        if rows < self._streamChunk and not force:
+            return
+        if rows:
+            if self._stream is not None:
+                data = self._formatColumns(self._streamColumns, rows)
+                columns = [c if isinstance(c, list) else c.tolist() for c in data.values()]
+                self._streamWriter.writerows(zip(*columns))
+            if self._runWriter is not None:
+                self._runWriter.append(self._rawColumns(self._streamColumns, rows))
+            for b in buffers:
+                del b[:rows]
+            self._streamRows += rows
+        now = time.monotonic()
+        sync = force or now - self._lastFsync >= self._streamFsync
+        if self._stream is not None:
+            self._stream.flush()
+            if sync:
+                os.fsync(self._stream.fileno())
+        if self._runWriter is not None:
+            self._runWriter.flush(sync)
+        if sync:
+            self._lastFsync = now
+
+    def _closeStream(self) -> None:
+        if self._stream is not None:
+            self._stream.close()
+        self._stream = None
+        self._streamWriter = None
+        self._streaming = False
+
+    # Function to add time value
+    def addTime(self, Mtime_sec: float, timestamp_ns: int | None = None):
+        """Record the measurement timestamp and elapsed time.
+
+        ``timestamp_ns`` is the wall clock time of the sample in
+        nanoseconds, by default now; burst captures pass the time the
+        sample was read.
+        """
+        # A new sample starts, so the previous rows are complete
+        if self._streaming:
+            self._checkRows()
+            self._writeStreamRows()
+        self.timestamp.append(time.time_ns() if timestamp_ns is None else timestamp_ns)
+        self.time.append(Mtime_sec)
+        self._track("time", Mtime_sec)
+
+    # Function to add voltage value
+    def addVoltage(self, volts: float):
+        """Append a voltage measurement in volts."""
+        self.volts.append(volts)
+        self._track("volts", volts)
+
+    # Function to add current value
+    def addCurrent(self, amps: float):
+        """Append a current reading in amperes."""
+        self.current.append(amps)
+        self._track("current", amps)
 
-    def __init__(self) -> None:
-        """Initialize empty buffers for measurement values."""
-        self.time = []
-        self.timestamp = []
-        self.volts = []
-        self.current = []
-        self.power = []
-        self.capacity = []
-        self.mm_volts = []
-        self.mm_temp = []
-
-    # Function to add time value
-    def addTime(self, Mtime_sec: float):
-        """Record the measurement timestamp and elapsed time."""
-        timestamp = datetime.now().strftime("%H:%M:%S.%f")[:-3]
-        self.timestamp.append(timestamp)
-        self.time.append(float('{:.4f}'.format(Mtime_sec)))
-
-    # Function to add voltage value
-    def addVoltage(self, volts: float):
-        """Append a voltage measurement in volts."""
-        self.volts.append(float('{:.4f}'.format(volts)))
-
-    # Function to add current value
-    def addCurrent(self, amps: float):
-        """Append a current reading in amperes."""
-        self.current.append(float('{:.4f}'.format(amps)))
-
-    def addMMVoltage(self, volts: float):
-        """Append a multimeter voltage reading."""
-        self.mm_volts.append(float('{:.4f}'.format(volts)))
-
-    def addMMTemperature(self, temp_c: float):
-        """Append a temperature measurement from the multimeter."""
-        self.mm_temp.append(float('{:.4f}'.format(temp_c)))
-
-    def addCapacity(self, ah: float):
-        """Store capacity value in ampere-hours."""
-        self.capacity.append(float('{:.4f}'.format(ah)))
+    def addMMVoltage(self, volts: float):
+        """Append a multimeter voltage reading."""
+        self.mm_volts.append(volts)
+        self._track("mm_volts", volts)
+
+    def addMMTemperature(self, temp_c: float):
+        """Append a temperature measurement from the multimeter."""
+        self.mm_temp.append(temp_c)
+        self._track("mm_temp", temp_c)
+
+    def addCapacity(self, ah: float):
+        """Store capacity value in ampere-hours."""
+        self.capacity.append(ah)
+        self._track("capacity", ah)
+
+    def _formatColumns(self, columns, rows: int) -> dict:
+        """Return the first ``rows`` samples as output columns.
+
+        Values are rounded to four decimals and the power column is the
+        product of the rounded voltage and current, all computed on whole
+        arrays at once.
+        """
+        import numpy as np
+
+        def rounded(buffer):
+            return np.round(np.frombuffer(buffer[:rows], dtype=np.float64), 4)
+
+        volts = rounded(self.volts)
+        current = rounded(self.current)
+        data = {
+            "Timestamp": format_timestamps(self.timestamp[:rows]),
+            "Time [s]": rounded(self.time),
+            "Volts": volts,
+            "Current": current,
+            "Power": volts * current,
+        }
+        for name, title in OPTIONAL_COLUMNS:
+            if name in columns:
+                data[title] = rounded(getattr(self, name))
+        return data
 
     # Function for creating a table
     def createTable(
@@ -92,141 +791,260 @@ class DataStorage:
         verbose : bool, optional
             If ``True`` print additional debug information such as the
             absolute output path.
-        """
-        # Get the number of measurements
-        length = len(self.volts)
-        # Fill in power list with voltage and current values
-        for i in range(length):
-            self.power.append(self.volts[i] * self.current[i])
-        # Create a 2 dimensional list for the data
-        # Start with an empty list.  The previous implementation initialised the
-        # data list with an empty inner list which resulted in an extra row of
-        # NaNs when creating the DataFrame.
-        data = []
-        # Fill the list with the results
-        include_capacity = len(self.capacity) == len(self.volts) and len(self.capacity) > 0
-        include_mm_volts = len(self.mm_volts) == len(self.volts) and len(self.mm_volts) > 0
-        include_mm_temp = len(self.mm_temp) == len(self.volts) and len(self.mm_temp) > 0
-        for j in range(len(self.volts)):
-            d = [self.timestamp[j], self.time[j],
-                 self.volts[j], self.current[j], self.power[j]]
-            if include_capacity:
-                d.append(self.capacity[j])
-            if include_mm_volts:
-                d.append(self.mm_volts[j])
-            if include_mm_temp:
-                d.append(self.mm_temp[j])
-            data.append(d)
-        head = ["Timestamp", "Time [s]", "Volts", "Current", "Power"]
-        if include_capacity:
-            head.append("Capacity")
-        if include_mm_volts:
-            head.append("MM_Volts")
-        if include_mm_temp:
-            head.append("MM_Temp")
-        # Store the table in a text file
-        try:
-            # Find the absolute path to the current file
-            abs_path = os.path.abspath("").replace("\\", "/")
-            # Use the absolute path to create a path to the Data folder
-            data_dir = f"{abs_path}/Data"
-            # Ensure the output directory exists
-            os.makedirs(data_dir, exist_ok=True)
-            if include_mm_temp:
-                avg_temp = statistics.mean(self.mm_temp)
-                file_temp = f"{avg_temp:.1f}"
-            else:
-                file_temp = f"{temperature}"
 
-            filePath = (
-                f"{data_dir}/{testName}_{c_rate}C_#{cycleNr + 1}_@{file_temp}°C_"
-                + str(datetime.now().strftime("%d.%m.%y_%H;%M"))
+        When :meth:`openStream` was called the remaining rows are appended to
+        the stream files, which are then renamed to the result name.
+        """
+        if self._streaming:
+            self._finishStream(
+                testName, c_rate, cycleNr, temperature, timeInterval,
+                chargeTime, export_xlsx, verbose,
             )
-            # Display the Path for debug purposes if requested
-            if verbose:
-                print(abs_path)
+            return
+        # Get the number of measurements
+        length = len(self.volts)
+        # Optional columns are only written when recorded for every sample
+        columns = [
+            name for name, _ in OPTIONAL_COLUMNS
+            if len(getattr(self, name)) == length and length > 0
+        ]
+        head = self._header(columns)
+        data = self._formatColumns(columns, length)
+        # Store the table in a text file
+        try:
+            file_temp = self._fileTemperature(temperature)
+            filePath = self._resultPath(testName, c_rate, cycleNr, file_temp, verbose)
             # Export to CSV file
-            self.exportCSVFile(filePath, data, head)
-            if export_xlsx:
-                # Optional Excel output with graphs
-                if verbose:
-                    print(f"Saving results to {filePath}.xlsx")
-                self.exportXLSXFile(filePath, chargeTime, timeInterval)
-                if verbose:
-                    print(f"Charge time configured: {chargeTime}")
-        except:
-            print("Data storage failed, check file path")
-        # Empty the result values
-        self.time = []
-        self.timestamp = []
-        self.volts = []
-        self.current = []
-        self.power = []
-        self.capacity = []
-        self.mm_volts = []
-        self.mm_temp = []
+            if "csv" in self.formats:
+                self.exportCSVFile(filePath, data, head)
+            metadata = self._runMetadata(
+                testName, c_rate, cycleNr,
+                temperature=temperature,
+                file_temperature=file_temp,
+                time_interval=timeInterval,
+                charge_time=chargeTime,
+                phases=self.phaseSummary(),
+            )
+            self._exportSummary(filePath, metadata)
+            if "run" in self.formats:
+                self.exportRunFile(filePath, self._rawColumns(columns, length), metadata)
+            if export_xlsx:
+                self._exportXLSX(filePath, chargeTime, timeInterval, verbose, [data])
+            self._catalogResult(filePath, metadata)
+            self._exportICA(filePath)
+        except:
+            print("Data storage failed, check file path")
+        self._reset()
+
+    def _resultPath(self, testName, c_rate, cycleNr, file_temp, verbose=False) -> str:
+        """Build the result file path (without extension) in ``Data``."""
+        data_dir = data_directory()
+        # Display the Path for debug purposes if requested
+        if verbose:
+            print(os.path.dirname(data_dir))
+        return (
+            f"{data_dir}/{testName}_{c_rate}C_#{cycleNr + 1}_@{file_temp}°C_"
+            + str(datetime.now().strftime("%d.%m.%y_%H;%M"))
+        )
+
+    def _exportXLSX(self, filePath, chargeTime, timeInterval, verbose, blocks=None) -> None:
+        # Optional Excel output with graphs
+        if verbose:
+            print(f"Saving results to {filePath}.xlsx")
+        self.exportXLSXFile(filePath, chargeTime, timeInterval, blocks)
+        if verbose:
+            print(f"Charge time configured: {chargeTime}")
+
+    def _finishStream(
+        self, testName, c_rate, cycleNr, temperature, timeInterval,
+        chargeTime, export_xlsx, verbose,
+    ) -> None:
+        """Flush the last rows and move the stream file to its result name."""
+        try:
+            self._writeStreamRows(force=True)
+            if len(self.time):
+                print(f"{len(self.time)} incomplete samples were not saved")
+            self._closeStream()
+            file_temp = self._fileTemperature(temperature)
+            filePath = self._resultPath(testName, c_rate, cycleNr, file_temp, verbose)
+            results = {
+                "temperature": temperature,
+                "file_temperature": file_temp,
+                "time_interval": timeInterval,
+                "charge_time": chargeTime,
+                "phases": self.phaseSummary(),
+            }
+            if self._runWriter is not None:
+                self._runWriter.close(dict(results, settings=dict(self.metadata)))
+                metadata = self._runWriter.metadata
+                self._runWriter = None
+                # Like the CSV file, replace a result saved under the same name
+                if os.path.isdir(filePath + ".run"):
+                    shutil.rmtree(filePath + ".run")
+                os.replace(self._streamBase + ".run", filePath + ".run")
+            else:
+                metadata = self._runMetadata(*self._streamName, **results)
+                self._exportSummary(filePath, metadata)
+            if "csv" in self.formats:
+                os.replace(self._streamBase + ".csv", filePath + ".csv")
+            if export_xlsx:
+                # The streamed rows are no longer in memory, read them back
+                # block by block from the binary run when there is one
+                if "run" in self.formats:
+                    blocks = run_table_blocks(load_run(filePath + ".run"))
+                else:
+                    blocks = None
+                self._exportXLSX(filePath, chargeTime, timeInterval, verbose, blocks)
+            self._catalogResult(filePath, metadata)
+            self._exportICA(filePath)
+        except:
+            print(f"Data storage failed, partial results kept in {self._streamBase}.*")
+        finally:
+            self._closeStream()
+            if self._runWriter is not None:
+                # Close the column files and write the header of the
+                # partial run left behind by a failure
+                try:
+                    self._runWriter.close()
+                except Exception:
+                    traceback.print_exc()
+                self._runWriter = None
+        self._reset()
+
+    def _catalogResult(self, filePath, metadata) -> None:
+        # Index the saved result; a catalog failure must not lose the data
+        if not self.catalog:
+            return
+        try:
+            from AlIonTestSoftwareCatalog import RunCatalog
+
+            with RunCatalog() as catalog:
+                catalog.record_result(filePath, metadata)
+        except Exception as exc:
+            print(f"Catalog update failed: {exc}")
+
+    def _exportICA(self, filePath) -> None:
+        # Optional analysis stage, the saved result stays valid if it fails
+        if not self.icaExport:
+            return
+        try:
+            from AlIonTestSoftwareICA import export_result
+
+            export_result(filePath)
+        except Exception as exc:
+            print(f"ICA export failed: {exc}")
+
+    def _reset(self) -> None:
+        # Empty the result values
+        self.time = array("d")
+        self.timestamp = array("q")
+        self.volts = array("d")
+        self.current = array("d")
+        self.capacity = array("d")
+        self.mm_volts = array("d")
+        self.mm_temp = array("d")
+        # Statistics of the whole run and of each phase, see startPhase
+        self.stats = {
+            channel: RunningStats(self.statsWindow) for channel in STAT_CHANNELS
+        }
+        self.phases = []
+
+    def _exportSummary(self, filePath, metadata) -> None:
+        # Binary runs keep the phase summary in their header, CSV results
+        # get it next to them
+        if "run" not in self.formats:
+            with open(filePath + ".summary.json", "w", encoding="utf-8") as f:
+                json.dump(metadata["phases"], f, indent=2, default=str)
+
+    def exportRunFile(self, filePath, data, metadata):
+        """Write the columns to a binary ``.run`` directory."""
+        writer = RunWriter(filePath + ".run", list(data), metadata)
+        writer.append(data)
+        writer.close()
 
     def exportCSVFile(self, filePath, data, head):
         """Write the collected data to a CSV file."""
+        import pandas as pd
+
         df = pd.DataFrame(data, columns=head)
         df.to_csv(filePath + ".csv", index=False)
 
-    def exportXLSXFile(self, filePath, chargeTime, timeInterval):
-        """Create an Excel workbook with optional graphs."""
-        # Read in the CSV file that was just created
-        csvDataframe = pd.read_csv(filePath + ".csv")
+    def exportXLSXFile(self, filePath, chargeTime, timeInterval, blocks=None, chartPoints=None):
+        """Create an Excel workbook with optional graphs.
+
+        ``blocks`` is an iterable of column dictionaries as returned by
+        :func:`run_table_blocks`; when omitted the CSV file at ``filePath``
+        is read block by block. Rows go through a write-only worksheet, so
+        memory use does not grow with the length of the test.
+
+        The graphs plot at most ``chartPoints`` points per series, default
+        :attr:`chartPoints`, picked with :func:`decimate` and written to a
+        separate ``Chart data`` sheet; the first sheet keeps every row.
+        ``0`` plots the full resolution data instead.
+        """
+        import numpy as np
+        import openpyxl
+        from openpyxl.chart import ScatterChart, Reference, Series  # type: ignore
+
+        if chartPoints is None:
+            chartPoints = self.chartPoints
+        if blocks is None:
+            blocks = csv_table_blocks(filePath + ".csv")
         # Create our excel file
-        xlsxDataframe = pd.ExcelWriter(filePath + ".xlsx", engine='openpyxl')
-        # Write from csv to excel
-        csvDataframe.to_excel(xlsxDataframe, index=False)
-        # Save our excel file
-        xlsxDataframe.close()
-
-        # Open up our excel file as a work book
-        wb = openpyxl.load_workbook(filePath + ".xlsx")
-        # Access the sheet
-        sheet = wb.active
-        
-        # Ensure sheet is not None
-        if sheet is None:
-            sheet = wb.worksheets[0]
-
-        # Only create generic graphs when no dedicated charge time is provided
-        if chargeTime == 0:
-            # Create a list of Values to graph
-            seconds = Reference(sheet, min_col=2, min_row=3,
-                                max_col=2, max_row=len(csvDataframe))
-            voltage = Reference(sheet, min_col=3, min_row=3,
-                                max_col=3, max_row=len(csvDataframe))
-            current = Reference(sheet, min_col=4, min_row=3,
-                                max_col=4, max_row=len(csvDataframe))
-            power = Reference(sheet, min_col=5, min_row=3,
-                              max_col=5, max_row=len(csvDataframe))
-
-            # Create a graph for the Voltage
-            voltageChart = ScatterChart()
-            voltageSeries = Series(voltage, seconds, title_from_data=True)
-            voltageChart.series.append(voltageSeries)
-            voltageChart.title = "Voltage over Time"
-            voltageChart.x_axis.title = "Time [s]"
-            # Label the y-axis correctly instead of overwriting the x-axis title
-            voltageChart.y_axis.title = "Voltage [V]"
-
-            # Create a graph for the Current
-            currentChart = ScatterChart()
-            currentSeries = Series(current, seconds, title_from_data=True)
-            currentChart.series.append(currentSeries)
-            currentChart.title = "Current over Time"
-            currentChart.x_axis.title = "Time [s]"
-            currentChart.y_axis.title = "Current [A]"
-
-            # Create a graph for the Power
-            powerChart = ScatterChart()
-            powerSeries = Series(power, seconds, title_from_data=True)
-            powerChart.series.append(powerSeries)
-            powerChart.title = "Power over Time"
-            powerChart.x_axis.title = "Time [s]"
-            powerChart.y_axis.title = "Power [W]"
+        wb = openpyxl.Workbook(write_only=True)
+        sheet = wb.create_sheet()
+        # Plotted columns, kept as compact arrays for the decimation
+        plot = {title: array("d") for title in ("Time [s]", "Volts", "Current", "Power")}
+        # Write the rows, counting them for the chart ranges
+        rows = 0
+        for block in blocks:
+            if rows == 0:
+                sheet.append(list(block))
+            columns = [c if isinstance(c, list) else c.tolist() for c in block.values()]
+            for row in zip(*columns):
+                sheet.append(row)
+                rows += 1
+            if chartPoints:
+                for title, values in plot.items():
+                    values.frombytes(np.asarray(block[title], dtype=np.float64).tobytes())
+
+        # Samples shown in the generic graphs, or in the charging and
+        # discharging graphs when a charge time is given
+        if chargeTime == 0:
+            segments = [(0, rows)]
+        else:
+            split = min(int((float(chargeTime) * 60) / float(timeInterval)), rows)
+            segments = [(0, split), (split, rows)]
+        if chartPoints:
+            source, columnsOf, ranges = self._writeChartData(
+                wb, plot, segments, chartPoints, self.chartDecimation
+            )
+        else:
+            source = sheet
+            columnsOf = {"Volts": (2, 3), "Current": (2, 4), "Power": (2, 5)}
+            ranges = [(start + 2, max(stop + 1, start + 2)) for start, stop in segments]
+
+        def scatter(name, segment, title, y_title, legend=True):
+            x_col, y_col = columnsOf[name]
+            first, last = ranges[segment]
+            chart = ScatterChart()
+            if not legend:
+                chart.legend = None
+            xvalues = Reference(source, min_col=x_col, min_row=first, max_row=last)
+            values = Reference(source, min_col=y_col, min_row=first, max_row=last)
+            chart.series.append(Series(values, xvalues, title=name if legend else None))
+            chart.title = title
+            if not legend:
+                chart.x_axis.tickLblPos = "low"
+            chart.x_axis.title = "Time [s]"
+            chart.y_axis.title = y_title
+            return chart
+
+        # Only create generic graphs when no dedicated charge time is provided
+        if chargeTime == 0:
+            voltageChart = scatter("Volts", 0, "Voltage over Time", "Voltage [V]")
+            currentChart = scatter("Current", 0, "Current over Time", "Current [A]")
+            powerChart = scatter("Power", 0, "Power over Time", "Power [W]")
 
             # Add our graphs to the sheet
             voltageChart.anchor = "E2"
@@ -237,91 +1055,22 @@ class DataStorage:
             sheet.add_chart(powerChart)
 
         else:  # This is used normally
-            # Create a list of Values to graph
-            seconds = Reference(sheet, min_col=2, min_row=3,
-                                max_col=2, max_row=len(csvDataframe))
-            voltageCharging = Reference(sheet, min_col=3, min_row=3, max_col=3, max_row=int(
-                (float(chargeTime) * 60) / float(timeInterval)))
-            currentCharging = Reference(sheet, min_col=4, min_row=3, max_col=4, max_row=int(
-                (float(chargeTime) * 60) / float(timeInterval)))
-            powerCharging = Reference(sheet, min_col=5, min_row=3, max_col=5, max_row=int(
-                (float(chargeTime) * 60) / float(timeInterval)))
-
-            voltageDischarging = Reference(sheet, min_col=3, min_row=int((float(
-                chargeTime) * 60) / float(timeInterval) + 1), max_col=3, max_row=len(csvDataframe))
-            currentDischarging = Reference(sheet, min_col=4, min_row=int((float(
-                chargeTime) * 60) / float(timeInterval) + 1), max_col=4, max_row=len(csvDataframe))
-            powerDischarging = Reference(sheet, min_col=5, min_row=int((float(
-                chargeTime) * 60) / float(timeInterval) + 1), max_col=5, max_row=len(csvDataframe))
+            dischargeTime = str(float(math.ceil(
+                (rows - 2) * float(timeInterval)) / 60 - float(chargeTime)))
             ## CHARGING GRAPHS ##
-            # Create a graph for the Voltage during Charging
-            voltageChartCharging = ScatterChart()
-            voltageChartCharging.legend = None
-            voltageSeriesCharging = Series(
-                voltageCharging, seconds, title_from_data=False)
-            voltageChartCharging.series.append(voltageSeriesCharging)
-            voltageChartCharging.title = f"Voltage during charging ({chargeTime} s)"
-            voltageChartCharging.x_axis.tickLblPos = "low"
-            voltageChartCharging.x_axis.title = "Time [s]"
-            voltageChartCharging.y_axis.title = "Voltage [V]"
-
-            # Create a graph for the Current during Charging
-            currentChartCharging = ScatterChart()
-            currentChartCharging.legend = None
-            currentSeriesCharging = Series(
-                currentCharging, seconds, title_from_data=False)
-            currentChartCharging.series.append(currentSeriesCharging)
-            currentChartCharging.title = f"Current during charging ({chargeTime} s)"
-            currentChartCharging.x_axis.tickLblPos = "low"
-            currentChartCharging.x_axis.title = "Time [s]"
-            currentChartCharging.y_axis.title = "Current [A]"
-
-            # Create a graph for the Power during Charging
-            powerChartCharging = ScatterChart()
-            powerChartCharging.legend = None
-            powerSeriesCharging = Series(
-                powerCharging, seconds, title_from_data=False)
-            powerChartCharging.series.append(powerSeriesCharging)
-            powerChartCharging.title = f"Power during charging ({chargeTime} s)"
-            powerChartCharging.x_axis.tickLblPos = "low"
-            powerChartCharging.x_axis.title = "Time [s]"
-            powerChartCharging.y_axis.title = "Power [W]"
+            voltageChartCharging = scatter(
+                "Volts", 0, f"Voltage during charging ({chargeTime} s)", "Voltage [V]", False)
+            currentChartCharging = scatter(
+                "Current", 0, f"Current during charging ({chargeTime} s)", "Current [A]", False)
+            powerChartCharging = scatter(
+                "Power", 0, f"Power during charging ({chargeTime} s)", "Power [W]", False)
             ## DISCHARGING GRAPHS ##
-            # Create a graph for the Voltage during Disharging
-            voltageChartDischarging = ScatterChart()
-            voltageChartDischarging.legend = None
-            voltageSeriesDischarging = Series(
-                voltageDischarging, seconds, title_from_data=False)
-            voltageChartDischarging.series.append(voltageSeriesDischarging)
-            voltageChartDischarging.title = "Voltage during discharging (" + str(float(math.ceil(
-                (len(csvDataframe) - 2) * float(timeInterval)) / 60 - float(chargeTime))) + " s)"
-            voltageChartDischarging.x_axis.tickLblPos = "low"
-            voltageChartDischarging.x_axis.title = "Time [s]"
-            voltageChartDischarging.y_axis.title = "Voltage [V]"
-
-            # Create a graph for the Current during Disharging
-            currentChartDischarging = ScatterChart()
-            currentChartDischarging.legend = None
-            currentSeriesDischarging = Series(
-                currentDischarging, seconds, title_from_data=False)
-            currentChartDischarging.series.append(currentSeriesDischarging)
-            currentChartDischarging.title = "Current during discharging (" + str(float(math.ceil(
-                (len(csvDataframe) - 2) * float(timeInterval)) / 60 - float(chargeTime))) + " s)"
-            currentChartDischarging.x_axis.tickLblPos = "low"
-            currentChartDischarging.x_axis.title = "Time [s]"
-            currentChartDischarging.y_axis.title = "Current [A]"
-
-            # Create a graph for the Power during Discharging
-            powerChartDischarging = ScatterChart()
-            powerChartDischarging.legend = None
-            powerSeriesDischarging = Series(
-                powerDischarging, seconds, title_from_data=False)
-            powerChartDischarging.series.append(powerSeriesDischarging)
-            powerChartDischarging.title = "Power during discharging (" + str(float(math.ceil(
-                (len(csvDataframe) - 2) * float(timeInterval)) / 60 - float(chargeTime))) + " s)"
-            powerChartDischarging.x_axis.tickLblPos = "low"
-            powerChartDischarging.x_axis.title = "Time [s]"
-            powerChartDischarging.y_axis.title = "Power [W]"
+            voltageChartDischarging = scatter(
+                "Volts", 1, f"Voltage during discharging ({dischargeTime} s)", "Voltage [V]", False)
+            currentChartDischarging = scatter(
+                "Current", 1, f"Current during discharging ({dischargeTime} s)", "Current [A]", False)
+            powerChartDischarging = scatter(
+                "Power", 1, f"Power during discharging ({dischargeTime} s)", "Power [W]", False)
 
             # Add our graphs to the sheet
             voltageChartCharging.anchor = "F2"
@@ -340,6 +1089,41 @@ class DataStorage:
 
         wb.save(filePath + ".xlsx")
 
+    @staticmethod
+    def _writeChartData(wb, plot, segments, points, method):
+        """Write decimated graph series to a ``Chart data`` sheet.
+
+        Each segment gets a share of ``points`` proportional to its length.
+        Returns the sheet, the time and value column of every series and the
+        sheet rows of every segment.
+        """
+        from itertools import zip_longest
+
+        import numpy as np
+
+        names = ("Volts", "Current", "Power")
+        chartSheet = wb.create_sheet("Chart data")
+        chartSheet.append([title for name in names for title in ("Time [s]", name)])
+        time_s = np.frombuffer(plot["Time [s]"], dtype=np.float64)
+        total = max(sum(stop - start for start, stop in segments), 1)
+        ranges = []
+        row = 2
+        for start, stop in segments:
+            budget = max(int(points * (stop - start) / total), 3)
+            columns = []
+            for name in names:
+                x = time_s[start:stop]
+                y = np.frombuffer(plot[name], dtype=np.float64)[start:stop]
+                keep = decimate(x, y, budget, method)
+                columns += [x[keep].tolist(), y[keep].tolist()]
+            count = max(len(c) for c in columns)
+            for values in zip_longest(*columns):
+                chartSheet.append(values)
+            ranges.append((row, max(row + count - 1, row)))
+            row += count
+        columnsOf = {name: (2 * i + 1, 2 * i + 2) for i, name in enumerate(names)}
+        return chartSheet, columnsOf, ranges
+
     
 
     
@@ -1,75 +1,314 @@
 """Device driver wrappers using NI-VISA to control test equipment."""
 
-import pyvisa
-
+import atexit
+import functools
+import sys
+import threading
+from scpi_commands import (
+    POWER_SUPPLY_COMMANDS,
+    DEPENDENT_SETPOINTS,
+    ELECTRONIC_LOAD_COMMANDS,
+    INSTRUMENT_RESOURCES,
+    format_commands,
+    join_commands,
+    setpoint_key,
+)
+
+# Process wide resource manager and the sessions opened through it. Each entry
+# maps a resource string to ``[session, reference count]``.
+_pool_lock = threading.Lock()
+_resource_manager = None
+_sessions: dict = {}
+
+
+def open_session(resource_name: str):
+    """Return a pooled session for ``resource_name``.
+
+    The session is opened on first use and shared by every controller that
+    asks for the same resource. Released sessions stay open so the next test
+    in the same process skips the open/handshake cost.
+    """
+    global _resource_manager
+    with _pool_lock:
+        entry = _sessions.get(resource_name)
+        if entry is None:
+            if _resource_manager is None:
+                # Imported here so mock runs and --help never load pyvisa
+                import pyvisa
+                _resource_manager = pyvisa.ResourceManager()
+            entry = [_resource_manager.open_resource(resource_name), 0]
+            _sessions[resource_name] = entry
+        entry[1] += 1
+        return entry[0]
+
+
+def release_session(resource_name: str, discard: bool = False) -> None:
+    """Drop one reference to a pooled session.
+
+    With ``discard`` the session is closed and removed from the pool once no
+    other controller holds it, e.g. after a USB drop left it unusable.
+    """
+    with _pool_lock:
+        entry = _sessions.get(resource_name)
+        if entry is None:
+            return
+        entry[1] = max(entry[1] - 1, 0)
+        if discard and entry[1] == 0:
+            del _sessions[resource_name]
+            try:
+                entry[0].close()
+            except Exception:
+                pass
+
+
+class TrackedSession:
+    """Pass writes and queries to a pooled session, noting VISA I/O errors.
+
+    A controller releases a session that raised an I/O error with
+    ``discard``, so the next controller opens a new one instead of getting
+    the dead session back from the pool.
+    """
+
+    def __init__(self, session) -> None:
+        self.session = session
+        self.failed = False
+
+    def write(self, message: str):
+        return self._call(self.session.write, message)
+
+    def query(self, message: str) -> str:
+        return self._call(self.session.query, message)
+
+    def _call(self, method, message):
+        try:
+            return method(message)
+        except Exception as exc:
+            # pyvisa is loaded once a real session exists
+            errors = sys.modules.get("pyvisa.errors")
+            if errors is not None and isinstance(exc, errors.VisaIOError):
+                self.failed = True
+            raise
+
+    def __getattr__(self, name):
+        return getattr(self.session, name)
+
+
+def close_sessions() -> None:
+    """Close all unreferenced sessions and, once empty, the resource manager."""
+    global _resource_manager
+    with _pool_lock:
+        for name, (session, refs) in list(_sessions.items()):
+            if refs == 0:
+                del _sessions[name]
+                try:
+                    session.close()
+                except Exception:
+                    pass
+        if not _sessions and _resource_manager is not None:
+            try:
+                _resource_manager.close()
+            except Exception:
+                pass
+            _resource_manager = None
+
+
+atexit.register(close_sessions)
+
+
+def _parse_readings(response: str) -> tuple[float, ...]:
+    """Split the reply to a compound SCPI query into floats.
+
+    Answers to ``;`` joined queries come back separated by ``;`` (some
+    firmware versions use ``,``), so both separators are accepted.
+    """
+    return tuple(float(x) for x in response.strip().replace(",", ";").split(";") if x)
+
+
+class ShadowState:
+    """Remember the last value written to each setpoint of an instrument.
+
+    Writes that would set a setpoint or mode to the value it already has
+    are dropped; output on/off commands always reach the instrument. A
+    ``MODE`` command forgets the levels it may change (see
+    ``DEPENDENT_SETPOINTS``), so the next level write is sent. The cache
+    must be invalidated whenever the instrument state may have changed
+    behind the driver's back, e.g. after a reconnect or an abort.
+    """
+
+    def __init__(self) -> None:
+        self.values: dict[str, str] = {}
+
+    def filter(self, commands: list[str]) -> tuple[list[str], dict[str, str | None]]:
+        """Split ``commands`` into those that must be sent and the new values.
+
+        Setpoints that became unknown are ``None`` in the new values.
+        """
+        send = []
+        updates: dict[str, str | None] = {}
+        for command in commands:
+            key = setpoint_key(command)
+            if key is not None:
+                header, value = key
+                # Whether or not the write is dropped, the dependent levels
+                # can no longer be trusted
+                for prefix in DEPENDENT_SETPOINTS.get(header, ()):
+                    for known in set(self.values) | set(updates):
+                        if known.startswith(prefix):
+                            updates[known] = None
+                if updates.get(header, self.values.get(header)) == value:
+                    continue
+                updates[header] = value
+            send.append(command)
+        return send, updates
+
+    def commit(self, updates: dict[str, str | None]) -> None:
+        self.values.update(updates)
+
+    def invalidate(self) -> None:
+        self.values.clear()
+
+
+class CommandBatch:
+    """Queue commands from a ``scpi_commands`` table and send them in one write.
+
+    ``add`` looks up the command(s) stored under a driver method name and
+    fills in the parameters. ``send`` joins everything queued so far with
+    ``;`` and writes it as a single program message. When a
+    :class:`ShadowState` is given, commands that would not change the
+    instrument state are left out.
+    """
+
+    def __init__(self, instrument, table: dict, shadow: ShadowState | None = None) -> None:
+        self.instrument = instrument
+        self.table = table
+        self.shadow = shadow
+        self.commands: list[str] = []
+
+    def add(self, name: str, **params) -> "CommandBatch":
+        self.commands.extend(format_commands(self.table, name, **params))
+        return self
+
+    def send(self, sync: bool = False) -> None:
+        """Write the queued commands.
+
+        With ``sync`` a trailing ``*OPC?`` is appended and the call blocks
+        until the instrument reports that every command has completed.
+        """
+        commands, updates = self.commands, {}
+        self.commands = []
+        if self.shadow is not None:
+            commands, updates = self.shadow.filter(commands)
+        try:
+            if sync:
+                self.instrument.query(join_commands(commands + ["*OPC?"]))
+            elif commands:
+                self.instrument.write(join_commands(commands))
+        except Exception:
+            # The instrument may have applied part of the message
+            if self.shadow is not None:
+                self.shadow.invalidate()
+            raise
+        if self.shadow is not None:
+            self.shadow.commit(updates)
+
+
+def _shadow_write(instrument, shadow: ShadowState, command: str) -> None:
+    """Write ``command`` unless the shadow state shows it is already applied."""
+    send, updates = shadow.filter([command])
+    if not send:
+        return
+    try:
+        instrument.write(command)
+    except Exception:
+        shadow.invalidate()
+        raise
+    shadow.commit(updates)
+
 # Class for communication with the NI-VISA driver to control the power supply
 class PowerSupplyController:
     """Control a Chroma 62000P power supply via SCPI commands."""
     # Variable to keep the resource name of the power supply
-    powerSupplyName = "USB0::0x1698::0x0837::011000000136::INSTR"
+    powerSupplyName = INSTRUMENT_RESOURCES["power_supply"]
 
     # Constructor that establishes connection to the power supply
     def __init__(self) -> None:
-        self.resourceManager = pyvisa.ResourceManager()
-        self.powerSupply = self.resourceManager.open_resource(self.powerSupplyName)
+        self.powerSupply = TrackedSession(open_session(self.powerSupplyName))
+        # Last written setpoints, used to skip redundant writes
+        self.shadow = ShadowState()
+
+    # Function that returns the session to the shared pool
+    def close(self) -> None:
+        release_session(self.powerSupplyName, self.powerSupply.failed)
         
 
     # Function that returns the name of connected device
     def checkDeviceConnection(self):
         print(self.powerSupply.query("*IDN?"))
 
+    # Function that starts a batch of commands sent as a single write
+    def batch(self) -> CommandBatch:
+        return CommandBatch(self.powerSupply, POWER_SUPPLY_COMMANDS, self.shadow)
+
+    # Function that writes a command unless it would not change any setpoint
+    def _write(self, command: str) -> None:
+        _shadow_write(self.powerSupply, self.shadow, command)
+
+    # Function that forgets the cached setpoints so the next writes are sent
+    def invalidate_shadow(self) -> None:
+        self.shadow.invalidate()
+
     # Functions that allow user to set the maximum voltage, current and power for safety
     #### VOLTAGE #### VOLTAGE #### VOLTAGE #### VOLTAGE ####
     def setVoltage(self, *volts):
-        self.powerSupply.write("SOUR:VOLT " + str((volts[0])))
+        self._write("SOUR:VOLT " + str((volts[0])))
 
     def setVoltageLimMax(self, *volts):
-        self.powerSupply.write("SOUR:VOLT:LIMIT:HIGH " + str((volts[0])))
+        self._write("SOUR:VOLT:LIMIT:HIGH " + str((volts[0])))
 
     def setVoltageLimMin(self, *volts):
-        self.powerSupply.write("SOUR:VOLT:LIMIT:LOW " + str((volts[0])))
+        self._write("SOUR:VOLT:LIMIT:LOW " + str((volts[0])))
 
     def setVoltageProt(self, *volts):
-        self.powerSupply.write("SOUR:VOLT:PROT:HIGH " + str((volts[0])))
+        self._write("SOUR:VOLT:PROT:HIGH " + str((volts[0])))
 
     def setVoltageSlew(self, *volts):
-        self.powerSupply.write("SOUR:VOLT:SLEW " + str((volts[0])))
+        self._write("SOUR:VOLT:SLEW " + str((volts[0])))
 
     # def setVoltageMax(self):
     #     self.powerSupply.write("SOUR:VOLT:LIMIT:HIGH MAX")  # Could not find MAX command in manual
 
     #### CURRENT #### CURRENT #### CURRENT #### CURRENT ####
     def setCurrent(self, amps):
-        self.powerSupply.write("SOUR:CURR " + str(amps))
+        self._write("SOUR:CURR " + str(amps))
 
     def setCurrentLimMax(self, amps):
-        self.powerSupply.write("SOUR:CURR:LIMIT:HIGH " + str(amps))
+        self._write("SOUR:CURR:LIMIT:HIGH " + str(amps))
 
     def setCurrentLimMin(self, *amps):
-        self.powerSupply.write("SOUR:CURR:LIMIT:LOW " + str(amps[0]))
+        self._write("SOUR:CURR:LIMIT:LOW " + str(amps[0]))
 
     def setCurrentProt(self, *amps):
-        self.powerSupply.write("SOUR:CURR:PROT:HIGH " + str(amps[0]))
+        self._write("SOUR:CURR:PROT:HIGH " + str(amps[0]))
 
     def setCurrentSlew(self, amps):
-        self.powerSupply.write("SOUR:CURR:SLEW " + str(amps))
+        self._write("SOUR:CURR:SLEW " + str(amps))
 
     # def setCurrentMax(self):
     #     self.powerSupply.write("SOUR:CURR:LIMIT:HIGH MAX")  # Could not find MAX command in manual
 
     #### POWER #### POWER #### POWER #### POWER #### POWER ####
     def setPowerProt(self, *watt):
-        self.powerSupply.write("SOUR:POW:PROT:HIGH " + str(watt[0]))
+        self._write("SOUR:POW:PROT:HIGH " + str(watt[0]))
 
     # def setPowerMax(self):
     #     self.powerSupply.write("SOUR:POW:PROT:HIGH MAX")  # Could not find MAX command in manual
 
     #### DC RISE/FALL #### DC RISE/FALL #### DC RISE/FALL ####
     def setDC_Rise(self, *volts):
-        self.powerSupply.write("SOUR:POW:PROT:HIGH " + str(volts[0]))
+        self._write("SOUR:POW:PROT:HIGH " + str(volts[0]))
 
     def setDC_Fall(self, *volts):
-        self.powerSupply.write("SOUR:POW:PROT:HIGH " + str(volts[0]))
+        self._write("SOUR:POW:PROT:HIGH " + str(volts[0]))
 
     # Functions to read realtime VOLTAGE, CURRENT and POWER from the power supply
     def getVoltage(self):
@@ -80,81 +319,93 @@ class PowerSupplyController:
 
     def getPower(self):
         return self.powerSupply.query("FETCH:POW?")
+
+    # Function that reads VOLTAGE, CURRENT and POWER in one round trip
+    def fetch_all(self) -> tuple[float, ...]:
+        return _parse_readings(self.powerSupply.query("FETCH:VOLT?;CURR?;POW?"))
         
 
     # Function for constant CURRENT charging, taking in current in amps
     def chargeCC (self, amps : int):
-        # Turn of all output
-        self.powerSupply.write("CONF:OUTP OFF")
-        # Set the voltage amount to max
-        self.powerSupply.write("SOUR:VOLT MAX")
-        # Set desired current
-        self.powerSupply.write("SOUR:CURR " + str(amps))
-        # Turn on output
-        self.powerSupply.write("CONF:OUTP ON")
+        # Turn off output, set the voltage to max, set the desired current and
+        # turn the output back on in a single write
+        self.batch().add("chargeCC", amps=amps).send()
 
     # Function for constant VOLTAGE charging, taking in voltage in volts
     def chargeCV(self, volts : int):
-        # Turn of all output
-        self.powerSupply.write("CONF:OUTP OFF")
-        # Set desired voltage
-        self.powerSupply.write("SOUR:VOLT " + str(volts))
-        # Turn on output
-        self.powerSupply.write("CONF:OUTP ON")
+        # Turn off output, set the desired voltage and turn the output on
+        self.batch().add("chargeCV", volts=volts).send()
 
     # Function for constant POWER charging, taking in power in watts
     def chargeCP(self, watts : int):
-        # Turn of all output
-        self.powerSupply.write("CONF:OUTP OFF")
-        # Set desired voltage
-        self.powerSupply.write("PROG:CP:POW " + str(watts))
-        # Turn on output
-        self.powerSupply.write("CONF:OUTP ON")
+        # Turn off output, set the desired power and turn the output on
+        self.batch().add("chargeCP", watts=watts).send()
 
 
     # Functions to START/STOP the powersupply from charging
     def startOutput(self):
-        self.powerSupply.write("CONF:OUTP ON")
+        self._write("CONF:OUTP ON")
 
     def stopOutput(self):
-        self.powerSupply.write("CONF:OUTP OFF")
+        self._write("CONF:OUTP OFF")
 
 # Class for communication with the NI-VISA driver to control the electronic load
 class ElectronicLoadController:
     """Interface to a Chroma 63600 electronic load for discharging cells."""
     # Variable to keep the resource name of the electronic load
-    electronicLoadName = "USB0::0x0A69::0x083E::000000000001::INSTR"
+    electronicLoadName = INSTRUMENT_RESOURCES["electronic_load"]
 
     # Constructor that establishes connection to the electronic load
     def __init__(self) -> None:
-        self.resourceManager = pyvisa.ResourceManager()
-        self.electronicLoad = self.resourceManager.open_resource(self.electronicLoadName)
+        self.electronicLoad = TrackedSession(open_session(self.electronicLoadName))
+        # Last written setpoints, used to skip redundant writes
+        self.shadow = ShadowState()
 
         # Set and activate the channel that will be used for testing
-        self.electronicLoad.write("CHAN 1")
-        self.electronicLoad.write("CHAN:ACT 1")
+        try:
+            self.batch().add("__init__").send()
+        except Exception:
+            # Nothing else will release the reference taken above
+            release_session(self.electronicLoadName, discard=True)
+            raise
+
+    # Function that starts a batch of commands sent as a single write
+    def batch(self) -> CommandBatch:
+        return CommandBatch(self.electronicLoad, ELECTRONIC_LOAD_COMMANDS, self.shadow)
+
+    # Function that writes a command unless it would not change any setpoint
+    def _write(self, command: str) -> None:
+        _shadow_write(self.electronicLoad, self.shadow, command)
+
+    # Function that forgets the cached setpoints so the next writes are sent
+    def invalidate_shadow(self) -> None:
+        self.shadow.invalidate()
+
+    # Function that returns the session to the shared pool
+    def close(self) -> None:
+        release_session(self.electronicLoadName, self.electronicLoad.failed)
 
     # Functions to START/STOP the DC load from Discharging
     def startDischarge(self):
-        self.electronicLoad.write("LOAD ON") # Activates the electronic load
+        self._write("LOAD ON") # Activates the electronic load
 
     def stopDischarge(self):
-        self.electronicLoad.write("LOAD OFF") # Inactivates the electronic load
+        self._write("LOAD OFF") # Inactivates the electronic load
 
     def setCCLmode(self):
-        self.electronicLoad.write("MODE CCL") # Switch to CC mode Low Range
+        self._write("MODE CCL") # Switch to CC mode Low Range
 
     def setCCMmode(self):
-        self.electronicLoad.write("MODE CCM") # Switch to CC mode Medium Range
+        self._write("MODE CCM") # Switch to CC mode Medium Range
 
     def setCCHmode(self):
-        self.electronicLoad.write("MODE CCH") # Switch to CC mode High Range
+        self._write("MODE CCH") # Switch to CC mode High Range
 
     def setCCcurrentL1(self, amps):
-        self.electronicLoad.write("CURR:STAT:L1 " + str(amps))  # Set the desired current of Channel L1
+        self._write("CURR:STAT:L1 " + str(amps))  # Set the desired current of Channel L1
 
     def setCCcurrentL1MAX(self, amps):
-        self.electronicLoad.write("CURR:STAT:L1 MAX " + str(amps))  # Set the MAX current of Channel L1
+        self._write("CURR:STAT:L1 MAX " + str(amps))  # Set the MAX current of Channel L1
 
     def getCCcurrentL1MAX(self):
         return  self.electronicLoad.query("CURR:STAT:L1? MAX")
@@ -168,6 +419,10 @@ class ElectronicLoadController:
     def getPower(self):
         return self.electronicLoad.query("FETCH:POW?") # Power reading from electronic load
 
+    def fetch_all(self) -> tuple[float, ...]:
+        # Volt, current and power reading from electronic load in one query
+        return _parse_readings(self.electronicLoad.query("FETCH:VOLT?;CURR?;POW?"))
+
     def checkDeviceConnection(self):
         print(self.electronicLoad.query("*IDN?")) # Read the name of the connected device
 
@@ -175,37 +430,22 @@ class ElectronicLoadController:
 
     # Function that sets the maximum current for the electronic load
     def setMaxCurrent(self, amps):
-        self.electronicLoad.write("VOLT:STAT:ILIM " + str(amps))
+        self._write("VOLT:STAT:ILIM " + str(amps))
 
     def dischargeCV(self, volts):
-        # Turn output off
-        self.electronicLoad.write("LOAD:STAT:OFF")
-        # Switch to CV mode
-        self.electronicLoad.write("MODE CVH")
-        # Set the constant voltage
-        self.electronicLoad.write("VOLT:STAT:L1 " + str(volts))
-        # Turn on output for connected channel
-        self.electronicLoad.write("LOAD:STAT ON")
+        # Turn output off, switch to CV mode, set the constant voltage and
+        # turn on output for connected channel in a single write
+        self.batch().add("dischargeCV", volts=volts).send()
 
     def dischargeCC(self, amps):
-        # Turn output off
-        self.electronicLoad.write("LOAD:STAT:OFF")
-        # Switch to CC mode
-        self.electronicLoad.write("MODE CCL")
-        # Set the desired current
-        self.electronicLoad.write("CURR:STAT:L1 " + str(amps))
-        # Turn on the output
-        self.electronicLoad.write("LOAD:STAT ON")
+        # Turn output off, switch to CC mode, set the desired current and
+        # turn on the output in a single write
+        self.batch().add("dischargeCC", amps=amps).send()
 
     def dischargeCP(self, watts):
-        # Turn output off
-        self.electronicLoad.write("LOAD:STAT:OFF")
-        # Switch to CP mode
-        self.electronicLoad.write("MODE CPH")
-        # Set the desired power
-        self.electronicLoad.write("POW:STAT:L1 " + str(watts))
-        # Turn output on
-        self.electronicLoad.write("LOAD:STAT ON")
+        # Turn output off, switch to CP mode, set the desired power and
+        # turn on the output in a single write
+        self.batch().add("dischargeCP", watts=watts).send()
 
     # # Function to stop the electronic load from discharging the battery
     # def stopDischarge(self):
@@ -216,12 +456,15 @@ class MultimeterController:
     """Read measurements from a Chroma 51101 multimeter."""
     
     # Variable to keep the resource name of the mutimeter
-    multimeterName = "USB0::0x1698::0x083F::TW00014586::INSTR"
+    multimeterName = INSTRUMENT_RESOURCES["multimeter"]
 
-    # Constructor that establishes connection to the multimeter
-    def __init__(self) -> None:
-        self.resourceManager = pyvisa.ResourceManager()
-        self.multimeter = self.resourceManager.open_resource(self.multimeterName)
+    # Constructor that establishes connection to the multimeter
+    def __init__(self) -> None:
+        self.multimeter = TrackedSession(open_session(self.multimeterName))
+
+    # Function that returns the session to the shared pool
+    def close(self) -> None:
+        release_session(self.multimeterName, self.multimeter.failed)
 
     # Function that returns the name of the connected device
     def checkDeviceConnection(self):
@@ -253,3 +496,39 @@ class MultimeterController:
     # Read the temperature using the thermocouple input
     def getThermocoupleTemp(self):
         return self.multimeter.query('MEASure:TCOUple?')
+
+# Class that exposes the methods of a controller as coroutines
+class AsyncController:
+    """Asyncio wrapper running the blocking calls of a controller.
+
+    VISA I/O blocks, so every call is handed to a single worker thread owned
+    by the wrapper. Calls on one instrument therefore stay in order while
+    calls on different instruments run concurrently, e.g.::
+
+        ps, load = await asyncio.gather(asyncPS.fetch_all(), asyncEL.fetch_all())
+    """
+
+    def __init__(self, controller) -> None:
+        from concurrent.futures import ThreadPoolExecutor
+
+        self.controller = controller
+        self._executor = ThreadPoolExecutor(max_workers=1)
+
+    def __getattr__(self, name):
+        attr = getattr(self.controller, name)
+        if not callable(attr):
+            return attr
+
+        async def call(*args, **kwargs):
+            import asyncio
+
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                self._executor, functools.partial(attr, *args, **kwargs)
+            )
+
+        return call
+
+    # Function that stops the worker thread, the controller stays open
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=True)
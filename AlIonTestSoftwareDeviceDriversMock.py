@@ -1,7 +1,23 @@
 """Mock implementations of the device drivers for testing without hardware."""
 
 from random import randrange
-import tkinter
+
+
+class CommandBatchMock:
+    """Replay batched commands on a mock driver by method name."""
+
+    def __init__(self, device) -> None:
+        self.device = device
+        self.calls = []
+
+    def add(self, name: str, **params):
+        self.calls.append((name, params))
+        return self
+
+    def send(self, sync: bool = False) -> None:
+        for name, params in self.calls:
+            getattr(self.device, name)(**params)
+        self.calls = []
 
 # Class for communication with the NI-VISA driver to control the power supply
 class PowerSupplyControllerMock:
@@ -16,6 +32,15 @@ class PowerSupplyControllerMock:
     def checkDeviceConnection(self):
         print("Mock object is connected")
 
+    def batch(self):
+        return CommandBatchMock(self)
+
+    def close(self):
+        pass
+
+    def invalidate_shadow(self):
+        pass
+
     #### VOLTAGE #### VOLTAGE #### VOLTAGE #### VOLTAGE ####
     # Functions that allow user to set the maximum voltage, current and power for safety
     def setVoltage(self, volts : float):
@@ -66,6 +91,9 @@ class PowerSupplyControllerMock:
 
     def getPower(self):
         return randrange(int(self.Power_limmax * 10000000)) / 100000000
+
+    def fetch_all(self):
+        return self.getVoltage(), self.getCurrent(), self.getPower()
         
 
     # Function for constant CURRENT charging, taking in current in amps
@@ -104,6 +132,15 @@ class ElectronicLoadControllerMock:
     def checkDeviceConnection(self):
         print("Mock object is connected")
 
+    def batch(self):
+        return CommandBatchMock(self)
+
+    def close(self):
+        pass
+
+    def invalidate_shadow(self):
+        pass
+
     def startDischarge(self):
         pass
 
@@ -149,6 +186,9 @@ class ElectronicLoadControllerMock:
     def getPower(self):
         return randrange(int(self.maxPower * 10000000)) / 10000000
 
+    def fetch_all(self):
+        return self.getVoltage(), self.getCurrent(), self.getPower()
+
 
     def dischargeCV(self, volts):
         pass
@@ -169,6 +209,8 @@ class MultimeterControllerMock:
     def checkDeviceConnection(self):
         print("Mock object is connected")
 
+    def close(self):
+        pass
 
     def getTemperature(self):
         return randrange(10000000) / 10000000
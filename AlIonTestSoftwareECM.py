@@ -0,0 +1,456 @@
+"""Equivalent circuit model (ECM) fitting of pulse traces.
+
+The cell is modelled as an ohmic resistance ``R0`` in series with ``n`` RC
+elements. For a rectangular current pulse of height ``I`` and duration
+``T`` every RC element contributes
+
+    u_j(t) = R_j * I * (1 - exp(-t / tau_j))                      0 <= t < T
+    u_j(t) = R_j * I * (1 - exp(-T / tau_j)) * exp(-(t - T) / tau_j)   t >= T
+
+and the terminal voltage is ``ocv - R0 * i(t) - sum(u_j)`` with the measured
+current step ``i(t)``. For fixed time constants the model is linear in
+``ocv``, ``R0`` and ``R_j``, which are solved in closed form; only the time
+constants are searched, first on a grid and then with Levenberg-Marquardt
+steps. All pulses of a batch are fitted at once as padded arrays.
+
+The pulses of saved internal resistance and HPPC results are fitted with::
+
+    python AlIonTestSoftwareECM.py --test hppc_test --rc 2 -o ecm.csv
+
+which writes one row of parameters per pulse keyed by temperature and SOC;
+:func:`load_parameters` reads the table back.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+import argparse
+import csv
+import itertools
+import json
+import os
+import re
+
+from AlIonTestSoftwareDataManagement import load_run
+from AlIonTestSoftwareICA import phase_slices
+from AlIonTestSoftwareIntegration import cumulative
+
+# Phases holding one pulse: internal_resistance_test and hppc_test
+PULSE_PHASE = re.compile(r"pulse|soc\d+_(dis)?charge")
+# Range of the fitted time constants in seconds
+TAU_MIN = 0.005
+TAU_MAX = 10000.0
+
+
+def find_pulse(t, c):
+    """Locate the current pulse in a trace.
+
+    The rest current is the median of the first samples, the pulse spans
+    the samples that differ from it by at least half the largest change.
+    Returns ``(on, off, rest_current, step)`` with the switching times and
+    the settled current change, or ``None`` without a pulse.
+    """
+    import numpy as np
+
+    t = np.asarray(t, dtype=np.float64)
+    c = np.asarray(c, dtype=np.float64)
+    if len(c) < 3:
+        return None
+    rest = float(np.median(c[: max(len(c) // 200, 5)]))
+    deviation = np.abs(c - rest)
+    peak = float(np.percentile(deviation, 99))
+    inside = np.flatnonzero(deviation >= 0.5 * peak) if peak > 0 else []
+    if len(inside) == 0 or inside[0] == 0:
+        return None
+    first, last = inside[0], inside[-1]
+    off = t[last + 1] if last + 1 < len(t) else t[last]
+    step = float(np.median(c[first:last + 1])) - rest
+    return float(t[first]), float(off), rest, step
+
+
+def pulse_data(t, v, c, sign: float = 1.0, points: int = 400) -> dict | None:
+    """Prepare a pulse trace for :func:`fit_pulses`.
+
+    ``sign`` is ``1`` when a positive current lowers the voltage
+    (discharge) and ``-1`` for charge pulses. About ``points`` samples are
+    kept, spaced logarithmically after switching on and off so the fast
+    response keeps its resolution. Returns ``None`` without a pulse.
+    """
+    import numpy as np
+
+    found = find_pulse(t, c)
+    if found is None:
+        return None
+    on, off, rest, step = found
+    t = np.asarray(t, dtype=np.float64) - on
+    duration = off - on
+    relax = max(t[-1] - duration, 1e-3)
+    targets = np.concatenate([
+        np.linspace(t[0], 0.0, 10, endpoint=False),
+        np.geomspace(1e-4, max(duration, 1e-3), points // 2),
+        duration + np.geomspace(1e-4, relax, points // 2),
+    ])
+    keep = np.unique(np.clip(np.searchsorted(t, targets), 0, len(t) - 1))
+    return {
+        "t": t[keep],
+        "v": np.asarray(v, dtype=np.float64)[keep],
+        "di": sign * (np.asarray(c, dtype=np.float64)[keep] - rest),
+        "step": sign * step,
+        "duration": duration,
+    }
+
+
+def _basis(t, duration, tau):
+    """Unit response of an RC element to the rectangular pulse."""
+    import numpy as np
+
+    on = 1.0 - np.exp(-np.clip(t, 0.0, None) / tau)
+    relaxed = (1.0 - np.exp(-duration / tau)) * np.exp(-np.clip(t - duration, 0.0, None) / tau)
+    return np.where(t < 0, 0.0, np.where(t < duration, on, relaxed))
+
+
+def _batch(pulses) -> dict:
+    """Pad the pulses to arrays of equal length with a sample mask."""
+    import numpy as np
+
+    length = max(len(p["t"]) for p in pulses)
+    batch = {"t": np.zeros((len(pulses), length)), "mask": np.zeros((len(pulses), length))}
+    batch["v"] = np.zeros_like(batch["t"])
+    batch["di"] = np.zeros_like(batch["t"])
+    for i, p in enumerate(pulses):
+        n = len(p["t"])
+        for key in ("t", "v", "di"):
+            batch[key][i, :n] = p[key]
+        batch["mask"][i, :n] = 1.0
+    batch["step"] = np.array([p["step"] for p in pulses])[:, None]
+    batch["duration"] = np.array([p["duration"] for p in pulses])[:, None]
+    return batch
+
+
+def _solve(batch, taus):
+    """Least squares ``ocv``, ``R0`` and ``R_j`` for time constants ``taus``.
+
+    ``taus`` has one row per pulse. Returns the coefficients, the masked
+    residuals and their sum of squares.
+    """
+    import numpy as np
+
+    pulses, n_rc = taus.shape
+    x = np.empty(batch["t"].shape + (2 + n_rc,))
+    x[..., 0] = 1.0
+    x[..., 1] = -batch["di"]
+    for j in range(n_rc):
+        x[..., 2 + j] = -batch["step"] * _basis(batch["t"], batch["duration"], taus[:, j, None])
+    weighted = x * batch["mask"][..., None]
+    a = weighted.transpose(0, 2, 1) @ x
+    b = weighted.transpose(0, 2, 1) @ batch["v"][..., None]
+    # A small ridge keeps nearly equal time constants solvable
+    ridge = 1e-12 * np.trace(a, axis1=1, axis2=2)[:, None, None] + 1e-15
+    coef = np.linalg.solve(a + ridge * np.eye(2 + n_rc), b)[..., 0]
+    residual = (batch["v"] - (x @ coef[..., None])[..., 0]) * batch["mask"]
+    return coef, residual, (residual * residual).sum(axis=1)
+
+
+def _grid(batch, n_rc: int, points: int):
+    """Best ascending combination of grid time constants for every pulse."""
+    import numpy as np
+
+    span = float((batch["t"] * batch["mask"]).max())
+    grid = np.geomspace(TAU_MIN, max(2.0 * span, 10.0 * TAU_MIN), points)
+    pulses = batch["t"].shape[0]
+    best = np.full(pulses, np.inf)
+    taus = np.zeros((pulses, n_rc))
+    for combo in itertools.combinations(grid, n_rc):
+        trial = np.broadcast_to(np.array(combo), (pulses, n_rc))
+        _, _, sse = _solve(batch, trial)
+        better = sse < best
+        best[better] = sse[better]
+        taus[better] = combo
+    return taus
+
+
+def fit_pulses(pulses, n_rc: int = 2, initial=None, iterations: int = 30, grid: int = 16) -> list:
+    """Fit an ``n_rc`` element ECM to every pulse of :func:`pulse_data`.
+
+    Parameters
+    ----------
+    pulses : sequence of dict or None
+        Prepared pulses; ``None`` entries give ``None`` results.
+    n_rc : int, optional
+        Number of RC elements.
+    initial : array_like, optional
+        Starting time constants, one row for all pulses or one per pulse,
+        e.g. from a previous fit of the same cell. Without them every pulse
+        starts from the best combination of ``grid`` time constants.
+    iterations : int, optional
+        Maximum Levenberg-Marquardt steps.
+
+    Returns
+    -------
+    list of dict
+        ``ocv``, ``r0``, ``r1``, ``tau1``, ``c1`` (farad), ... and the
+        residual ``rms`` in volts per pulse, time constants ascending.
+    """
+    import numpy as np
+
+    index = [i for i, p in enumerate(pulses) if p is not None and len(p["t"]) > n_rc + 2]
+    results = [None] * len(pulses)
+    if not index:
+        return results
+    batch = _batch([pulses[i] for i in index])
+    if initial is None:
+        taus = _grid(batch, n_rc, grid)
+    else:
+        taus = np.broadcast_to(np.asarray(initial, dtype=np.float64), (len(index), n_rc))
+    bounds = np.log(TAU_MIN), np.log(TAU_MAX)
+    theta = np.clip(np.log(taus), *bounds)
+    coef, residual, sse = _solve(batch, np.exp(theta))
+    damping = np.full(len(index), 1e-2)
+    h = 1e-4
+    for _ in range(iterations):
+        # Forward difference Jacobian of the residuals in log(tau)
+        jacobian = np.empty(residual.shape + (n_rc,))
+        for j in range(n_rc):
+            shifted = theta.copy()
+            shifted[:, j] += h
+            jacobian[..., j] = (_solve(batch, np.exp(shifted))[1] - residual) / h
+        jtj = jacobian.transpose(0, 2, 1) @ jacobian
+        gradient = jacobian.transpose(0, 2, 1) @ residual[..., None]
+        diagonal = np.einsum("pii->pi", jtj) + 1e-12
+        lhs = jtj + damping[:, None, None] * (diagonal[:, :, None] * np.eye(n_rc))
+        step = -np.linalg.solve(lhs, gradient)[..., 0]
+        trial = np.clip(theta + step, *bounds)
+        trial_coef, trial_residual, trial_sse = _solve(batch, np.exp(trial))
+        better = trial_sse < sse
+        theta[better] = trial[better]
+        coef[better] = trial_coef[better]
+        residual[better] = trial_residual[better]
+        sse[better] = trial_sse[better]
+        damping = np.where(better, damping / 3.0, damping * 4.0)
+        if np.all((np.abs(step).max(axis=1) < 1e-6) | (damping > 1e8)):
+            break
+
+    counts = batch["mask"].sum(axis=1)
+    for row, i in enumerate(index):
+        taus = np.exp(theta[row])
+        order = np.argsort(taus)
+        result = {"ocv": float(coef[row, 0]), "r0": float(coef[row, 1])}
+        for j, k in enumerate(order, 1):
+            r = float(coef[row, 2 + k])
+            result[f"r{j}"] = r
+            result[f"tau{j}"] = float(taus[k])
+            result[f"c{j}"] = float(taus[k] / r) if r > 0 else None
+        result["rms"] = float(np.sqrt(sse[row] / counts[row]))
+        results[i] = result
+    return results
+
+
+def format_ecm(fit: dict | None) -> str:
+    """Return a one line summary of a :func:`fit_pulses` result."""
+    if fit is None:
+        return "ECM: no pulse to fit"
+    parts = [f"R0 {fit['r0'] * 1000:.2f} mOhm"]
+    j = 1
+    while f"r{j}" in fit:
+        parts.append(f"R{j} {fit[f'r{j}'] * 1000:.2f} mOhm tau{j} {fit[f'tau{j}']:.3g} s")
+        j += 1
+    return f"ECM: {', '.join(parts)}, rms {fit['rms'] * 1000:.2f} mV"
+
+
+def _read_result(filePath: str):
+    """Return the columns, phase summary and temperature of a result."""
+    if os.path.isdir(filePath + ".run"):
+        run = load_run(filePath + ".run", ["time_s", "volts", "current"])
+        metadata = run.metadata or {}
+        return run.columns, metadata.get("phases"), metadata.get("temperature")
+    import pandas as pd
+
+    titles = {"Time [s]": "time_s", "Volts": "volts", "Current": "current"}
+    df = pd.read_csv(filePath + ".csv", usecols=list(titles))
+    phases = None
+    if os.path.exists(filePath + ".summary.json"):
+        with open(filePath + ".summary.json", encoding="utf-8") as f:
+            phases = json.load(f)
+    # The temperature is part of the result name, e.g. "_@20.0°C_"
+    match = re.search(r"_@(-?[\d.]+)°C_", os.path.basename(filePath))
+    temperature = float(match.group(1)) if match else None
+    return {titles[c]: df[c].to_numpy() for c in df.columns}, phases, temperature
+
+
+def run_pulses(filePath: str, capacity_ah: float | None = None) -> list:
+    """Return every pulse of a saved result with its state of charge.
+
+    The charge removed before each pulse is integrated from the current,
+    counting charge phases as negative. The SOC is relative to
+    ``capacity_ah``, by default the total charge removed during the run,
+    which assumes an HPPC run from full charge down to the cut-off
+    voltage. Single pulse results are at SOC ``None`` without a capacity.
+    """
+    import numpy as np
+
+    columns, phases, temperature = _read_result(filePath)
+    time_s = np.asarray(columns["time_s"], dtype=np.float64)
+    volts = np.asarray(columns["volts"], dtype=np.float64)
+    current = np.asarray(columns["current"], dtype=np.float64)
+    slices = phase_slices(time_s, phases)
+    if not phases and len(slices) == 1:
+        # Results saved without a phase summary hold a single pulse
+        slices = [("pulse", slices[0][1])]
+    signed = current.copy()
+    labels = np.zeros(len(time_s), dtype=np.int64)
+    for i, (name, part) in enumerate(slices):
+        labels[part] = i
+        if name.endswith("_charge"):
+            signed[part] *= -1.0
+    removed = cumulative(time_s, signed, labels)
+    capacity = capacity_ah
+    if capacity is None and len(slices) > 1:
+        capacity = float(removed.max())
+
+    pulses = []
+    for name, part in slices:
+        if not PULSE_PHASE.fullmatch(name) or part.stop - part.start < 3:
+            continue
+        charge = name.endswith("_charge")
+        data = pulse_data(
+            time_s[part], volts[part], current[part], -1.0 if charge else 1.0
+        )
+        if data is None:
+            continue
+        start = float(removed[part.start])
+        pulses.append({
+            "path": filePath,
+            "phase": name,
+            "pulse": "charge" if charge else "discharge",
+            "temperature": temperature,
+            "removed_ah": start,
+            "soc": 1.0 - start / capacity if capacity else None,
+            "current": abs(data["step"]),
+            "duration": data["duration"],
+            "data": data,
+        })
+    return pulses
+
+
+def fit_run(filePath: str, n_rc: int = 2, capacity_ah: float | None = None, initial=None) -> list:
+    """Fit all pulses of one saved result, see :func:`fit_pulses`.
+
+    Returns one parameter row per pulse.
+    """
+    pulses = run_pulses(filePath, capacity_ah)
+    fits = fit_pulses([p.pop("data") for p in pulses], n_rc, initial)
+    return [{**p, **fit} for p, fit in zip(pulses, fits) if fit is not None]
+
+
+def _fit_job(job):
+    return fit_run(*job)
+
+
+def ecm_runs(
+    runs,
+    n_rc: int = 2,
+    processes: int | None = None,
+    capacity_ah: float | None = None,
+    initial=None,
+) -> list:
+    """Fit the pulses of several saved results.
+
+    ``runs`` holds result paths without extension or records returned by
+    :meth:`RunCatalog.query`. The results are fitted by ``processes``
+    worker processes, by default one per CPU. Returns the parameter rows
+    sorted by temperature and descending SOC.
+    """
+    paths = [run["path"] if isinstance(run, dict) else run for run in runs]
+    jobs = [(path, n_rc, capacity_ah, initial) for path in paths]
+    if processes == 1 or len(jobs) < 2:
+        rows = list(map(_fit_job, jobs))
+    else:
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            rows = list(pool.map(_fit_job, jobs))
+    rows = [row for run in rows for row in run]
+
+    def key(row):
+        temperature = row["temperature"]
+        soc = row["soc"]
+        return (
+            temperature is None, temperature or 0.0,
+            soc is None, -(soc or 0.0), row["removed_ah"],
+        )
+
+    return sorted(rows, key=key)
+
+
+def parameter_columns(n_rc: int) -> list:
+    """Column names of a parameter table with ``n_rc`` RC elements."""
+    columns = ["temperature", "soc", "removed_ah", "pulse", "current", "duration", "ocv", "r0"]
+    for j in range(1, n_rc + 1):
+        columns += [f"r{j}", f"tau{j}", f"c{j}"]
+    return columns + ["rms", "phase", "path"]
+
+
+def write_parameters(path: str, rows, n_rc: int = 2) -> None:
+    """Write fitted parameter rows as a CSV table, see :func:`load_parameters`."""
+    columns = parameter_columns(n_rc)
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(columns)
+        for row in rows:
+            writer.writerow(
+                "" if row.get(c) is None else
+                f"{row[c]:.6g}" if isinstance(row[c], float) else row[c]
+                for c in columns
+            )
+
+
+def load_parameters(path: str) -> list:
+    """Read a table written by :func:`write_parameters`.
+
+    Returns one dictionary per row with numbers as floats and empty cells
+    as ``None``, in the order of the file (by temperature and SOC).
+    """
+    def value(text):
+        if text == "":
+            return None
+        try:
+            return float(text)
+        except ValueError:
+            return text
+
+    with open(path, newline="", encoding="utf-8") as f:
+        return [{k: value(v) for k, v in row.items()} for row in csv.DictReader(f)]
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="ECM parameters of saved pulse tests")
+    parser.add_argument("results", nargs="*", help="result paths without extension")
+    parser.add_argument("--test", dest="test_name",
+                        help="fit all catalogued runs of this test, e.g. hppc_test")
+    parser.add_argument("--rc", type=int, default=2, help="number of RC elements (default: 2)")
+    parser.add_argument("--capacity", type=float,
+                        help="cell capacity in Ah for the SOC (default: charge removed in each run)")
+    parser.add_argument("--initial", help="warm start from the time constants of this table")
+    parser.add_argument("-o", "--output", default="ecm.csv", help="CSV file to write")
+    parser.add_argument("--processes", type=int)
+    args = parser.parse_args(argv)
+
+    runs = list(args.results)
+    if args.test_name:
+        from AlIonTestSoftwareCatalog import RunCatalog
+
+        with RunCatalog() as catalog:
+            runs += [run["path"] for run in reversed(catalog.query(test_name=args.test_name))]
+    if not runs:
+        parser.error("no results given")
+    initial = None
+    if args.initial:
+        import numpy as np
+
+        previous = load_parameters(args.initial)
+        initial = np.median(
+            [[row[f"tau{j}"] for j in range(1, args.rc + 1)] for row in previous], axis=0
+        )
+    rows = ecm_runs(runs, args.rc, args.processes, args.capacity, initial)
+    write_parameters(args.output, rows, args.rc)
+    print(f"Wrote ECM parameters of {len(rows)} pulses from {len(runs)} runs to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
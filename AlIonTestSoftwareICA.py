@@ -0,0 +1,317 @@
+"""Incremental capacity analysis (dQ/dV and dV/dQ) of saved runs.
+
+Every charge or discharge curve is resampled onto a voltage grid shared by
+all curves, so a whole cycle-life campaign is differentiated and smoothed
+as one two-dimensional array::
+
+    python AlIonTestSoftwareICA.py --test ups --phase discharge -o ica.csv
+
+or from Python::
+
+    from AlIonTestSoftwareCatalog import RunCatalog
+    from AlIonTestSoftwareICA import ica_runs
+
+    result = ica_runs(RunCatalog().query(test_name="ups"), phase="discharge")
+    result["voltage"], result["dqdv"]  # grid and one row per run
+
+``DataStorage.icaExport`` runs the analysis on every saved result and
+writes it to a ``.ica.csv`` file next to it.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+import argparse
+import csv
+import json
+import os
+
+from AlIonTestSoftwareDataManagement import load_run
+from AlIonTestSoftwareIntegration import cumulative
+
+# Smoothing applied to the derivatives, see smoothing_kernel
+SMOOTHING = ("none", "moving", "gaussian", "savgol")
+
+
+def smoothing_kernel(method: str = "gaussian", window: int = 9):
+    """Return the convolution kernel of a smoothing method.
+
+    ``window`` is the kernel length in bins and is rounded up to an odd
+    number. ``"savgol"`` is a quadratic Savitzky-Golay filter. Returns
+    ``None`` for ``"none"`` or a window of one bin.
+    """
+    import numpy as np
+
+    if method not in SMOOTHING:
+        raise ValueError(f"Unknown smoothing {method!r}, use one of {', '.join(SMOOTHING)}")
+    window = int(window) | 1
+    if method == "none" or window < 3:
+        return None
+    half = window // 2
+    x = np.arange(-half, half + 1, dtype=np.float64)
+    if method == "moving":
+        kernel = np.ones(window)
+    elif method == "gaussian":
+        # The window spans about +-2.5 standard deviations
+        kernel = np.exp(-0.5 * (x / (window / 5.0)) ** 2)
+    else:
+        # Least squares quadratic fit evaluated at the centre bin
+        vander = np.vander(x, 3, increasing=True)
+        return np.linalg.pinv(vander)[0]
+    return kernel / kernel.sum()
+
+
+def smooth(values, method: str = "gaussian", window: int = 9):
+    """Smooth ``values`` along the last axis.
+
+    Bins whose window reaches past the end of a curve, or into a missing
+    (NaN) bin, become NaN, so every row of a batch keeps its own range.
+    """
+    import numpy as np
+    from numpy.lib.stride_tricks import sliding_window_view
+
+    kernel = smoothing_kernel(method, window)
+    values = np.asarray(values, dtype=np.float64)
+    if kernel is None:
+        return values
+    half = len(kernel) // 2
+    pad = [(0, 0)] * (values.ndim - 1) + [(half, half)]
+    padded = np.pad(values, pad, constant_values=np.nan)
+    return sliding_window_view(padded, len(kernel), axis=-1) @ kernel
+
+
+def _resample(x, y, grid):
+    """Interpolate the curve ``y(x)`` at ``grid``, NaN outside its range.
+
+    Curves with falling ``x`` are reversed and noise that makes ``x`` step
+    back is flattened so ``x`` is non-decreasing.
+    """
+    import numpy as np
+
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    if len(x) < 2:
+        return np.full(len(grid), np.nan)
+    if x[-1] < x[0]:
+        x, y = x[::-1], y[::-1]
+    x = np.maximum.accumulate(x)
+    return np.interp(grid, x, y, left=np.nan, right=np.nan)
+
+
+def ica_curves(
+    curves,
+    bin_width: float = 0.005,
+    capacity_points: int = 1000,
+    smoothing: str = "gaussian",
+    window: int = 9,
+) -> dict:
+    """Compute dQ/dV and dV/dQ of several ``(volts, capacity)`` curves.
+
+    Parameters
+    ----------
+    curves : sequence of (array, array)
+        Voltage and accumulated capacity in Ah of every curve, e.g. one
+        discharge per cycle. The capacity must grow along the curve.
+    bin_width : float, optional
+        Width of the voltage bins in volts.
+    capacity_points : int, optional
+        Number of capacity bins between zero and the largest capacity.
+    smoothing, window : optional
+        Smoothing applied to the derivatives, see :func:`smoothing_kernel`.
+
+    Returns
+    -------
+    dict
+        ``voltage`` and ``capacity`` hold the bin centres, ``dqdv`` (Ah/V)
+        and ``dvdq`` (V/Ah) one row per curve with NaN outside its range.
+        dQ/dV is negative for discharge curves, where the voltage falls as
+        the capacity grows.
+    """
+    import numpy as np
+
+    curves = [
+        (np.asarray(v, dtype=np.float64), np.asarray(q, dtype=np.float64))
+        for v, q in curves
+    ]
+    rows = [(v, q) for v, q in curves if len(v) > 1]
+    if not rows:
+        empty = np.empty((len(curves), 0))
+        return {"voltage": np.empty(0), "dqdv": empty, "capacity": np.empty(0), "dvdq": empty}
+    v_min = min(float(v.min()) for v, _ in rows)
+    v_max = max(float(v.max()) for v, _ in rows)
+    start = np.floor(v_min / bin_width) * bin_width
+    voltage = np.arange(start, v_max + bin_width, bin_width)
+    q_max = max(float(q.max()) for _, q in rows)
+    capacity = np.linspace(0.0, q_max, max(int(capacity_points), 2))
+
+    charge = np.vstack([_resample(v, q, voltage) for v, q in curves])
+    volts = np.vstack([_resample(q, v, capacity) for v, q in curves])
+    dqdv = np.gradient(charge, voltage, axis=1) if len(voltage) > 1 else charge * np.nan
+    # Without any capacity, e.g. a phase at zero current, V(Q) is undefined
+    dvdq = np.gradient(volts, capacity, axis=1) if q_max > 0 else volts * np.nan
+    return {
+        "voltage": voltage,
+        "dqdv": smooth(dqdv, smoothing, window),
+        "capacity": capacity,
+        "dvdq": smooth(dvdq, smoothing, window),
+    }
+
+
+def _read_columns(filePath: str):
+    """Return the columns and phase summary of a result without extension."""
+    if os.path.isdir(filePath + ".run"):
+        run = load_run(filePath + ".run", ["time_s", "volts", "current"])
+        return run.columns, run.metadata.get("phases")
+    import pandas as pd
+
+    titles = {"Time [s]": "time_s", "Volts": "volts", "Current": "current"}
+    df = pd.read_csv(filePath + ".csv", usecols=list(titles))
+    phases = None
+    if os.path.exists(filePath + ".summary.json"):
+        with open(filePath + ".summary.json", encoding="utf-8") as f:
+            phases = json.load(f)
+    return {titles[c]: df[c].to_numpy() for c in df.columns}, phases
+
+
+def phase_slices(time_s, phases=None) -> list:
+    """Return ``(name, slice)`` for the phases of a run.
+
+    ``phases`` is the per-phase summary written with the run (see
+    :meth:`DataStorage.phaseSummary`). Runs saved without it are split
+    where the time column restarts; two such segments are named
+    ``"charge"`` and ``"discharge"`` as in the UPS test.
+    """
+    import numpy as np
+
+    if phases:
+        result = []
+        start = 0
+        for phase in phases:
+            stop = start + phase["samples"]
+            result.append((phase["phase"], slice(start, stop)))
+            start = stop
+        return result
+    breaks = np.flatnonzero(np.diff(np.asarray(time_s)) < 0) + 1
+    bounds = [0] + breaks.tolist() + [len(time_s)]
+    names = ("charge", "discharge") if len(bounds) == 3 else None
+    return [
+        (names[i] if names else str(i), slice(bounds[i], bounds[i + 1]))
+        for i in range(len(bounds) - 1)
+    ]
+
+
+def run_curve(filePath: str, phase: str = "discharge"):
+    """Return the ``(volts, capacity)`` curve of ``phase`` in a saved result.
+
+    Every phase whose name starts with ``phase`` is included, except the
+    constant voltage steps (``*_cv``) unless ``phase`` names one: their
+    capacity grows at a flat voltage and would show up as a false dQ/dV
+    peak at the charge voltage. ``"charge"`` therefore selects the CC step
+    of a CC-CV charge. The capacity is integrated from the current within
+    each phase. Returns empty arrays when the result has no such phase.
+    """
+    import numpy as np
+
+    columns, phases = _read_columns(filePath)
+    time_s = np.asarray(columns["time_s"], dtype=np.float64)
+    rows = np.zeros(len(time_s), dtype=bool)
+    labels = np.zeros(len(time_s), dtype=np.int64)
+    for i, (name, part) in enumerate(phase_slices(time_s, phases)):
+        labels[part] = i
+        if name.startswith(phase) and (name == phase or not name.endswith("_cv")):
+            rows[part] = True
+    volts = np.asarray(columns["volts"], dtype=np.float64)[rows]
+    current = np.abs(np.asarray(columns["current"], dtype=np.float64)[rows])
+    return volts, cumulative(time_s[rows], current, labels[rows])
+
+
+def _curve_job(job):
+    return run_curve(*job)
+
+
+def ica_runs(runs, phase: str = "discharge", processes: int | None = None, **options) -> dict:
+    """Run :func:`ica_curves` on one phase of several saved results.
+
+    ``runs`` holds result paths without extension or records returned by
+    :meth:`RunCatalog.query`. The curves are read by ``processes`` worker
+    processes, by default one per CPU. The result also lists the ``runs``
+    in the order of the rows.
+    """
+    paths = [run["path"] if isinstance(run, dict) else run for run in runs]
+    jobs = [(path, phase) for path in paths]
+    if processes == 1 or len(jobs) < 2:
+        curves = list(map(_curve_job, jobs))
+    else:
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            curves = list(pool.map(_curve_job, jobs, chunksize=4))
+    result = ica_curves(curves, **options)
+    result["runs"] = paths
+    return result
+
+
+def write_ica_csv(path: str, result: dict, labels=None) -> None:
+    """Write a result of :func:`ica_curves` as a long table.
+
+    Every row holds the curve label, the derivative (``dQ/dV`` or
+    ``dV/dQ``), the bin centre and the value; NaN bins are left out.
+    """
+    import numpy as np
+
+    labels = labels if labels is not None else result.get("runs", range(len(result["dqdv"])))
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["Curve", "Derivative", "X", "Value"])
+        for label, dqdv, dvdq in zip(labels, result["dqdv"], result["dvdq"]):
+            for name, x, values in (
+                ("dQ/dV", result["voltage"], dqdv),
+                ("dV/dQ", result["capacity"], dvdq),
+            ):
+                keep = ~np.isnan(values)
+                writer.writerows(
+                    (label, name, f"{a:.6g}", f"{b:.6g}") for a, b in zip(x[keep], values[keep])
+                )
+
+
+def export_result(filePath: str, phases=None, **options) -> str:
+    """Write ``<filePath>.ica.csv`` with the derivatives of every phase.
+
+    Used by ``DataStorage.icaExport``; the phases default to ``charge`` and
+    ``discharge``, see :func:`run_curve` for how CV steps are left out.
+    """
+    phases = phases or ("charge", "discharge")
+    curves = [run_curve(filePath, phase) for phase in phases]
+    output = filePath + ".ica.csv"
+    write_ica_csv(output, ica_curves(curves, **options), phases)
+    return output
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="dQ/dV and dV/dQ of saved test runs")
+    parser.add_argument("results", nargs="*", help="result paths without extension")
+    parser.add_argument("--test", dest="test_name", help="analyse all catalogued runs of this test")
+    parser.add_argument("--phase", default="discharge", help="phase name prefix (default: discharge)")
+    parser.add_argument("--bin-width", type=float, default=0.005, help="voltage bin in V")
+    parser.add_argument("--capacity-points", type=int, default=1000)
+    parser.add_argument("--smoothing", choices=SMOOTHING, default="gaussian")
+    parser.add_argument("--window", type=int, default=9, help="smoothing window in bins")
+    parser.add_argument("-o", "--output", default="ica.csv", help="CSV file to write")
+    parser.add_argument("--processes", type=int)
+    args = parser.parse_args(argv)
+
+    runs = list(args.results)
+    if args.test_name:
+        from AlIonTestSoftwareCatalog import RunCatalog
+
+        with RunCatalog() as catalog:
+            runs += [run["path"] for run in reversed(catalog.query(test_name=args.test_name))]
+    if not runs:
+        parser.error("no results given")
+    result = ica_runs(
+        runs, args.phase, args.processes,
+        bin_width=args.bin_width, capacity_points=args.capacity_points,
+        smoothing=args.smoothing, window=args.window,
+    )
+    write_ica_csv(args.output, result)
+    print(f"Wrote dQ/dV and dV/dQ of {len(runs)} runs to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""Trapezoidal capacity and energy integration over recorded sample times.
+
+:class:`Integrator` accumulates Ah and Wh sample by sample while a test is
+running; :func:`integrate` and :func:`cumulative` compute the same values
+from stored columns, e.g. to recompute archived runs. Both use the time of
+every sample rather than a nominal sampling interval.
+"""
+
+
+class Integrator:
+    """Running trapezoidal integral of current and power.
+
+    Call :meth:`add` with the elapsed time, current and voltage of every
+    sample. Each call adds the trapezoid between the previous sample and the
+    new one, so slow instrument queries do not skew the result. A sample
+    whose time is not after the previous one starts a new segment, so the
+    gap is not integrated.
+    """
+
+    def __init__(self, ah: float = 0.0, wh: float = 0.0) -> None:
+        self.ah = ah
+        self.wh = wh
+        self._last = None
+
+    def add(self, t: float, current: float, volts: float) -> None:
+        power = current * volts
+        if self._last is not None:
+            t0, c0, p0 = self._last
+            dt = t - t0
+            if dt > 0:
+                self.ah += (c0 + current) * dt / 7200.0
+                self.wh += (p0 + power) * dt / 7200.0
+        self._last = (t, current, power)
+
+    def state(self) -> dict:
+        """Return the totals, e.g. for a journal checkpoint."""
+        return {"ah": self.ah, "wh": self.wh}
+
+
+def _steps(time_s, segments=None):
+    """Return the time steps between samples, zero across segment breaks."""
+    import numpy as np
+
+    dt = np.diff(np.asarray(time_s, dtype=np.float64))
+    dt[dt < 0] = 0.0
+    if segments is not None:
+        segments = np.asarray(segments)
+        dt[segments[1:] != segments[:-1]] = 0.0
+    return dt
+
+
+def cumulative(time_s, values, segments=None):
+    """Running trapezoidal integral of ``values`` in value-hours.
+
+    ``segments`` optionally labels every sample, e.g. with the phase; no
+    area is added between samples of different segments, nor where the time
+    column restarts. ``cumulative(t, current)[-1]`` is the capacity in Ah.
+    """
+    import numpy as np
+
+    values = np.asarray(values, dtype=np.float64)
+    if len(values) == 0:
+        return values
+    area = (values[1:] + values[:-1]) * _steps(time_s, segments) / 7200.0
+    return np.concatenate(([0.0], np.cumsum(area)))
+
+
+def integrate(time_s, current, volts=None, segments=None) -> tuple:
+    """Return ``(Ah, Wh)`` of stored samples, see :func:`cumulative`.
+
+    Wh is ``None`` when no voltage column is given.
+    """
+    import numpy as np
+
+    current = np.asarray(current, dtype=np.float64)
+    if len(current) < 2:
+        return 0.0, (None if volts is None else 0.0)
+    dt = _steps(time_s, segments) / 7200.0
+    ah = float(np.sum((current[1:] + current[:-1]) * dt))
+    if volts is None:
+        return ah, None
+    power = current * np.asarray(volts, dtype=np.float64)
+    return ah, float(np.sum((power[1:] + power[:-1]) * dt))
+
+
+def efficiency_report(charge: Integrator, discharge: Integrator) -> dict:
+    """Charge and discharge totals with coulombic and energy efficiency in %."""
+    return {
+        "charge_ah": charge.ah,
+        "charge_wh": charge.wh,
+        "discharge_ah": discharge.ah,
+        "discharge_wh": discharge.wh,
+        "coulombic_efficiency": discharge.ah / charge.ah * 100.0 if charge.ah > 0 else None,
+        "energy_efficiency": discharge.wh / charge.wh * 100.0 if charge.wh > 0 else None,
+    }
+
+
+def format_report(report: dict) -> str:
+    """Format :func:`efficiency_report` as the lines printed by the tests."""
+
+    def percent(value):
+        return "n/a" if value is None else f"{value:.2f}%"
+
+    return "\n".join((
+        f"Charged: {report['charge_ah']:.3f} Ah, {report['charge_wh']:.3f} Wh",
+        f"Discharged: {report['discharge_ah']:.3f} Ah, {report['discharge_wh']:.3f} Wh",
+        f"Coulombic efficiency: {percent(report['coulombic_efficiency'])}",
+        f"Energy efficiency: {percent(report['energy_efficiency'])}",
+    ))
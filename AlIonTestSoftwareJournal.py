@@ -0,0 +1,147 @@
+"""Write-ahead journal used to resume interrupted long tests."""
+
+from datetime import datetime
+import json
+import os
+import time
+
+from AlIonTestSoftwareDataManagement import data_directory
+
+
+def journal_directory() -> str:
+    """Return the ``Data/journal`` folder, creating it."""
+    path = f"{data_directory()}/journal"
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+class TestJournal:
+    """Append-only record of a running test.
+
+    The first line of the journal names the test and its parameters. Every
+    following line is a checkpoint holding the phase, the accumulated values
+    such as elapsed time and Ah/Wh, and the position of the sample stream
+    (see :meth:`DataStorage.checkpoint`). Lines are synced to disk before
+    the test continues, so after a crash the last complete line is a
+    consistent point to resume from. The journal is removed by
+    :meth:`finish` when the test completes.
+
+    ``phases`` lists the phases of the test in order; :meth:`pending` uses
+    it to skip the phases a resumed test has already completed.
+    """
+
+    def __init__(self, path: str, test: str, params: dict, settings=None, state=None) -> None:
+        self.path = path
+        self.test = test
+        self.params = params
+        # Controller settings recorded at the start, e.g. the multimeter mode
+        self.settings = dict(settings or {})
+        # Last checkpoint, empty for a new test
+        self.state = dict(state or {})
+        self.resumed = bool(self.state)
+        self.phases = ()
+        self.interval = 30.0
+        self._last = time.monotonic()
+        self._file = None
+
+    @classmethod
+    def start(cls, test: str, params: dict, settings=None) -> "TestJournal":
+        """Create a journal for a new run of ``test``."""
+        path = f"{journal_directory()}/{test}_{datetime.now():%y%m%d_%H%M%S}.wal"
+        journal = cls(path, test, params, settings)
+        journal._append({
+            "type": "start",
+            "test": test,
+            "params": params,
+            "settings": journal.settings,
+            "time": time.time(),
+        })
+        return journal
+
+    @classmethod
+    def open(cls, path: str) -> "TestJournal":
+        """Load a journal and its last complete checkpoint."""
+        records = []
+        end = 0
+        with open(path, "rb") as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    break
+                end += len(line)
+        if not records or records[0].get("type") != "start":
+            raise ValueError(f"{path} is not a test journal")
+        # Drop a line torn by the crash so new checkpoints follow a complete one
+        if end != os.path.getsize(path):
+            os.truncate(path, end)
+        state = {}
+        for record in records[1:]:
+            if record.get("type") == "checkpoint":
+                state = record["state"]
+        start = records[0]
+        return cls(path, start["test"], start["params"], start.get("settings"), state)
+
+    @staticmethod
+    def latest() -> str | None:
+        """Return the most recently written journal in ``Data/journal``."""
+        directory = journal_directory()
+        paths = [
+            os.path.join(directory, name)
+            for name in os.listdir(directory)
+            if name.endswith(".wal")
+        ]
+        return max(paths, key=os.path.getmtime, default=None)
+
+    def value(self, name: str, default=0.0, cycle: int = 0):
+        """Return ``name`` from the last checkpoint if it belongs to ``cycle``."""
+        if self.state.get("cycle", 0) != cycle:
+            return default
+        return self.state.get(name, default)
+
+    def pending(self, phase: str, cycle: int = 0) -> bool:
+        """Return ``True`` when ``phase`` of ``cycle`` still has to run."""
+        if not self.resumed:
+            return True
+        done = (self.state.get("cycle", 0), self.phases.index(self.state["phase"]))
+        return (cycle, self.phases.index(phase)) >= done
+
+    def checkpoint(self, phase: str, dataStorage=None, force: bool = False, cycle: int = 0, **values) -> None:
+        """Record the test state, at most once per :attr:`interval` unless forced.
+
+        The rows collected by ``dataStorage`` are synced first so the stream
+        position in the checkpoint is on disk.
+        """
+        now = time.monotonic()
+        if not force and now - self._last < self.interval:
+            return
+        self._last = now
+        state = {"phase": phase, "cycle": cycle, "time": time.time()}
+        state.update(values)
+        if dataStorage is not None:
+            state["storage"] = dataStorage.checkpoint()
+        self.state = state
+        self._append({"type": "checkpoint", "state": state})
+
+    def close(self) -> None:
+        """Close the journal file, keeping it for a later resume."""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def finish(self) -> None:
+        """Remove the journal of a completed test."""
+        self.close()
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+    def _append(self, record: dict) -> None:
+        if self._file is None:
+            self._file = open(self.path, "a", encoding="utf-8")
+        self._file.write(json.dumps(record, default=str) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
@@ -0,0 +1,164 @@
+"""Load many saved runs as one table for cross-run analysis.
+
+Runs are read in parallel by a process pool, from the binary ``.run``
+columns when present and from the CSV file otherwise. Only the requested
+columns are read and samples outside ``time_range`` are dropped while
+loading::
+
+    from AlIonTestSoftwareCatalog import RunCatalog
+    from AlIonTestSoftwareLoader import load_runs
+
+    runs = RunCatalog().query(test_name="ups", temperature=20)
+    table = load_runs(runs, columns=["time_s", "volts"], time_range=(0, 600))
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+import json
+import os
+
+from AlIonTestSoftwareCatalog import RESULT_NAME
+from AlIonTestSoftwareDataManagement import NON_RESULT_SUFFIXES, RUN_COLUMNS, data_directory, load_run
+from AlIonTestSoftwareICA import phase_slices
+
+# CSV column titles of the run columns
+CSV_TITLES = {
+    "time_s": "Time [s]",
+    "volts": "Volts",
+    "current": "Current",
+    "power": "Power",
+    "capacity": "Capacity",
+    "mm_volts": "MM_Volts",
+    "mm_temp": "MM_Temp",
+}
+
+
+def find_runs(directory: str | None = None, test_name: str | None = None) -> list:
+    """Return the saved results below ``directory``, by default ``Data``.
+
+    Prefer :meth:`RunCatalog.query` for large archives, it does not scan
+    the folder.
+    """
+    directory = directory or data_directory()
+    results = set()
+    for root, dirs, files in os.walk(directory):
+        for name in dirs + files:
+            base, ext = os.path.splitext(name)
+            if ext in (".csv", ".run") and not base.endswith(NON_RESULT_SUFFIXES):
+                if test_name is None or base.startswith(test_name + "_"):
+                    results.add(os.path.join(root, base).replace("\\", "/"))
+        dirs[:] = [d for d in dirs if not d.endswith(".run")]
+    return sorted(results)
+
+
+def read_run(filePath: str, columns=None, time_range=None) -> dict:
+    """Read one result into a dictionary of equally long arrays.
+
+    ``filePath`` is the result name without extension. ``columns`` selects
+    run column names (see ``RUN_COLUMNS``), all available ones by default.
+    ``time_range`` is a ``(start, stop)`` tuple in elapsed seconds; either
+    end may be ``None``. The ``cycle`` and ``phase`` columns are added; the
+    phase is the name the test gave it, e.g. ``charge_cv`` or
+    ``soc3_discharge``, taken from the phase summary of the result (see
+    :func:`AlIonTestSoftwareICA.phase_slices`). Results saved without one
+    are split where the time column restarts.
+    """
+    import numpy as np
+
+    metadata = {}
+    if os.path.isdir(filePath + ".run"):
+        run = load_run(filePath + ".run")
+        metadata = run.metadata or {}
+        available = list(run.keys())
+        source = run.columns
+    else:
+        import pandas as pd
+
+        wanted = None if columns is None else set(columns) | {"time_s"}
+        titles = {
+            title: name for name, title in CSV_TITLES.items()
+            if wanted is None or name in wanted
+        }
+        df = pd.read_csv(filePath + ".csv", usecols=lambda c: c in titles)
+        available = [titles[c] for c in df.columns]
+        source = {titles[c]: df[c].to_numpy() for c in df.columns}
+        if os.path.exists(filePath + ".summary.json"):
+            with open(filePath + ".summary.json", encoding="utf-8") as f:
+                metadata = {"phases": json.load(f)}
+    time_s = np.asarray(source["time_s"], dtype=np.float64)
+    selected = [
+        name for name in (columns or available) if name in available
+    ]
+
+    # Rows within the requested time range
+    keep = slice(None)
+    if time_range is not None:
+        start, stop = time_range
+        mask = np.ones(len(time_s), dtype=bool)
+        if start is not None:
+            mask &= time_s >= start
+        if stop is not None:
+            mask &= time_s <= stop
+        keep = np.flatnonzero(mask)
+
+    # Samples the phase summary does not cover have no name
+    phase = np.full(len(time_s), "", dtype=object)
+    for name, part in phase_slices(time_s, metadata.get("phases")):
+        phase[part] = name
+    cycle = metadata.get("cycle")
+    if cycle is None:
+        match = RESULT_NAME.match(os.path.basename(filePath))
+        cycle = int(match["cycle"]) if match else 0
+    data = {name: np.asarray(source[name][keep]) for name in selected}
+    rows = len(phase[keep])
+    data["cycle"] = np.full(rows, cycle, dtype=np.int64)
+    data["phase"] = phase[keep]
+    return data
+
+
+def _read_job(job):
+    filePath, columns, time_range = job
+    return read_run(filePath, columns, time_range)
+
+
+def load_runs(runs, columns=None, time_range=None, processes: int | None = None):
+    """Load several results into one ``pandas.DataFrame``.
+
+    ``runs`` holds result paths without extension, or records returned by
+    :meth:`RunCatalog.query`. The table has a ``run_id`` column with the
+    result name plus the ``cycle`` and ``phase`` columns described in
+    :func:`read_run`. Runs are read by ``processes`` worker processes, by
+    default one per CPU; ``1`` reads them in this process.
+    """
+    import pandas as pd
+
+    paths = [run["path"] if isinstance(run, dict) else run for run in runs]
+    if columns is not None:
+        unknown = set(columns) - {name for name, _, _ in RUN_COLUMNS}
+        if unknown:
+            raise ValueError(f"Unknown columns: {', '.join(sorted(unknown))}")
+        columns = list(columns)
+    jobs = [(path, columns, time_range) for path in paths]
+    if processes == 1 or len(jobs) < 2:
+        results = map(_read_job, jobs)
+    else:
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            results = list(pool.map(_read_job, jobs, chunksize=4))
+    data_dir = data_directory()
+    frames = []
+    for path, data in zip(paths, results):
+        frame = pd.DataFrame(data)
+        # Results below Data are named relative to it, others by file name
+        if os.path.abspath(path).startswith(os.path.abspath(data_dir) + os.sep):
+            run_id = os.path.relpath(path, data_dir).replace("\\", "/")
+        else:
+            run_id = os.path.basename(path)
+        frame.insert(0, "run_id", run_id)
+        frames.append(frame)
+    if not frames:
+        return pd.DataFrame(columns=["run_id"] + (columns or []) + ["cycle", "phase"])
+    table = pd.concat(frames, ignore_index=True)
+    # CSV results lack some columns, keep the run column order
+    order = ["run_id"] + [name for name, _, _ in RUN_COLUMNS] + ["cycle", "phase"]
+    table = table[[c for c in order if c in table.columns]]
+    table["run_id"] = table["run_id"].astype("category")
+    return table
@@ -0,0 +1,122 @@
+"""Burst capture and analysis of current pulses (internal resistance, HPPC).
+
+A pulse is recorded as one trace: a short baseline at the rest current, the
+pulse itself and the relaxation after it. The instruments are polled back
+to back, so the resolution is limited by the bus round trip (a few
+milliseconds over USB or LAN) instead of the sampling interval of the test.
+The resistance after a time ``t`` into the pulse is
+
+    R(t) = |V(t) - V_rest| / |I(t) - I_rest|
+
+``r0`` uses the first sample after the current step (the ohmic part) and
+``r_polarization`` is the rise from ``r0`` to the end of the pulse.
+"""
+
+from array import array
+import time
+
+from AlIonTestSoftwareScheduler import TestAborted, wait_or_abort
+
+# Times into the pulse in seconds at which R(t) is reported
+R_TIMES = (0.01, 0.1, 1.0, 2.0, 10.0, 18.0, 30.0)
+
+
+def capture_burst(read, duration: float, start_ns: int, stop_event=None, interval: float = 0.001):
+    """Poll ``read()`` for ``duration`` seconds as fast as it answers.
+
+    ``read`` returns ``(volts, amps)``. Samples are at least ``interval``
+    seconds apart. Returns arrays of the times in seconds since the
+    monotonic ``start_ns``, taken half way through each query, the volts
+    and the amps. Raises :class:`TestAborted` once ``stop_event`` is set.
+    """
+    t, v, c = array("d"), array("d"), array("d")
+    step = int(interval * 1e9)
+    end = time.monotonic_ns() + int(duration * 1e9)
+    while True:
+        if stop_event is not None and stop_event.is_set():
+            raise TestAborted()
+        before = time.monotonic_ns()
+        volts, amps = read()
+        after = time.monotonic_ns()
+        t.append(((before + after) / 2 - start_ns) / 1e9)
+        v.append(volts)
+        c.append(amps)
+        if after >= end:
+            return t, v, c
+        remaining = min(before + step, end) - time.monotonic_ns()
+        if remaining > 0:
+            wait_or_abort(stop_event, remaining / 1e9)
+
+
+def _resistance(dv: float, di: float) -> float | None:
+    return float(abs(dv / di)) if di else None
+
+
+def pulse_resistance(t, v, c, start: float, stop: float, times=R_TIMES) -> dict:
+    """Resistances of one pulse trace.
+
+    ``start`` and ``stop`` are the times, on the scale of ``t``, at which
+    the pulse was switched on and off. Samples before ``start`` are the
+    baseline. A sample belongs to the step once the current has covered 90 %
+    of the change. Returns the baseline ``ocv`` and ``rest_current``, the
+    settled pulse ``current``, ``r0``, ``r_end``, ``r_polarization``, the
+    ohmic ``r_release`` at the end of the pulse, ``r`` with ``R(t)`` for
+    every entry of ``times`` inside the pulse, ``samples`` and the median
+    ``sample_interval``. Values that cannot be computed are ``None``.
+    """
+    import numpy as np
+
+    t = np.asarray(t, dtype=np.float64)
+    v = np.asarray(v, dtype=np.float64)
+    c = np.asarray(c, dtype=np.float64)
+    base = t < start
+    pulse = (t >= start) & (t < stop)
+    after = t >= stop
+    result = {
+        "ocv": None, "rest_current": None, "current": None, "r0": None,
+        "r_end": None, "r_polarization": None, "r_release": None, "r": {},
+        "samples": int(len(t)),
+        "sample_interval": float(np.median(np.diff(t))) if len(t) > 1 else None,
+    }
+    if not base.any() or not pulse.any():
+        return result
+    v_rest, c_rest = float(v[base].mean()), float(c[base].mean())
+    tp, vp, cp = t[pulse], v[pulse], c[pulse]
+    # The settled pulse current, without the slew at the start
+    c_pulse = float(np.median(cp[len(cp) // 2:]))
+    result.update(ocv=v_rest, rest_current=c_rest, current=c_pulse)
+    step = abs(c_pulse - c_rest)
+    if not step:
+        return result
+
+    stepped = np.flatnonzero(np.abs(cp - c_rest) >= 0.9 * step)
+    if len(stepped):
+        i = stepped[0]
+        result["r0"] = _resistance(vp[i] - v_rest, cp[i] - c_rest)
+    result["r_end"] = _resistance(vp[-1] - v_rest, cp[-1] - c_rest)
+    if result["r0"] is not None and result["r_end"] is not None:
+        result["r_polarization"] = result["r_end"] - result["r0"]
+    for x in times:
+        if x <= tp[-1] - start:
+            vx = np.interp(start + x, tp, vp)
+            cx = np.interp(start + x, tp, cp)
+            result["r"][f"{x:g}"] = _resistance(vx - v_rest, cx - c_rest)
+
+    released = np.flatnonzero(after & (np.abs(c - c_rest) <= 0.1 * step))
+    if len(released):
+        i = released[0]
+        result["r_release"] = _resistance(v[i] - vp[-1], c[i] - cp[-1])
+    return result
+
+
+def format_pulse(name: str, result: dict) -> str:
+    """Return a one line summary of :func:`pulse_resistance`."""
+    def ohm(value):
+        return "n/a" if value is None else f"{value * 1000:.2f} mOhm"
+
+    interval = result["sample_interval"]
+    rate = "" if not interval else f", {interval * 1000:.1f} ms/sample"
+    return (
+        f"{name}: R0 {ohm(result['r0'])}, R_end {ohm(result['r_end'])}, "
+        f"polarization {ohm(result['r_polarization'])}{rate}"
+    )
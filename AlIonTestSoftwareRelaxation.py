@@ -0,0 +1,89 @@
+"""Voltage relaxation model used to end OCV rests early.
+
+After the current is switched off the cell voltage approaches its open
+circuit value roughly as ``ocv + amplitude * exp(-t / tau)``. Fitting this
+model to the voltage sampled during the rest extrapolates the OCV, so the
+rest can stop once the measured voltage is within a tolerance of it instead
+of waiting a fixed time.
+"""
+
+import math
+
+
+def fit_relaxation(t, v, taus=None) -> dict | None:
+    """Fit ``v = ocv + amplitude * exp(-t / tau)`` by least squares.
+
+    ``t`` holds the seconds since the start of the rest. For every time
+    constant in ``taus`` (by default 128 values from one second to ten times
+    the observed rest) the model is linear in ``ocv`` and ``amplitude`` and
+    solved in closed form; the time constant with the smallest residual
+    wins. Returns ``ocv``, its standard error ``ocv_std``, ``amplitude``,
+    ``tau`` and the residual ``rms``, or ``None`` with fewer than four
+    samples.
+    """
+    import numpy as np
+
+    t = np.asarray(t, dtype=np.float64)
+    v = np.asarray(v, dtype=np.float64)
+    n = len(t)
+    if n < 4:
+        return None
+    if taus is None:
+        taus = np.logspace(0.0, math.log10(max(10.0 * t[-1], 10.0)), 128)
+    taus = np.asarray(taus, dtype=np.float64)
+    e = np.exp(-t[None, :] / taus[:, None])
+    se = e.sum(axis=1)
+    see = (e * e).sum(axis=1)
+    sv = v.sum()
+    sev = e @ v
+    det = n * see - se * se
+    valid = det > 1e-12 * n * n
+    if not valid.any():
+        return None
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ocv = (see * sv - se * sev) / det
+        amplitude = (n * sev - se * sv) / det
+    residual = v[None, :] - ocv[:, None] - amplitude[:, None] * e
+    sse = np.where(valid, (residual * residual).sum(axis=1), np.inf)
+    best = int(np.argmin(sse))
+    sigma2 = sse[best] / (n - 2)
+    return {
+        "ocv": float(ocv[best]),
+        "ocv_std": float(math.sqrt(sigma2 * see[best] / det[best])),
+        "amplitude": float(amplitude[best]),
+        "tau": float(taus[best]),
+        "rms": float(math.sqrt(sse[best] / n)),
+    }
+
+
+class RelaxationMonitor:
+    """Collect rest samples and decide when the OCV has settled.
+
+    The rest has converged when the last measured voltage is within
+    ``tolerance`` of the fitted OCV and twice the standard error of that
+    OCV (about 95 % confidence) is within ``tolerance`` as well. A
+    ``tolerance`` of zero never converges.
+    """
+
+    def __init__(self, tolerance: float = 0.001, min_samples: int = 10) -> None:
+        self.tolerance = tolerance
+        self.min_samples = max(min_samples, 4)
+        self.t = []
+        self.v = []
+        self.fit = None
+
+    def add(self, t: float, v: float) -> None:
+        """Record a sample and refit the model."""
+        self.t.append(t)
+        self.v.append(v)
+        if len(self.t) >= self.min_samples:
+            self.fit = fit_relaxation(self.t, self.v)
+
+    @property
+    def converged(self) -> bool:
+        if self.fit is None or self.tolerance <= 0:
+            return False
+        return (
+            abs(self.v[-1] - self.fit["ocv"]) <= self.tolerance
+            and 2.0 * self.fit["ocv_std"] <= self.tolerance
+        )
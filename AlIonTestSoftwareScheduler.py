@@ -0,0 +1,78 @@
+"""Fixed rate sampling scheduler based on the monotonic clock."""
+
+import time
+
+
+class TestAborted(Exception):
+    """Raised by waits once the test's stop event is set."""
+
+
+def wait_or_abort(stop_event, seconds: float) -> None:
+    """Sleep ``seconds`` but raise :class:`TestAborted` as soon as
+    ``stop_event`` is set; ``stop_event`` may be ``None``."""
+    if stop_event is None:
+        time.sleep(max(0.0, seconds))
+    elif stop_event.wait(max(0.0, seconds)):
+        raise TestAborted()
+
+
+class SampleScheduler:
+    """Wake up at absolute deadlines spaced ``interval`` seconds apart.
+
+    Deadlines are derived from the start time instead of the end of the
+    previous sleep, so the time spent querying instruments does not stretch
+    the sample period. ``overrun`` selects what happens when a tick misses
+    its deadline:
+
+    ``"skip"``
+        Drop the missed ticks and continue at the next future deadline.
+    ``"catchup"``
+        Run the missed ticks back to back until the schedule is met again.
+
+    After every :meth:`wait` the monotonic time of the sample is stored in
+    :attr:`timestamp_ns`, the seconds since the previous sample in
+    :attr:`dt` and the seconds since :meth:`start` in :attr:`elapsed`.
+    These are the values to integrate over, not the nominal interval.
+
+    With a ``stop_event`` (a :class:`threading.Event`) the sleep wakes as
+    soon as the event is set and :meth:`wait` raises :class:`TestAborted`.
+    """
+
+    def __init__(self, interval: float, overrun: str = "skip", stop_event=None) -> None:
+        if overrun not in ("skip", "catchup"):
+            raise ValueError(f"Unknown overrun policy: {overrun}")
+        self.interval_ns = max(int(round(interval * 1e9)), 1)
+        self.overrun = overrun
+        self.stop_event = stop_event
+        self.start()
+
+    def start(self) -> None:
+        """Restart the schedule with the first deadline one interval from now."""
+        self.start_ns = time.monotonic_ns()
+        self.timestamp_ns = self.start_ns
+        self.dt = 0.0
+        self.ticks = 0
+        self.missed = 0
+        self._deadline = self.start_ns + self.interval_ns
+
+    @property
+    def elapsed(self) -> float:
+        """Seconds between :meth:`start` and the latest sample."""
+        return (self.timestamp_ns - self.start_ns) / 1e9
+
+    def wait(self) -> None:
+        """Sleep until the next deadline and record the sample time."""
+        now = time.monotonic_ns()
+        if now < self._deadline:
+            wait_or_abort(self.stop_event, (self._deadline - now) / 1e9)
+        elif self.stop_event is not None and self.stop_event.is_set():
+            raise TestAborted()
+        elif self.overrun == "skip" and now - self._deadline >= self.interval_ns:
+            late = (now - self._deadline) // self.interval_ns
+            self.missed += late
+            self._deadline += late * self.interval_ns
+        previous = self.timestamp_ns
+        self.timestamp_ns = time.monotonic_ns()
+        self.dt = (self.timestamp_ns - previous) / 1e9
+        self._deadline += self.interval_ns
+        self.ticks += 1
@@ -0,0 +1,100 @@
+"""Running statistics of measurement channels, updated in O(1) per sample."""
+
+from collections import deque
+import math
+
+
+class RunningStats:
+    """Count, mean, variance, minimum and maximum of a stream of values.
+
+    The mean and variance use Welford's update, so they stay accurate over
+    long runs without keeping the samples. With ``window`` set the mean of
+    the last ``window`` values is tracked as well, e.g. for live display.
+    """
+
+    def __init__(self, window: int = 0) -> None:
+        self.count = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+        self.last = None
+        self.window = window
+        self._recent = deque(maxlen=window) if window else None
+        self._recentSum = 0.0
+
+    def add(self, value: float) -> None:
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (value - self.mean)
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+        self.last = value
+        if self._recent is not None:
+            if len(self._recent) == self.window:
+                self._recentSum -= self._recent[0]
+            self._recent.append(value)
+            self._recentSum += value
+
+    @property
+    def variance(self) -> float:
+        """Sample variance, ``0.0`` for fewer than two values."""
+        return self._m2 / (self.count - 1) if self.count > 1 else 0.0
+
+    @property
+    def std(self) -> float:
+        return math.sqrt(self.variance)
+
+    @property
+    def windowMean(self) -> float | None:
+        """Mean of the last ``window`` values, ``None`` without a window."""
+        if not self._recent:
+            return None
+        return self._recentSum / len(self._recent)
+
+    def summary(self) -> dict:
+        """Return the statistics as a JSON serialisable dictionary."""
+        if not self.count:
+            return {"count": 0}
+        return {
+            "count": self.count,
+            "mean": self.mean,
+            "std": self.std,
+            "min": self.min,
+            "max": self.max,
+            "last": self.last,
+        }
+
+    def state(self) -> dict:
+        """Return the full state, see :meth:`fromState`."""
+        state = {
+            "count": self.count,
+            "mean": self.mean,
+            "m2": self._m2,
+            "min": self.min if self.count else None,
+            "max": self.max if self.count else None,
+            "last": self.last,
+            "window": self.window,
+        }
+        if self._recent is not None:
+            state["recent"] = list(self._recent)
+        return state
+
+    @classmethod
+    def fromState(cls, state: dict) -> "RunningStats":
+        """Restore statistics saved with :meth:`state`, e.g. from a journal."""
+        stats = cls(state.get("window", 0))
+        stats.count = state["count"]
+        stats.mean = state["mean"]
+        stats._m2 = state["m2"]
+        if stats.count:
+            stats.min = state["min"]
+            stats.max = state["max"]
+        stats.last = state.get("last")
+        for value in state.get("recent", ()):
+            stats._recent.append(value)
+            stats._recentSum += value
+        return stats
@@ -4,7 +4,8 @@ from dataclasses import dataclass
 import argparse
 import json
 from pathlib import Path
-from AlIonBatteryTestSoftware import TestController
+# AlIonBatteryTestSoftware pulls in the driver and data modules, it is
+# imported where a test controller is created so --help stays fast.
 
 # Charge/discharge voltage and current limits
 CHARGE_VOLT_START: float = 4.1    # V
@@ -72,8 +73,15 @@ def load_config(config_path: str, profile: str) -> dict:
 
 
 class TestTypes:
-    def __init__(self, multimeter_mode: str | None = None, debug: bool = False):
-        self.testController = TestController(multimeter_mode, debug)
+    def __init__(
+        self,
+        multimeter_mode: str | None = None,
+        debug: bool = False,
+        use_mock: bool = False,
+    ):
+        from AlIonBatteryTestSoftware import TestController
+
+        self.testController = TestController(multimeter_mode, debug, use_mock)
         self.upsThread = None
 
     def runUPSTest(self, settings: UPSSettings):
@@ -112,6 +120,10 @@ class TestTypes:
         if self.upsThread is not None:
             self.upsThread.join()
 
+    def close(self):
+        """Release the instrument sessions held by the test controller."""
+        self.testController.close()
+
 
 def main():
     parser = argparse.ArgumentParser(description="Run UPS test")
@@ -156,16 +168,34 @@ def main():
                         help="run OCV curve test")
     parser.add_argument("--internal-resistance-test", action="store_true",
                         help="run internal resistance test")
+    parser.add_argument("--hppc-test", action="store_true",
+                        help="run HPPC pulse test at several SOC points")
     parser.add_argument("--rates", default="1.0,0.5,0.2",
                         help="comma separated discharge rates in A")
+    parser.add_argument("--stepped", action="store_true",
+                        help="rate test: charge once and step down from the highest "
+                             "rate, each continuing from the previous cut-off")
+    parser.add_argument("--step-rest", type=float, default=60.0,
+                        help="rest in seconds between the rates of a stepped rate test")
     parser.add_argument("--step-current", type=float, default=1.0,
-                        help="step current for OCV curve")
+                        help="step current for OCV curve and HPPC SOC steps")
     parser.add_argument("--steps", type=int, default=10,
                         help="number of steps for OCV curve")
+    parser.add_argument("--ocv-tolerance", type=float, default=0.001,
+                        help="end an OCV rest once the voltage is within this many "
+                             "volts of the fitted OCV (0 rests the full time)")
     parser.add_argument("--pulse-current", type=float, default=1.0,
                         help="pulse current for resistance test")
     parser.add_argument("--pulse-duration", type=float, default=1.0,
                         help="pulse duration in seconds")
+    parser.add_argument("--relax-duration", type=float,
+                        help="seconds captured after each pulse (default: pulse duration)")
+    parser.add_argument("--charge-pulse-current", type=float, default=0.0,
+                        help="charge pulse current for HPPC (0 skips charge pulses)")
+    parser.add_argument("--soc-points", type=int, default=10,
+                        help="number of SOC points for HPPC")
+    parser.add_argument("--step-time", type=float, default=360.0,
+                        help="seconds discharged at --step-current between HPPC SOC points")
     parser.add_argument(
         "--multimeter-mode",
         choices=["voltage", "tcouple"],
@@ -182,9 +212,32 @@ def main():
         action="store_true",
         help="print detailed progress information",
     )
+    parser.add_argument(
+        "--mock",
+        action="store_true",
+        help="use the mock drivers without probing for hardware",
+    )
+    parser.add_argument(
+        "--resume",
+        nargs="?",
+        const="latest",
+        metavar="JOURNAL",
+        help="continue an interrupted capacity, efficiency or rate test from "
+             "its journal (default: the most recent one in Data/journal)",
+    )
+    parser.add_argument(
+        "--ica",
+        action="store_true",
+        help="also write dQ/dV and dV/dQ of every result to a .ica.csv file",
+    )
 
     args = parser.parse_args()
 
+    from AlIonBatteryTestSoftware import TestController
+    from AlIonTestSoftwareDataManagement import DataStorage
+
+    DataStorage.icaExport = args.ica
+
     if args.multimeter_mode is None and args.use_multimeter:
         args.multimeter_mode = "tcouple"
 
@@ -252,8 +305,12 @@ def main():
     if finish_current is None:
         finish_current = capacity_defaults.get("finish_current", 1.5)
 
-    if args.actual_capacity_test:
-        tc = TestController(multimeter_mode, args.debug)
+    tc = None
+    if args.resume:
+        tc = TestController(multimeter_mode, args.debug, args.mock)
+        tc.resume(None if args.resume == "latest" else args.resume)
+    elif args.actual_capacity_test:
+        tc = TestController(multimeter_mode, args.debug, args.mock)
         tc.actual_capacity_test(
             cap_charge_current,
             cap_discharge_current,
@@ -264,7 +321,7 @@ def main():
             finish_current,
         )
     elif args.efficiency_test:
-        tc = TestController(multimeter_mode, args.debug)
+        tc = TestController(multimeter_mode, args.debug, args.mock)
         tc.efficiency_test(
             charge_current_max,
             dcharge_current_max,
@@ -274,28 +331,32 @@ def main():
         )
     elif args.rate_characteristic_test:
         rates = [float(r) for r in args.rates.split(',') if r]
-        tc = TestController(multimeter_mode, args.debug)
+        tc = TestController(multimeter_mode, args.debug, args.mock)
         tc.rate_characteristic_test(
             rates,
             charge_current_max,
             charge_volt_end,
             dcharge_volt_min,
             temperature,
+            stepped=args.stepped,
+            step_rest=args.step_rest,
         )
     elif args.ocv_curve_test:
-        tc = TestController(multimeter_mode, args.debug)
+        tc = TestController(multimeter_mode, args.debug, args.mock)
         tc.ocv_curve_test(
             args.step_current,
             args.steps,
             1800.0,
             temperature,
+            args.ocv_tolerance,
         )
     elif args.internal_resistance_test:
-        tc = TestController(multimeter_mode, args.debug)
+        tc = TestController(multimeter_mode, args.debug, args.mock)
         tc.internal_resistance_test(
             args.pulse_current,
             args.pulse_duration,
             temperature,
+            args.relax_duration,
         )
         capacity = tc.actual_capacity_test(
             cap_charge_current,
@@ -307,6 +368,21 @@ def main():
             finish_current,
         )
         print(f"Measured capacity: {capacity:.3f} Ah")
+    elif args.hppc_test:
+        tc = TestController(multimeter_mode, args.debug, args.mock)
+        tc.hppc_test(
+            args.pulse_current,
+            args.pulse_duration,
+            args.pulse_duration * 4 if args.relax_duration is None else args.relax_duration,
+            args.charge_pulse_current,
+            args.soc_points,
+            args.step_current,
+            args.step_time,
+            3600.0,
+            charge_volt_end,
+            dcharge_volt_min,
+            temperature,
+        )
 
     else:
         kwargs = {}
@@ -316,7 +392,7 @@ def main():
                 kwargs[field] = val
         settings = UPSSettings(**kwargs)
 
-        TObj = TestTypes(multimeter_mode, args.debug)
+        TObj = TestTypes(multimeter_mode, args.debug, args.mock)
         thread = TObj.runUPSTest(settings)
         try:
             while thread.is_alive():
@@ -324,6 +400,11 @@ def main():
         except KeyboardInterrupt:
             print("Keyboard interrupt received, stopping test")
             TObj.stop()
+        TObj.close()
+
+    # Sessions stay in the shared pool for any further test in this process
+    if tc is not None:
+        tc.close()
 
 
 if __name__ == "__main__":
@@ -333,3 +414,4 @@ if __name__ == "__main__":
 # Example usage:
 # python MAIN.py --actual-capacity-test --capacity-charge-current 4.6 --capacity-discharge-current 46 --multimeter-mode tcouple
 # python MAIN.py --actual-capacity-test --capacity-config tests/capacity_defaults.json -d
+# python MAIN.py --resume
@@ -0,0 +1,91 @@
+"""Measure how quickly every test type stops after TestController.abort().
+
+Run from the repository root::
+
+    python benchmarks/bench_abort_latency.py [--budget 0.5] [--delay 1.0]
+
+Each test is started on the mock drivers in a background thread with
+parameters that keep it running and aborted after ``--delay`` seconds. The
+script reports the time until the test thread had switched the outputs off
+(``TestController.abortLatency``) and until the test returned after saving
+its data, and exits with status 1 when the outputs took longer than
+``--budget`` seconds for any test. Results are written to a temporary
+folder.
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+# Test method and arguments that keep each test busy until it is aborted
+SCENARIOS = {
+    "ups": ("NEWupsTest", ("ups", 20, 10, 10, 100, 4, 4.1, 5, -1.0, 1, .1, .1, 0, 3600, 3600, 1)),
+    "efficiency": ("efficiency_test", (1.0, 1.0, 1000.0, -1.0)),
+    "rate": ("rate_characteristic_test", ([1.0], 1.0, 1000.0, -1.0)),
+    "rate_stepped": ("rate_characteristic_test", ([2.0, 1.0], 1.0, 1000.0, -1.0, 20.0, None, True)),
+    "capacity": ("actual_capacity_test", (1.0, 1.0, 3600.0, 1000.0, -1.0, 20.0, -1.0)),
+    "ocv": ("ocv_curve_test", (1.0, 10, 1800.0, 20.0, 0.0)),
+    "internal_resistance": ("internal_resistance_test", (1.0, 600.0)),
+    "hppc": ("hppc_test", (1.0, 600.0)),
+}
+
+
+def measure(name: str, delay: float) -> tuple[float, float | None]:
+    """Return the seconds from abort() until the test returned and the
+    controller's own abort-to-outputs-off measurement."""
+    from AlIonBatteryTestSoftware import TestController
+
+    method, args = SCENARIOS[name]
+    controller = TestController(None, False, True)
+    thread = threading.Thread(target=getattr(controller, method), args=args)
+    thread.start()
+    time.sleep(delay)
+    start = time.monotonic()
+    controller.abort()
+    thread.join()
+    stopped = time.monotonic() - start
+    controller.close()
+    return stopped, controller.abortLatency
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--budget", type=float, default=0.5,
+                        help="maximum seconds from abort() until the outputs are off")
+    parser.add_argument("--delay", type=float, default=1.0,
+                        help="seconds each test runs before it is aborted")
+    parser.add_argument("tests", nargs="*",
+                        help=f"tests to measure: {', '.join(SCENARIOS)} (default: all)")
+    args = parser.parse_args()
+    unknown = set(args.tests) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown tests: {', '.join(sorted(unknown))}")
+
+    failed = False
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix="abort_latency_") as directory:
+        os.chdir(directory)
+        try:
+            for name in args.tests or SCENARIOS:
+                stopped, latency = measure(name, args.delay)
+                ok = latency is not None and latency <= args.budget
+                failed |= not ok
+                outputs = "n/a" if latency is None else f"{latency * 1000:.1f} ms"
+                print(
+                    f"{name:<20} outputs off {outputs:>9}, returned after "
+                    f"{stopped * 1000:7.1f} ms {'ok' if ok else 'FAIL'}"
+                )
+        finally:
+            os.chdir(cwd)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
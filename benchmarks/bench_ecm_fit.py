@@ -0,0 +1,79 @@
+"""Compare batched ECM fitting with fitting one pulse at a time.
+
+Run from the repository root::
+
+    python benchmarks/bench_ecm_fit.py [--pulses 100] [--rc 2]
+
+Synthetic HPPC pulses (10 s at 2 A, 40 s relaxation, 2 ms samples, 0.1 mV
+noise) with known parameters are fitted by AlIonTestSoftwareECM.fit_pulses
+in one batch, one by one and warm started from the true time constants.
+The script prints the time of each variant and the largest relative error
+of R0 and R1 in the batch fit.
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+
+def synthetic(count: int, rng):
+    """Return prepared pulses and their true ``(r0, r1, tau1, r2, tau2)``."""
+    import numpy as np
+
+    from AlIonTestSoftwareECM import _basis, pulse_data
+
+    truths, pulses = [], []
+    for _ in range(count):
+        r0, r1, r2 = rng.uniform(0.02, 0.1), rng.uniform(0.01, 0.03), rng.uniform(0.01, 0.04)
+        tau1, tau2 = rng.uniform(0.2, 2.0), rng.uniform(5.0, 30.0)
+        t = np.arange(-0.5, 50.0, 0.002)
+        c = np.where((t >= 0) & (t < 10.0), 2.0, 0.0)
+        v = 3.8 - r0 * c - 2.0 * (r1 * _basis(t, 10.0, tau1) + r2 * _basis(t, 10.0, tau2))
+        v += rng.normal(0.0, 1e-4, len(t))
+        truths.append((r0, r1, tau1, r2, tau2))
+        pulses.append(pulse_data(t, v, c))
+    return truths, pulses
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pulses", type=int, default=100)
+    parser.add_argument("--rc", type=int, default=2, help="number of RC elements")
+    args = parser.parse_args()
+
+    import numpy as np
+
+    from AlIonTestSoftwareECM import fit_pulses
+
+    truths, pulses = synthetic(args.pulses, np.random.default_rng(1))
+
+    start = time.perf_counter()
+    fits = fit_pulses(pulses, args.rc)
+    batched = time.perf_counter() - start
+    start = time.perf_counter()
+    for pulse in pulses:
+        fit_pulses([pulse], args.rc)
+    single = time.perf_counter() - start
+    start = time.perf_counter()
+    initial = [truth[2::2][: args.rc] for truth in truths] if args.rc == 2 else None
+    fit_pulses(pulses, args.rc, initial)
+    warm = time.perf_counter() - start
+
+    error = max(
+        max(abs(fit["r0"] / truth[0] - 1), abs(fit["r1"] / truth[1] - 1))
+        for fit, truth in zip(fits, truths)
+    )
+    print(f"batched     {batched * 1000:8.1f} ms for {args.pulses} pulses")
+    print(f"one by one  {single * 1000:8.1f} ms ({single / batched:.1f}x)")
+    if initial is not None:
+        print(f"warm start  {warm * 1000:8.1f} ms")
+    print(f"largest relative R0/R1 error {error * 100:.2f} %")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,80 @@
+"""Check that CLI startup stays within its import-time budget.
+
+Run from the repository root::
+
+    python benchmarks/bench_import_time.py [--budget 0.25] [--runs 5]
+
+The script times ``python MAIN.py --help`` in a fresh interpreter and checks
+that importing the CLI and the test controller does not load any of the
+heavy optional dependencies. It exits with status 1 when either check fails.
+"""
+
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# Modules that must only be imported on the code paths that need them
+HEAVY_MODULES = ("pyvisa", "pandas", "openpyxl", "tkinter", "numpy")
+
+
+def time_help(runs: int) -> float:
+    """Return the median wall time of ``python MAIN.py --help``."""
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(
+            [sys.executable, "MAIN.py", "--help"],
+            cwd=ROOT,
+            check=True,
+            stdout=subprocess.DEVNULL,
+        )
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples)
+
+
+def loaded_heavy_modules() -> list[str]:
+    """Return the heavy modules loaded by importing the CLI and controller."""
+    code = (
+        "import sys, MAIN, AlIonBatteryTestSoftware; "
+        f"print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=ROOT,
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+    return [m for m in result.stdout.strip().split(",") if m]
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--budget", type=float, default=0.25,
+                        help="maximum median time for MAIN.py --help in seconds")
+    parser.add_argument("--runs", type=int, default=5,
+                        help="number of timed runs")
+    args = parser.parse_args()
+
+    failed = False
+    median = time_help(args.runs)
+    status = "ok" if median <= args.budget else "FAIL"
+    print(f"MAIN.py --help: {median * 1000:.1f} ms (budget {args.budget * 1000:.0f} ms) {status}")
+    failed |= median > args.budget
+
+    heavy = loaded_heavy_modules()
+    if heavy:
+        print(f"Eagerly imported: {', '.join(heavy)} FAIL")
+        failed = True
+    else:
+        print("No heavy modules imported at startup ok")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -21,6 +21,7 @@ POWER_SUPPLY_COMMANDS = {
     "getVoltage": "FETCH:VOLT?",
     "getCurrent": "FETCH:CURR?",
     "getPower": "FETCH:POW?",
+    "fetch_all": "FETCH:VOLT?;CURR?;POW?",
     "startOutput": "CONF:OUTP ON",
     "stopOutput": "CONF:OUTP OFF",
     "chargeCC": [
@@ -58,6 +59,7 @@ ELECTRONIC_LOAD_COMMANDS = {
     "getVoltage": "FETCH:VOLT?",
     "getCurrent": "FETCH:CURR?",
     "getPower": "FETCH:POW?",
+    "fetch_all": "FETCH:VOLT?;CURR?;POW?",
     "checkDeviceConnection": "*IDN?",
     "setMaxCurrent": "VOLT:STAT:ILIM {amps}",
     "dischargeCV": [
@@ -100,4 +102,51 @@ INSTRUMENT_RESOURCES = {
     "multimeter": "USB0::0x1698::0x083F::TW00014586::INSTR",
 }
 
+
+# Output switches, including their subcommands such as LOAD:STAT, are never
+# cached, so switching an output off always reaches the instrument even if
+# its state changed behind the driver's back
+UNCACHED_HEADERS = ("CONF:OUTP", "LOAD")
+
+# Setpoints the instrument may change when another header is written: a
+# range change with MODE can leave the load at different static levels
+DEPENDENT_SETPOINTS = {"MODE": ("CURR:STAT:", "VOLT:STAT:", "POW:STAT:")}
+
+
+def format_commands(table: dict, name: str, **params) -> list[str]:
+    """Return the command(s) stored under ``name`` with ``params`` filled in."""
+    entry = table[name]
+    commands = entry if isinstance(entry, list) else [entry]
+    return [command.format(**params) for command in commands]
+
+
+def join_commands(commands: list[str]) -> str:
+    """Join several commands into a single SCPI program message.
+
+    Every command after the first is prefixed with ``:`` so the instrument
+    parses it from the root of the command tree instead of relative to the
+    previous header. Common commands such as ``*OPC?`` are left untouched.
+    """
+    parts = commands[:1]
+    for command in commands[1:]:
+        parts.append(command if command.startswith((":", "*")) else ":" + command)
+    return ";".join(parts)
+
+
+def setpoint_key(command: str) -> tuple[str, str] | None:
+    """Return ``(header, value)`` for a command that sets instrument state.
+
+    Queries, common commands such as ``*RST`` and the output switches in
+    ``UNCACHED_HEADERS`` return ``None`` because they must always reach the
+    instrument.
+    """
+    command = command.strip()
+    if "?" in command or command.startswith("*"):
+        return None
+    header, _, value = command.partition(" ")
+    header = header.lstrip(":").upper()
+    if any(header == h or header.startswith(h + ":") for h in UNCACHED_HEADERS):
+        return None
+    return header, value.strip()
+
 # End of scpi_commands.py